@@ -0,0 +1,71 @@
+"""
+Estado do radar (/provas/scan-anchors) entre frames de uma mesma sessão de câmera.
+
+O cliente manda um session_id por abertura do scanner. Depois que as 4 âncoras são
+encontradas, o estado devolvido pelo OMREngine.detect_anchors_only (posições em px,
+áreas, tamanho do frame e QR já lido) fica guardado aqui e volta para o engine no
+frame seguinte, que então só rastreia as âncoras em janelas pequenas.
+
+O estado mora no processo web e viaja como argumento do job, então funciona igual
+nos dois modos do omr_executor (thread e process).
+
+Configuração (variáveis de ambiente):
+  - OMR_TRACKER_TTL_S         segundos sem frames até a sessão expirar (padrão 30)
+  - OMR_TRACKER_MAX_SESSIONS  sessões guardadas antes de descartar as mais antigas (padrão 500)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class AnchorTracker:
+    def __init__(self, ttl_s: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.ttl_s = float(ttl_s or os.getenv("OMR_TRACKER_TTL_S", 30))
+        self.max_sessions = max(1, int(max_sessions or os.getenv("OMR_TRACKER_MAX_SESSIONS", 500)))
+        self._sessions: "OrderedDict[Hashable, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"locked": 0, "detected": 0, "lost": 0}
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Estado do último frame da sessão, ou None se não existir ou tiver expirado."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl_s:
+                del self._sessions[key]
+                return None
+            return entry[1]
+
+    def count(self, mode: Optional[str]):
+        """Contabiliza o resultado de um frame ("locked", "detected" ou "lost")."""
+        if mode in self.stats:
+            with self._lock:
+                self.stats[mode] += 1
+
+    def update(self, key: Hashable, result: Dict[str, Any]):
+        """Guarda o estado devolvido pelo engine (campo "track"); None encerra o rastreamento."""
+        state = result.get("track")
+        self.count(result.get("tracking"))
+        now = time.monotonic()
+        with self._lock:
+            if state is None:
+                self._sessions.pop(key, None)
+                return
+            self._sessions[key] = (now, state)
+            self._sessions.move_to_end(key)
+            self._evict(now)
+
+    def _evict(self, now: float):
+        # Mais antigo primeiro: expirados e excedentes saem pela frente
+        while self._sessions:
+            key, (seen, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - seen <= self.ttl_s:
+                break
+            del self._sessions[key]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
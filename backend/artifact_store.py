@@ -0,0 +1,144 @@
+"""
+Armazenamento local dos artefatos do OMR (retificada, original, mapa de auditoria).
+
+Cada artefato é gravado uma única vez, com nome derivado do próprio conteúdo
+(BLAKE2b-128 com chave secreta). Como o nome muda sempre que o conteúdo muda,
+o endpoint que serve os arquivos pode mandar cache "immutable", e a chave secreta
+impede adivinhar o nome de um artefato a partir da imagem (as URLs vão em <img src>
+sem header de autenticação).
+
+Configuração (variáveis de ambiente):
+  - OMR_ARTIFACT_DIR        diretório (padrão backend/artifacts)
+  - OMR_ARTIFACT_MAX_FILES  arquivos mantidos antes de apagar os mais antigos (padrão 2000)
+  - OMR_ARTIFACT_SECRET     chave do hash (padrão JWT_SECRET_KEY). Obrigatória: todos os
+                            processos (workers web e OMR_EXECUTION_MODE=process) precisam
+                            da mesma chave para que o nome gravado por um bata com a URL
+                            verificada por outro; a API não sobe sem ela (main.py)
+
+A retenção segue o mesmo esquema do omr_audit: o diretório é listado uma vez por
+processo e depois cada arquivo novo entra numa fila. Com vários processos
+(OMR_EXECUTION_MODE=process) o limite é aproximado.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Optional
+
+logger = logging.getLogger("lerprova-api")
+
+ARTIFACT_DIR = Path(os.getenv("OMR_ARTIFACT_DIR", Path(__file__).parent / "artifacts"))
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".json": "application/json",
+}
+
+# Nome público de um artefato: 32 hex + extensão conhecida
+_NAME_RE = re.compile(r"^([0-9a-f]{32})(\.[a-z]+)$")
+
+
+class ArtifactStore:
+    def __init__(self, directory: Path = ARTIFACT_DIR, max_files: Optional[int] = None, secret: Optional[str] = None):
+        self.directory = Path(directory)
+        self.max_files = int(max_files or os.getenv("OMR_ARTIFACT_MAX_FILES", 2000))
+        secret = secret or os.getenv("OMR_ARTIFACT_SECRET") or os.getenv("JWT_SECRET_KEY")
+        self._key = hashlib.sha256(secret.encode("utf-8")).digest() if secret else None
+        self._files: Optional[Deque[Path]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return self._key is not None
+
+    def _require_key(self) -> bytes:
+        # Sem chave compartilhada cada processo geraria nomes diferentes para o mesmo
+        # conteúdo e as URLs dariam 404 conforme o processo que atendesse o pedido
+        if self._key is None:
+            raise RuntimeError("Defina OMR_ARTIFACT_SECRET (ou JWT_SECRET_KEY) para gravar artefatos do OMR")
+        return self._key
+
+    def key_for(self, data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16, key=self._require_key()).hexdigest()
+
+    def put(self, data: bytes, ext: str = ".jpg") -> str:
+        """Grava `data` (se ainda não existir) e retorna o nome do artefato."""
+        if ext not in MEDIA_TYPES:
+            raise ValueError(f"Extensão de artefato não suportada: {ext}")
+        name = f"{self.key_for(data)}{ext}"
+        self._write(name, data)
+        return name
+
+    def put_json(self, obj: Any) -> str:
+        data = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        return self.put(data, ".json")
+
+    def derived_name(self, source_name: str, ext: str = ".jpg") -> str:
+        """Nome de um artefato derivado de outro (ex: mapa renderizado a partir do manifesto)."""
+        key = hashlib.blake2b(source_name.encode("utf-8"), digest_size=16, key=self._require_key()).hexdigest()
+        return f"{key}{ext}"
+
+    def put_derived(self, source_name: str, data: bytes, ext: str = ".jpg") -> str:
+        """
+        Grava um artefato derivado. O nome vem da origem (não do conteúdo), então
+        um segundo pedido encontra o arquivo sem precisar renderizar de novo.
+        """
+        name = self.derived_name(source_name, ext)
+        self._write(name, data)
+        return name
+
+    def path(self, name: str) -> Optional[Path]:
+        """Caminho do artefato, ou None se o nome for inválido ou o arquivo não existir."""
+        match = _NAME_RE.match(name or "")
+        if not match or match.group(2) not in MEDIA_TYPES:
+            return None
+        path = self.directory / name[:2] / name
+        return path if path.is_file() else None
+
+    def read_json(self, name: str) -> Optional[Any]:
+        path = self.path(name)
+        if path is None:
+            return None
+        return json.loads(path.read_bytes())
+
+    @staticmethod
+    def media_type(name: str) -> str:
+        return MEDIA_TYPES.get(Path(name).suffix, "application/octet-stream")
+
+    def _write(self, name: str, data: bytes):
+        path = self.directory / name[:2] / name
+        if path.exists():
+            return  # Mesmo conteúdo já gravado
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Grava num temporário e renomeia: leitores nunca veem arquivo pela metade
+        tmp = path.with_name(f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._files is None:
+                self._files = self._scan_existing()
+            else:
+                self._files.append(path)
+            self._enforce_retention(self._files)
+
+    def _scan_existing(self) -> Deque[Path]:
+        """Listagem única do diretório, do arquivo mais antigo para o mais novo."""
+        files = [f for f in self.directory.glob("*/*") if f.is_file() and not f.name.startswith(".")]
+        files.sort(key=lambda f: f.stat().st_mtime)
+        return deque(files)
+
+    def _enforce_retention(self, files: Deque[Path]):
+        while len(files) > self.max_files:
+            old = files.popleft()
+            try:
+                old.unlink()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Erro ao remover artefato antigo {old}: {e}")
@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+from db_pool import instrument, pool_config
 
 # Em produção (Render), DATABASE_URL será definido (ex: postgresql://...)
 # Em desenvolvimento local, usa lerprova_server.db (SQLite)
@@ -16,12 +17,15 @@ if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
 # O check_same_thread=False é apenas para SQLite
+# Pool configurado por ambiente e com métricas de checkout (ver db_pool.py)
 try:
     if DATABASE_URL and DATABASE_URL.startswith("sqlite"):
-        engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+        engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False},
+                               **({} if ":memory:" in DATABASE_URL else pool_config()))
     else:
         # Tentar criar a engine
-        engine = create_engine(DATABASE_URL)
+        engine = create_engine(DATABASE_URL, **pool_config())
+    instrument(engine)
 except Exception as e:
     print(f"ERRO CRÍTICO AO CRIAR ENGINE SQLALCHEMY: {e}")
     # Fallback para SQLite se falhar em produção (melhor avisar que tentar rodar com DB errado)
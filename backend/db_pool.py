@@ -0,0 +1,133 @@
+"""
+Pool de conexões do banco: configuração por ambiente e métricas de checkout.
+
+Cada processo web (uvicorn --workers / WEB_CONCURRENCY) tem o seu pool, então o padrão
+divide DB_MAX_CONNECTIONS (as conexões que o Postgres aceita para o app) entre os
+processos: metade fixa no pool, o resto como overflow. pre_ping testa a conexão antes de
+entregar (o Postgres do Render derruba conexões ociosas) e recycle troca conexões antigas
+antes que o servidor as feche.
+
+O tempo de espera de cada checkout vai para um histograma (exposto em /admin/db-pool);
+esperas acima de DB_POOL_SLOW_CHECKOUT_MS geram um warning no log, sinal de pool esgotado.
+
+Configuração (variáveis de ambiente):
+  - DB_MAX_CONNECTIONS         conexões do app somando todos os processos (padrão 40)
+  - WEB_CONCURRENCY            processos web (padrão 1)
+  - DB_POOL_SIZE               conexões mantidas abertas por processo (padrão metade da cota)
+  - DB_MAX_OVERFLOW            conexões extras em pico por processo (padrão o resto da cota)
+  - DB_POOL_TIMEOUT_S          espera máxima por uma conexão antes do erro (padrão 10)
+  - DB_POOL_RECYCLE_S          idade máxima de uma conexão (padrão 1800)
+  - DB_POOL_PRE_PING           "0" desliga o teste de conexão no checkout (padrão ligado)
+  - DB_POOL_SLOW_CHECKOUT_MS   espera que gera warning no log (padrão 250)
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from omr_metrics import Histogram
+
+logger = logging.getLogger("lerprova-api")
+
+
+def pool_config() -> Dict[str, Any]:
+    """Argumentos de pool para o create_engine, lidos do ambiente."""
+    processos = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    cota = max(2, int(os.getenv("DB_MAX_CONNECTIONS", 40)) // processos)
+    pool_size = int(os.getenv("DB_POOL_SIZE", max(1, cota // 2)))
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", max(0, cota - pool_size))),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_S", 10)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_S", 1800)),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") != "0",
+    }
+
+
+class PoolMetrics:
+    """Contadores do pool; os eventos vêm de várias threads (threadpool das rotas síncronas)."""
+
+    def __init__(self):
+        self.slow_checkout_ms = float(os.getenv("DB_POOL_SLOW_CHECKOUT_MS", 250))
+        self.wait_ms = Histogram()
+        self.stats = {"checkouts": 0, "slow_checkouts": 0, "timeouts": 0, "connects": 0, "invalidated": 0}
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        self._lock = threading.Lock()
+
+    def checkout(self, pool: QueuePool, wait_ms: float):
+        with self._lock:
+            self.wait_ms.observe(wait_ms)
+            self.stats["checkouts"] += 1
+            self.peak_checked_out = max(self.peak_checked_out, pool.checkedout())
+            self.peak_overflow = max(self.peak_overflow, pool.overflow())
+            slow = wait_ms > self.slow_checkout_ms
+            if slow:
+                self.stats["slow_checkouts"] += 1
+        if slow:
+            logger.warning(
+                f"Espera de {wait_ms:.0f} ms por conexão do banco "
+                f"(em uso={pool.checkedout()}, overflow={pool.overflow()}, pool_size={pool.size()})"
+            )
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self, pool) -> Dict[str, Any]:
+        with self._lock:
+            snap = {
+                "pool_class": type(pool).__name__,
+                "wait_ms": self.wait_ms.snapshot(),
+                "peak_checked_out": self.peak_checked_out,
+                "peak_overflow": self.peak_overflow,
+                "slow_checkout_ms": self.slow_checkout_ms,
+                **self.stats,
+            }
+        if isinstance(pool, QueuePool):
+            snap.update({
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "timeout_s": pool.timeout(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        return snap
+
+    def reset(self):
+        with self._lock:
+            self.wait_ms = Histogram()
+            self.stats = {key: 0 for key in self.stats}
+            self.peak_checked_out = self.peak_overflow = 0
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool que mede quanto cada checkout esperou por uma conexão livre."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeout:
+            pool_metrics.count("timeouts")
+            logger.warning(f"Pool do banco esgotado: nenhuma conexão livre em {self.timeout():g} s")
+            raise
+        pool_metrics.checkout(self, (time.perf_counter() - start) * 1000)
+        return conn
+
+
+def instrument(engine):
+    """Liga os eventos de conexão nova e de conexão invalidada (pre_ping, queda do servidor)."""
+    event.listen(engine, "connect", lambda *args: pool_metrics.count("connects"))
+    event.listen(engine, "invalidate", lambda *args: pool_metrics.count("invalidated"))
+    return engine
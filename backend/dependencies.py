@@ -8,13 +8,17 @@ import models
 import logging
 logger = logging.getLogger("lerprova-api")
 
-async def get_current_user(authorization: str = Header(None), db: Session = Depends(get_db)):
+def get_current_user(authorization: str = Header(None), db: Session = Depends(get_db)):
     # logger.info(f"DEBUG AUTH: header={authorization[:20] if authorization else 'NONE'}")
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Token ausente ou inválido")
     
     token = authorization.split(" ")[1]
-    payload = auth_utils.decode_access_token(token)
+    return user_from_token(token, db)
+
+def user_from_token(token: str, db: Session):
+    """Valida o JWT e carrega o usuário (ou aluno). Compartilhado com o WebSocket do radar."""
+    payload = auth_utils.decode_access_token(token) if token else None
     
     if not payload:
         # Tenta descobrir o motivo da falha se possível (o auth_utils já logou)
@@ -0,0 +1,150 @@
+"""
+Correções idempotentes (/provas/processar): reenvios da mesma foto não rodam o OMR de novo.
+
+Em Wi-Fi instável o app reenvia a requisição, e um toque duplo manda a mesma foto duas
+vezes. Cada resultado fica guardado por uma impressão digital do conteúdo (hash dos bytes
+da imagem + layout, gabarito, aluno e nº de questões) e, se o cliente mandar, pelo header
+`Idempotency-Key`. Um reenvio recebe a resposta guardada sem OMR e sem gravar no banco;
+um envio igual que chega enquanto o primeiro ainda processa espera por ele.
+
+Só entram no cache respostas de sucesso e rejeições da própria leitura da foto
+(ReadRejected), que dariam o mesmo resultado de novo. Os 422 que dependem do banco
+(gabarito sem acesso, aluno fora da turma), fila cheia, timeout e erros internos não ficam
+guardados: depois de vincular o gabarito ou matricular o aluno, o reenvio corrige de novo.
+
+O cache é do processo web e só é usado no event loop (sem lock).
+
+Configuração (variáveis de ambiente):
+  - OMR_IDEMPOTENCY_TTL_S        segundos que um resultado fica guardado (padrão 600)
+  - OMR_IDEMPOTENCY_MAX_ENTRIES  resultados guardados antes de descartar os mais antigos (padrão 256)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Header das respostas reaproveitadas (inclusive das rejeições)
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyConflict(Exception):
+    """A mesma Idempotency-Key foi reutilizada com outro conteúdo."""
+
+
+class ReadRejected(HTTPException):
+    """Rejeição determinística da leitura (422): a mesma foto seria rejeitada de novo."""
+
+    def __init__(self, detail: Any):
+        super().__init__(status_code=422, detail=detail)
+
+
+def fingerprint(image: bytes, *params: Any) -> str:
+    """Hash do conteúdo da requisição: bytes da imagem + parâmetros que mudam o resultado."""
+    h = hashlib.blake2b(image, digest_size=16)
+    h.update(json.dumps(params, default=str).encode())
+    return h.hexdigest()
+
+
+class IdempotencyCache:
+    def __init__(self, ttl_s: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl_s = float(ttl_s or os.getenv("OMR_IDEMPOTENCY_TTL_S", 600))
+        self.max_entries = max(1, int(max_entries or os.getenv("OMR_IDEMPOTENCY_MAX_ENTRIES", 256)))
+        # chave -> (instante, impressão digital, ("ok", resposta) ou ("error", status, detalhe))
+        self._entries: "OrderedDict[Hashable, Tuple[float, str, tuple]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Tuple[str, asyncio.Future]] = {}
+        self.stats = {"hits": 0, "misses": 0, "waits": 0, "conflicts": 0}
+
+    def _lookup(self, key: Hashable, fp: str, now: float) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, stored_fp, outcome = entry
+        if now - stored_at > self.ttl_s:
+            del self._entries[key]
+            return None
+        if stored_fp != fp:
+            self.stats["conflicts"] += 1
+            raise IdempotencyConflict()
+        return outcome
+
+    def _store(self, keys: List[Hashable], fp: str, outcome: tuple):
+        now = time.monotonic()
+        for key in keys:
+            self._entries[key] = (now, fp, outcome)
+            self._entries.move_to_end(key)
+        # Mais antigo primeiro: expirados e excedentes saem pela frente
+        while self._entries:
+            key, (stored_at, _, _) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - stored_at <= self.ttl_s:
+                break
+            del self._entries[key]
+
+    @staticmethod
+    def _replay(outcome: tuple, replayed: bool = True):
+        if outcome[0] == "error":
+            headers = {REPLAY_HEADER: "true"} if replayed else None
+            raise HTTPException(status_code=outcome[1], detail=outcome[2], headers=headers)
+        return outcome[1]
+
+    async def run(self, keys: List[Hashable], fp: str, compute: Callable[[], Awaitable[Any]],
+                  cacheable: bool = True) -> Tuple[Any, bool]:
+        """
+        Devolve (resposta, reaproveitada). `keys` são as chaves que identificam o envio
+        (conteúdo e, se houver, a Idempotency-Key); a primeira que existir no cache decide.
+        Com cacheable=False a resposta não é guardada (mas envios simultâneos ainda esperam).
+        Levanta IdempotencyConflict se uma chave já foi usada com outro conteúdo.
+        """
+        now = time.monotonic()
+        for key in keys:
+            outcome = self._lookup(key, fp, now)
+            if outcome is not None:
+                self.stats["hits"] += 1
+                # Uma Idempotency-Key nova passa a apontar para o mesmo resultado
+                self._store([k for k in keys if k not in self._entries], fp, outcome)
+                return self._replay(outcome), True
+
+        for key in keys:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                if inflight[0] != fp:
+                    self.stats["conflicts"] += 1
+                    raise IdempotencyConflict()
+                self.stats["waits"] += 1
+                # shield: o cancelamento deste reenvio não derruba o envio original
+                return self._replay(await asyncio.shield(inflight[1])), True
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._inflight[key] = (fp, future)
+        try:
+            try:
+                result = await compute()
+                outcome: tuple = ("ok", result)
+            except HTTPException as e:
+                outcome = ("error", e.status_code, e.detail)
+                if not isinstance(e, ReadRejected):
+                    future.set_exception(e)
+                    raise
+            if cacheable:
+                self._store(keys, fp, outcome)
+            future.set_result(outcome)
+            return self._replay(outcome, replayed=False), False
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            for key in keys:
+                self._inflight.pop(key, None)
+            # Ninguém esperando: evita o aviso "Future exception was never retrieved"
+            if future.done() and not future.cancelled() and future.exception() is not None:
+                future.exception()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,171 @@
+"""
+Análise de itens por gabarito (/gabaritos/{id}/analise-itens).
+
+Monta a matriz alunos × questões a partir de Resultado.respostas_aluno e calcula tudo
+com NumPy, sem laço por aluno:
+  - dificuldade: proporção de acertos da questão (1.0 = todos acertaram)
+  - discriminação: correlação ponto-bisserial entre acertar a questão e a nota no resto
+    da prova (sem a própria questão); None quando todos acertaram ou todos erraram
+  - distratores: fração dos alunos que marcou cada alternativa, e em branco
+  - em_branco / ambigua: taxas do status_list do OMR (só resultados lidos pelo OMR)
+
+O resultado fica em cache por gabarito até a próxima gravação de Resultado (ou do
+próprio Gabarito) com esse gabarito_id: os eventos da Session marcam os ids no flush e
+invalidam no commit. O cache é do processo web.
+"""
+import threading
+from itertools import chain
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+import models
+from utils.answers import parse_json_list
+
+# Alternativas do cartão (layout v1.1); letras fora daqui também entram se aparecerem
+OPCOES = ["A", "B", "C", "D", "E"]
+
+
+def _matriz(linhas: List[Optional[list]], total: int) -> np.ndarray:
+    """Listas de respostas → matriz de strings (len(linhas) × total); "" = em branco."""
+    matriz = np.full((len(linhas), total), "", dtype=object)
+    for i, linha in enumerate(linhas):
+        valores = [v or "" for v in (linha or [])[:total]]
+        matriz[i, :len(valores)] = valores
+    return matriz.astype(str).reshape(len(linhas), total)
+
+
+def _arredondar(valores: np.ndarray, casas: int = 3) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), casas) for v in valores]
+
+
+def analisar_itens(corretas: List[Optional[str]], respostas: List[Optional[list]],
+                   status: List[Optional[list]]) -> Dict[str, Any]:
+    """
+    Estatísticas por questão. `respostas` e `status` têm uma lista por aluno
+    (status None quando o resultado não veio do OMR).
+    """
+    total = len(corretas)
+    n = len(respostas)
+    chave = _matriz([corretas], total)[0]
+    marcadas = _matriz(respostas, total)
+    anuladas = chave == ""
+
+    # Acerto (0/1) por aluno e questão; questão anulada não conta para ninguém
+    acertos = ((marcadas == chave) & ~anuladas).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dificuldade = acertos.mean(axis=0) if n else np.full(total, np.nan)
+        dificuldade[anuladas] = np.nan
+
+        # Ponto-bisserial corrigido: correlação de Pearson entre o acerto e o resto da prova
+        resto = acertos.sum(axis=1, keepdims=True) - acertos
+        cov = (acertos * resto).mean(axis=0) - acertos.mean(axis=0) * resto.mean(axis=0)
+        discriminacao = cov / (acertos.std(axis=0) * resto.std(axis=0))
+    discriminacao[~np.isfinite(discriminacao) | anuladas] = np.nan
+
+    vistas = set(np.unique(marcadas).tolist()) - {""}
+    opcoes = OPCOES + sorted(vistas - set(OPCOES))
+    frequencias = {
+        opcao: (marcadas == opcao).mean(axis=0) if n else np.zeros(total) for opcao in opcoes
+    }
+    frequencias["branco"] = (marcadas == "").mean(axis=0) if n else np.zeros(total)
+
+    lidos = [s for s in status if s]
+    if lidos:
+        situacao = _matriz(lidos, total)
+        em_branco = (situacao == "blank").mean(axis=0)
+        ambigua = (situacao == "ambiguous").mean(axis=0)
+    else:
+        em_branco = ambigua = np.full(total, np.nan)
+
+    colunas = {
+        "dificuldade": _arredondar(dificuldade),
+        "discriminacao": _arredondar(discriminacao),
+        "em_branco": _arredondar(em_branco),
+        "ambigua": _arredondar(ambigua),
+    }
+    distratores = {opcao: _arredondar(freq) for opcao, freq in frequencias.items()}
+    questoes = [
+        {
+            "questao": j + 1,
+            "correta": corretas[j],
+            **{nome: valores[j] for nome, valores in colunas.items()},
+            "distratores": {opcao: valores[j] for opcao, valores in distratores.items()},
+        }
+        for j in range(total)
+    ]
+    return {"total_resultados": n, "resultados_omr": len(lidos), "opcoes": opcoes, "questoes": questoes}
+
+
+def analisar_gabarito(gabarito: models.Gabarito, db: Session) -> Dict[str, Any]:
+    """Carrega as respostas do gabarito (só as colunas usadas) e roda analisar_itens."""
+    corretas = parse_json_list(gabarito.respostas_corretas, "gabarito.respostas_corretas")
+    total = max(gabarito.num_questoes or len(corretas), len(corretas))
+    corretas = (corretas + [None] * total)[:total]
+    linhas = db.query(models.Resultado.respostas_aluno, models.Resultado.status_list).filter(
+        models.Resultado.gabarito_id == gabarito.id
+    ).all()
+    return analisar_itens(
+        corretas,
+        [parse_json_list(l.respostas_aluno, "respostas_aluno") for l in linhas],
+        [parse_json_list(l.status_list, "status_list") for l in linhas],
+    )
+
+
+class ItemAnalysisCache:
+    def __init__(self):
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        # Geração por gabarito: um cálculo que começou antes de uma invalidação não é guardado
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, gabarito_id: int):
+        """(análise ou None, geração atual) — passar a geração para o put."""
+        with self._lock:
+            entry = self._entries.get(gabarito_id)
+            self.stats["hits" if entry is not None else "misses"] += 1
+            return entry, self._generations.get(gabarito_id, 0)
+
+    def put(self, gabarito_id: int, generation: int, analysis: Dict[str, Any]):
+        with self._lock:
+            if self._generations.get(gabarito_id, 0) == generation:
+                self._entries[gabarito_id] = analysis
+
+    def invalidate(self, gabarito_ids):
+        with self._lock:
+            for gabarito_id in gabarito_ids:
+                self._generations[gabarito_id] = self._generations.get(gabarito_id, 0) + 1
+                if self._entries.pop(gabarito_id, None) is not None:
+                    self.stats["invalidations"] += 1
+
+
+item_analysis_cache = ItemAnalysisCache()
+
+_SUJOS = "analise_itens_sujos"
+
+
+@event.listens_for(Session, "after_flush")
+def _marcar_gabaritos_alterados(session, flush_context):
+    sujos = session.info.setdefault(_SUJOS, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.Gabarito):
+            sujos.add(obj.id)
+        elif isinstance(obj, models.Resultado):
+            # Inclui o gabarito antigo quando o resultado troca de gabarito
+            historico = inspect(obj).attrs.gabarito_id.history
+            sujos.update(chain(historico.added, historico.unchanged, historico.deleted))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_no_commit(session):
+    sujos = session.info.pop(_SUJOS, None)
+    if sujos:
+        item_analysis_cache.invalidate(sujos - {None})
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_no_rollback(session):
+    session.info.pop(_SUJOS, None)
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Header, HTTPException, Request, Depends
+import anyio
 from fastapi.middleware.cors import CORSMiddleware
 import time
 import logging
@@ -17,6 +18,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("lerprova-api")
 
 import models
+import omr_engine
 import users_db
 from database import engine, SessionLocal
 from migrations import run_migrations
@@ -63,6 +65,29 @@ app.include_router(reports_admin.router)
 app.include_router(agents.router)
 app.include_router(calendar.router)
 
+@app.on_event("startup")
+async def configure_threadpool():
+    # Rotas `def` e dependências síncronas (todo o acesso ao banco) rodam neste threadpool,
+    # fora do event loop; o limite segura quantas consultas andam ao mesmo tempo por processo
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("API_THREADPOOL_SIZE", limiter.total_tokens))
+    logger.info(f"Threadpool das rotas síncronas: {limiter.total_tokens} threads")
+
+@app.on_event("startup")
+async def check_artifact_secret():
+    # Os nomes dos artefatos do OMR são HMAC do conteúdo; sem uma chave comum a todos os
+    # processos, a URL gravada por um worker não confere no outro. Melhor não subir.
+    if not omr_engine.artifact_store.configured:
+        raise RuntimeError("OMR_ARTIFACT_SECRET (ou JWT_SECRET_KEY) não definido: os artefatos do OMR precisam de uma chave compartilhada")
+
+@app.on_event("shutdown")
+def shutdown_omr_executor():
+    # Encerra o pool de workers do OMR (threads ou processos)
+    provas.omr_executor.shutdown()
+    # Grava o que ainda estiver na fila de auditoria
+    omr_engine.audit_sink.close()
+    omr_engine.failure_sink.close()
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "db": "connected"}
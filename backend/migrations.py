@@ -114,6 +114,11 @@ def run_migrations(engine):
                 logger.info(f"Adicionando coluna 'review_reasons' ({res_type}) em 'resultados'...")
                 conn.execute(text(f"ALTER TABLE resultados ADD COLUMN review_reasons {res_type} NULL"))
                 
+            if "second_pass" not in columns_resultados:
+                res_type = "JSONB" if is_postgres else "JSON"
+                logger.info(f"Adicionando coluna 'second_pass' ({res_type}) em 'resultados'...")
+                conn.execute(text(f"ALTER TABLE resultados ADD COLUMN second_pass {res_type} NULL"))
+
             if "review_status" not in columns_resultados:
                 logger.info("Adicionando coluna 'review_status' em 'resultados'...")
                 conn.execute(text("ALTER TABLE resultados ADD COLUMN review_status VARCHAR DEFAULT 'confirmed'"))
@@ -227,9 +232,36 @@ def run_migrations(engine):
         logger.error(f"FALHA CRÍTICA NA MIGRAÇÃO: {e}")
         return False
 
+    ensure_indexes(engine)
     logger.info("Bootstrap do banco de dados concluído com sucesso.")
     return True
 
+
+def ensure_indexes(engine):
+    """
+    Cria os índices declarados nos models que ainda não existem no banco (o create_all só
+    cria índices junto com tabelas novas). Idempotente: cada índice é checado antes.
+    Índices únicos ficam de fora: dados antigos duplicados fariam a criação falhar.
+    Retorna os nomes dos índices criados.
+    """
+    criados = []
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existentes = {idx["name"] for idx in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.unique or index.name in existentes:
+                continue
+            try:
+                with engine.begin() as conn:
+                    index.create(conn, checkfirst=True)
+                criados.append(index.name)
+                logger.info(f"Índice '{index.name}' criado em '{table.name}'.")
+            except Exception as e:
+                logger.warning(f"Não foi possível criar o índice '{index.name}': {e}")
+    return criados
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     run_migrations(engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Text, Table, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Text, Table, JSON, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -131,11 +131,17 @@ class Resultado(Base):
     needs_review = Column(Boolean, default=False)
     review_reasons = Column(String, nullable=True)     # JSON string com os motivos ("invalid_marks", "low_confidence", etc)
     review_status = Column(String, default="confirmed") # "pending", "confirmed", "discarded"
+    second_pass = Column(JSON, nullable=True)          # Releituras do OMR: [{"question", "first", "second", "applied"}]
 
     # Relacionamentos
     aluno = relationship("Aluno", back_populates="resultados")
     gabarito = relationship("Gabarito", back_populates="resultados")
 
+    # Resultado existente do aluno na correção; resultados do gabarito (análise, recálculo)
+    __table_args__ = (
+        Index("ix_resultados_gabarito_aluno", "gabarito_id", "aluno_id"),
+    )
+
 class Frequencia(Base):
     __tablename__ = "frequencia"
 
@@ -154,6 +160,13 @@ class Frequencia(Base):
     turma = relationship("Turma")
     aluno = relationship("Aluno")
 
+    # Consultas dos relatórios e da chamada: por aluno/turma num período e por lista de datas
+    __table_args__ = (
+        Index("ix_frequencia_aluno_data", "aluno_id", "data"),
+        Index("ix_frequencia_turma_data", "turma_id", "data"),
+        Index("ix_frequencia_data", "data"),
+    )
+
 class Plano(Base):
     __tablename__ = "planos"
 
@@ -247,6 +260,11 @@ class AulaPlanejada(Base):
     plano = relationship("Plano", back_populates="aulas")
     registros = relationship("RegistroAula", back_populates="aula", cascade="all, delete-orphan")
 
+    # Próxima aula pendente do plano, em ordem
+    __table_args__ = (
+        Index("ix_aulas_planejadas_plano_status_ordem", "plano_id", "status", "ordem"),
+    )
+
 class RegistroAula(Base):
     __tablename__ = "registros_aula"
 
@@ -0,0 +1,209 @@
+"""
+Controle de admissão do OMR por orçamento de pixels.
+
+A memória de uma leitura cresce com o tamanho da foto decodificada (12 MP ≈ 70 MB em
+cores), então o limite é em megapixels e não em número de requisições: várias fotos
+pequenas passam juntas, fotos grandes esperam a vez. Cada leitura reserva os megapixels
+da sua foto (lidos do cabeçalho JPEG/PNG, sem decodificar) antes de ir para o omr_executor;
+o mesmo vale para os frames do radar e para cada página de um arquivo de scanner (o tamanho
+da página vem do IFD do TIFF).
+Quando o orçamento acaba, as requisições esperam numa fila curta, em ordem de chegada.
+Com a fila cheia, ou depois de OMR_ADMISSION_MAX_WAIT_S na fila, a resposta é 503 com
+Retry-After na hora, e o app tenta de novo mais tarde em vez de derrubar o container.
+
+Só é usado no event loop (sem lock).
+
+Configuração (variáveis de ambiente):
+  - OMR_PIXEL_BUDGET_MP         megapixels decodificados ao mesmo tempo (padrão 48, ~4 fotos de 12 MP)
+  - OMR_ADMISSION_MAX_QUEUE     requisições esperando orçamento antes do 503 (padrão 8)
+  - OMR_ADMISSION_MAX_WAIT_S    espera máxima na fila antes do 503 (padrão 10)
+  - OMR_ADMISSION_RETRY_AFTER_S valor do header Retry-After (padrão 5)
+"""
+import asyncio
+import base64
+import binascii
+import os
+import struct
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple, Union
+
+from omr_metrics import Histogram
+
+# Bytes iniciais do arquivo lidos para achar o tamanho (o EXIF do JPEG pode ocupar até 64 KB)
+HEADER_BYTES = 256 * 1024
+# Sem cabeçalho legível: estima pelo tamanho do arquivo (JPEG de celular ≈ 3-4 px por byte)
+FALLBACK_PX_PER_BYTE = 4.0
+
+
+class AdmissionRejected(Exception):
+    """Orçamento de pixels esgotado: fila cheia ou espera longa demais."""
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(largura, altura) do cabeçalho JPEG ou PNG, sem decodificar a imagem."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Preenchimento entre marcadores
+            i += 1
+            continue
+        # SOF0..SOF15 (exceto DHT/JPG/DAC) trazem altura e largura
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def image_megapixels(image: Union[bytes, str]) -> float:
+    """Megapixels da foto enviada (bytes crus ou base64/data URI)."""
+    if isinstance(image, str):
+        encoded = image.split(",")[-1]
+        total = len(encoded) * 3 // 4
+        prefix = encoded[:HEADER_BYTES * 4 // 3 // 4 * 4]
+        try:
+            head = base64.b64decode(prefix)
+        except (binascii.Error, ValueError):
+            head = b""
+    else:
+        total = len(image)
+        head = image[:HEADER_BYTES]
+    size = image_size(head)
+    if size is None:
+        return total * FALLBACK_PX_PER_BYTE / 1e6
+    return size[0] * size[1] / 1e6
+
+
+def _tiff_page_size(data: bytes, page: int) -> Optional[Tuple[int, int]]:
+    """(largura, altura) da página `page` de um TIFF, pelos IFDs; None se a página não existir."""
+    order = "<" if data[:2] == b"II" else ">"
+    try:
+        offset = struct.unpack(order + "I", data[4:8])[0]
+        for _ in range(page):
+            if not offset:
+                return None
+            count = struct.unpack(order + "H", data[offset:offset + 2])[0]
+            offset = struct.unpack(order + "I", data[offset + 2 + 12 * count:offset + 6 + 12 * count])[0]
+        if not offset:
+            return None
+        count = struct.unpack(order + "H", data[offset:offset + 2])[0]
+        size = {}
+        for i in range(count):
+            entry = data[offset + 2 + 12 * i:offset + 14 + 12 * i]
+            tag, kind = struct.unpack(order + "HH", entry[:4])
+            if tag in (256, 257):  # ImageWidth, ImageLength (SHORT ou LONG)
+                size[tag] = struct.unpack(order + ("H" if kind == 3 else "I"), entry[8:10] if kind == 3 else entry[8:12])[0]
+    except struct.error:
+        return None
+    return (size[256], size[257]) if len(size) == 2 else None
+
+
+def scan_page_megapixels(data: bytes, page: int) -> Optional[float]:
+    """
+    Megapixels da página `page` de um arquivo de scanner (TIFF multipágina ou imagem comum),
+    lidos do cabeçalho sem decodificar. None quando a página não existe (fim do arquivo).
+    """
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        size = _tiff_page_size(data, page)
+        if size is not None:
+            return size[0] * size[1] / 1e6
+        # Cabeçalho ilegível: a página 0 vai inteira para o engine, que dá o diagnóstico
+        return len(data) * FALLBACK_PX_PER_BYTE / 1e6 if page == 0 else None
+    return image_megapixels(data) if page == 0 else None
+
+
+class PixelBudget:
+    def __init__(self, capacity_mp: Optional[float] = None, max_queue: Optional[int] = None,
+                 max_wait_s: Optional[float] = None, retry_after_s: Optional[int] = None):
+        self.capacity_mp = float(capacity_mp or os.getenv("OMR_PIXEL_BUDGET_MP", 48))
+        self.max_queue = int(max_queue if max_queue is not None else os.getenv("OMR_ADMISSION_MAX_QUEUE", 8))
+        self.max_wait_s = float(max_wait_s or os.getenv("OMR_ADMISSION_MAX_WAIT_S", 10))
+        self.retry_after_s = int(retry_after_s or os.getenv("OMR_ADMISSION_RETRY_AFTER_S", 5))
+        self.in_flight_mp = 0.0
+        self.in_flight = 0
+        self._waiters: "deque[Tuple[float, asyncio.Future]]" = deque()
+        self.wait_ms = Histogram()
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    def _fits(self, mp: float) -> bool:
+        return self.in_flight_mp + mp <= self.capacity_mp or self.in_flight == 0
+
+    def _take(self, mp: float):
+        self.in_flight_mp += mp
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+
+    def _release(self, mp: float):
+        self.in_flight_mp = max(0.0, self.in_flight_mp - mp)
+        self.in_flight -= 1
+        # Ordem de chegada: o primeiro da fila entra assim que couber (os de trás esperam)
+        while self._waiters:
+            need, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(need):
+                break
+            self._waiters.popleft()
+            self._take(need)
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def acquire(self, mp: float):
+        """Reserva `mp` megapixels enquanto o bloco roda; levanta AdmissionRejected se não der."""
+        # Uma foto maior que o orçamento inteiro ainda passa, sozinha
+        mp = min(mp, self.capacity_mp)
+        start = time.perf_counter()
+        if not self._waiters and self._fits(mp):
+            self._take(mp)
+        else:
+            if len(self._waiters) >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                raise AdmissionRejected()
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((mp, future))
+            self.stats["queued"] += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.max_wait_s)
+            except asyncio.TimeoutError:
+                if future.done():
+                    # Liberado no mesmo instante do timeout: já está reservado, então segue
+                    pass
+                else:
+                    future.cancel()
+                    self.stats["rejected_timeout"] += 1
+                    raise AdmissionRejected()
+            except asyncio.CancelledError:
+                # Cliente desistiu: devolve a vaga se já tinha sido liberada para ele
+                if future.done() and not future.cancelled():
+                    self._release(mp)
+                else:
+                    future.cancel()
+                raise
+        self.wait_ms.observe((time.perf_counter() - start) * 1000)
+        try:
+            yield
+        finally:
+            self._release(mp)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "capacity_mp": self.capacity_mp,
+            "in_flight_mp": round(self.in_flight_mp, 2),
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for _, f in self._waiters if not f.done()),
+            "max_queue": self.max_queue,
+            "wait_ms": self.wait_ms.snapshot(),
+            **self.stats,
+        }
@@ -0,0 +1,159 @@
+"""
+Gravação dos artefatos de auditoria do OMR fora do caminho da requisição.
+
+O process_image entrega buffers já codificados (JPEG/JSON) para um AuditSink, que
+os coloca numa fila limitada em memória e grava em disco numa thread de fundo.
+Se a fila estiver cheia o evento é descartado (auditoria nunca atrasa a correção).
+
+Configuração (variáveis de ambiente):
+  - OMR_AUDIT_ENABLED      "0" desliga a auditoria em disco (padrão "1")
+  - OMR_AUDIT_SAMPLE_CHECK fração das leituras em revisão (CHECK) gravadas (padrão 1.0)
+  - OMR_AUDIT_SAMPLE_OK    fração das leituras OK gravadas (padrão 0.05)
+  - OMR_AUDIT_QUEUE_MAX    eventos aguardando gravação (padrão 32)
+
+A retenção é controlada de forma incremental: o diretório é listado uma única vez,
+na primeira gravação, e depois cada arquivo novo entra numa fila (mais antigo primeiro).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Optional, Union
+
+logger = logging.getLogger("lerprova-api")
+
+_STOP = object()
+
+
+class AuditSink:
+    def __init__(
+        self,
+        directory: Path,
+        max_files: int,
+        max_queue: Optional[int] = None,
+        sample_rates: Optional[Dict[str, float]] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        if enabled is None:
+            enabled = os.getenv("OMR_AUDIT_ENABLED", "1") != "0"
+        self.enabled = enabled
+        self.sample_rates = sample_rates if sample_rates is not None else {
+            "CHECK": float(os.getenv("OMR_AUDIT_SAMPLE_CHECK", 1.0)),
+            "OK": float(os.getenv("OMR_AUDIT_SAMPLE_OK", 0.05)),
+        }
+        self._queue: "queue.Queue[object]" = queue.Queue(maxsize=max(1, int(max_queue or os.getenv("OMR_AUDIT_QUEUE_MAX", 32))))
+        self._files: Optional[Deque[Path]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.stats = {"submitted": 0, "dropped": 0, "written": 0, "deleted": 0, "errors": 0}
+
+    def should_sample(self, kind: str) -> bool:
+        """Decide se um evento do tipo `kind` ("OK", "CHECK", ...) deve ser gravado."""
+        if not self.enabled:
+            return False
+        rate = self.sample_rates.get(kind, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def submit(self, kind: str, files: Dict[str, Union[bytes, dict]]) -> Optional[str]:
+        """
+        Enfileira um evento. `files` mapeia sufixo -> conteúdo (bytes já codificados,
+        ou dict que será gravado como JSON). Retorna o prefixo do evento, ou None se descartado.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._seq += 1
+            prefix = f"{int(time.time())}_{self._seq:04d}_{kind}"
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((prefix, files))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            logger.warning(f"Fila de auditoria OMR cheia, evento {prefix} descartado")
+            return None
+        self.stats["submitted"] += 1
+        return prefix
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a fila esvaziar (usado em testes e no encerramento)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="omr-audit", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Erro ao salvar auditoria OMR: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, prefix: str, files: Dict[str, Union[bytes, dict]]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._files is None:
+            self._files = self._scan_existing()
+
+        for suffix, content in files.items():
+            if content is None:
+                continue
+            path = self.directory / f"{prefix}_{suffix}"
+            if isinstance(content, dict):
+                content = json.dumps(content, ensure_ascii=False, default=str).encode("utf-8")
+            path.write_bytes(content)
+            self._files.append(path)
+            self.stats["written"] += 1
+
+        self._enforce_retention()
+
+    def _scan_existing(self) -> Deque[Path]:
+        """Listagem única do diretório, do arquivo mais antigo para o mais novo."""
+        files = [f for f in self.directory.iterdir() if f.is_file()]
+        files.sort(key=lambda f: f.stat().st_mtime)
+        return deque(files)
+
+    def _enforce_retention(self):
+        files = self._files
+        if files is None:
+            return
+        while len(files) > self.max_files:
+            old = files.popleft()
+            try:
+                old.unlink()
+                self.stats["deleted"] += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Erro ao remover auditoria antiga {old}: {e}")
@@ -1,13 +1,20 @@
 # OMR Engine reconstruído para layout industrial
 import cv2  # type: ignore
 import numpy as np  # type: ignore
+from numpy.lib.stride_tricks import sliding_window_view  # type: ignore
 import base64
 import json
 from pathlib import Path
 import math
+import os
+import threading
 import time
 import logging
-from typing import Any, Dict, List, Optional, Union, cast
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional, cast
+
+from artifact_store import ArtifactStore
+from omr_audit import AuditSink
 
 # Configuração de Logs e Diretórios de Debug
 BASE_DIR = Path(__file__).parent
@@ -16,9 +23,23 @@ DEBUG_LOG_DIR.mkdir(parents=True, exist_ok=True)
 AUDIT_DIR = DEBUG_LOG_DIR / "auditoria"
 AUDIT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Gravação em segundo plano: leituras (OK/CHECK, amostradas) e falhas de enquadramento
+audit_sink = AuditSink(AUDIT_DIR, max_files=int(os.getenv("OMR_AUDIT_MAX_FILES", 300)))  # ~75 eventos (3 jpg + json)
+failure_sink = AuditSink(DEBUG_LOG_DIR, max_files=int(os.getenv("OMR_DEBUG_MAX_FILES", 50)), sample_rates={})
+
+# Imagens devolvidas por URL (inline_images=False) em vez de base64 na resposta
+artifact_store = ArtifactStore()
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# pyzbar é opcional: precisa da libzbar0 do sistema (instalada no Dockerfile)
+try:
+    from pyzbar import pyzbar  # type: ignore
+except ImportError:
+    pyzbar = None
+    logger.info("pyzbar/libzbar indisponível: QR Code será lido só pelo OpenCV")
+
 def _circularity(cnt):
     """
     Calcula a circularidade de um contorno.
@@ -30,59 +51,370 @@ def _circularity(cnt):
         return 0
     return 4 * np.pi * area / (perimeter * perimeter)
 
+
+# Escala da região do QR Code em relação ao warp (mais pixels por módulo para o decoder)
+QR_REGION_SCALE = 1.5
+# Zona de silêncio adicionada ao recorte do QR (o template imprime o QR quase colado em outros elementos)
+QR_QUIET_ZONE_PX = 24
+
+# Reaproveitar os buffers de pré-processamento entre imagens (por thread). "0" desliga.
+REUSE_BUFFERS = os.getenv("OMR_REUSE_BUFFERS", "1") != "0"
+
+# Leitura sempre em tons de cinza, mesmo quando a resposta leva imagens (retificada sai em cinza).
+# Sem isso, o modo cinza só é usado quando nem imagens nem mapa de auditoria são pedidos.
+LOW_MEMORY = os.getenv("OMR_LOW_MEMORY", "0") == "1"
+
+# Pré-triagem de qualidade (escura/estourada/sem folha/tremida) antes do pipeline completo. "0" desliga.
+PRECHECK = os.getenv("OMR_PRECHECK", "1") != "0"
+
+# Segunda passada (threshold por linha + busca de posição) nas questões ambíguas/inválidas. "0" desliga.
+REREAD = os.getenv("OMR_REREAD", "1") != "0"
+
+
+class StageTimer:
+    """
+    Tempo (ms) de cada etapa de um process_image.
+    `lap(etapa)` soma à etapa o tempo desde a marca anterior. Trabalho aninhado que é
+    medido à parte (`measure`/`add`, ex: o CLAHE calculado sob demanda dentro da detecção
+    de âncoras) vai para a própria etapa e é descontado da volta seguinte, então as
+    etapas não se sobrepõem e a soma fecha com o total.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._start = self._mark = time.perf_counter()
+        self._nested = 0.0
+
+    def add(self, stage: str, ms: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + ms
+        self._nested += ms
+
+    @contextmanager
+    def measure(self, stage: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - t0) * 1000)
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        ms = (now - self._mark) * 1000 - self._nested
+        self._mark, self._nested = now, 0.0
+        self.timings[stage] = self.timings.get(stage, 0.0) + max(0.0, ms)
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def report(self) -> Dict[str, float]:
+        return {stage: round(ms, 2) for stage, ms in self.timings.items()}
+
+
+class PreprocessCache:
+    """
+    Pré-processamento de UMA imagem, calculado sob demanda e memoizado.
+    Todas as estratégias de detecção recebem a mesma instância, então cada buffer
+    (gray, CLAHE, blur, adaptativo, Otsu) é calculado no máximo uma vez por imagem.
+
+    Os arrays de saída vêm de um pool por thread (dst=) com um buffer por nome,
+    reaproveitado entre imagens do mesmo tamanho. Por isso os buffers só valem até a
+    próxima imagem do mesmo `scope` processada na mesma thread: não guarde referências.
+
+    Com `timer` (StageTimer), o cálculo de cada buffer é medido nas etapas "gray",
+    "clahe" (CLAHE + blur) e "threshold".
+    """
+    _local = threading.local()
+
+    def __init__(self, image=None, gray=None, scope="full", timer: Optional[StageTimer] = None):
+        if image is None and gray is None:
+            raise ValueError("PreprocessCache precisa de image ou gray")
+        self.image = image
+        self.scope = scope
+        self.timer = timer
+        self._memo: Dict[Any, np.ndarray] = {}
+        if gray is not None:
+            self._memo["gray"] = gray
+
+    def _timed(self, stage: str):
+        return self.timer.measure(stage) if self.timer is not None else nullcontext()
+
+    def _dst(self, name, shape):
+        """Buffer de saída do pool da thread (ou None para o OpenCV alocar)."""
+        if not REUSE_BUFFERS:
+            return None
+        pool = getattr(self._local, "pool", None)
+        if pool is None:
+            pool = self._local.pool = {}
+        key = (self.scope, name)
+        buf = pool.get(key)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, np.uint8)
+            pool[key] = buf
+        return buf
+
+    @staticmethod
+    def _clahe():
+        clahe = getattr(PreprocessCache._local, "clahe", None)
+        if clahe is None:
+            clahe = PreprocessCache._local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        return clahe
+
+    @property
+    def shape(self):
+        return self.gray.shape[:2]
+
+    @property
+    def gray(self):
+        if "gray" not in self._memo:
+            if self.image.ndim == 2:
+                self._memo["gray"] = self.image
+            else:
+                dst = self._dst("gray", self.image.shape[:2])
+                with self._timed("gray"):
+                    self._memo["gray"] = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY, dst=dst)
+        return self._memo["gray"]
+
+    @property
+    def clahe(self):
+        """CLAHE para equilibrar contraste local sem apagar as âncoras."""
+        if "clahe" not in self._memo:
+            gray = self.gray
+            dst = self._dst("clahe", gray.shape)
+            with self._timed("clahe"):
+                self._memo["clahe"] = self._clahe().apply(gray, dst)
+        return self._memo["clahe"]
+
+    @property
+    def blurred(self):
+        """Gaussian Blur 3x3 sobre o CLAHE para redução de ruído."""
+        if "blurred" not in self._memo:
+            src = self.clahe
+            with self._timed("clahe"):
+                self._memo["blurred"] = cv2.GaussianBlur(src, (3, 3), 0, dst=self._dst("blurred", src.shape))
+        return self._memo["blurred"]
+
+    @property
+    def adaptive(self):
+        """Binarização adaptativa (bloco 31), sincronizada com o preview."""
+        if "adaptive" not in self._memo:
+            src = self.blurred
+            with self._timed("threshold"):
+                self._memo["adaptive"] = cv2.adaptiveThreshold(
+                    src, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 31, 10,
+                    dst=self._dst("adaptive", src.shape)
+                )
+        return self._memo["adaptive"]
+
+    @property
+    def otsu(self):
+        """Threshold global (Otsu) sobre o CLAHE."""
+        if "otsu" not in self._memo:
+            src = self.clahe
+            with self._timed("threshold"):
+                _, self._memo["otsu"] = cv2.threshold(
+                    src, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=self._dst("otsu", src.shape)
+                )
+        return self._memo["otsu"]
+
+    @property
+    def strict(self):
+        """Threshold adaptativo com bloco proporcional à largura (W/35) sobre o gray puro."""
+        if "strict" not in self._memo:
+            gray = self.gray
+            # blockSize deve ser ímpar e proporcional à largura da imagem
+            block_size = int(gray.shape[1] / 35)
+            if block_size % 2 == 0: block_size += 1
+            block_size = max(3, block_size)
+            with self._timed("threshold"):
+                self._memo["strict"] = cv2.adaptiveThreshold(
+                    gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, block_size, 10,
+                    dst=self._dst("strict", gray.shape)
+                )
+        return self._memo["strict"]
+
+    def binary(self, strategy: str) -> np.ndarray:
+        """Imagem binária de uma estratégia de detecção: "strict", "adaptive" ou "otsu"."""
+        if strategy not in ("strict", "adaptive", "otsu"):
+            raise ValueError(f"Estratégia de binarização desconhecida: {strategy}")
+        return getattr(self, strategy)
+
+# Layouts pré-compilados na criação de cada OMREngine
+PRELOAD_LAYOUTS = ("v1", "v1.1-a4-calibrated")
+# Layout usado pelo radar (detect_anchors_only) para localizar o QR Code
+RADAR_LAYOUT = "v1.1-a4-calibrated"
+
+# Meia largura da janela de rastreamento do radar, em fração do maior lado do frame
+TRACK_WINDOW_PCT = float(os.getenv("OMR_TRACK_WINDOW_PCT", 0.08))
+
+DEFAULT_LAYOUT: Dict[str, Any] = {
+    "version": "default",
+    "warped_size": {"w": 1120, "h": 1600},
+    "thresholds": {"marked": 0.20, "ambiguous": 0.10},
+    "roi_size_pct_of_width": 0.028,
+    "options": ["A", "B", "C", "D", "E"],
+    "x_centers_pct": [0.245, 0.318, 0.392, 0.465, 0.538],
+    "y_start_pct": 0.1079,
+    "y_end_pct": 0.88,
+    "num_questions": 26
+}
+
+
+class CompiledLayout(dict):
+    """
+    Layout JSON com a geometria já convertida para pixels do warp.
+    Continua sendo um dict (acesso legado por chave, ex: layout.get("num_questions")),
+    mas expõe arrays NumPy prontos para o loop de leitura:
+        roi_coords: int32 [Q*O, 4] (x1, y1, x2, y2) na ordem questão -> opção
+        centers:    float32 [Q, O, 2] centros (x, y) das bolhas
+        warp_dst:   float32 [4, 2] destino da homografia (centros das âncoras)
+        qr_region:  (x, y, w, h) em pixels do warp onde o QR Code está impresso, ou None
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        super().__init__(data)
+        warped_size = cast(Dict[str, int], self["warped_size"])
+        self.width = int(warped_size["w"])
+        self.height = int(warped_size["h"])
+
+        thr = cast(Dict[str, float], self.get("thresholds", {}))
+        self.marked_thr = float(thr.get("marked", 0.20))
+        self.ambiguous_thr = float(thr.get("ambiguous", 0.10))
+
+        self.options = tuple(str(o) for o in self.get("options", ["A", "B", "C", "D", "E"]))
+        self.num_questions = int(self.get("num_questions") or 26)
+        self.num_columns = int(self.get("num_columns", 1))
+        self.roi_size = int(self.width * float(self.get("roi_size_pct_of_width", 0.028)))
+
+        offsets = cast(Dict[str, float], self.get("anchor_offsets_pct", {"x": 0.0, "y": 0.0}))
+        self.anchor_offsets_pct = (float(offsets["x"]), float(offsets["y"]))
+        ox = self.anchor_offsets_pct[0] * self.width
+        oy = self.anchor_offsets_pct[1] * self.height
+        self.warp_dst = np.array([
+            [ox, oy],                                       # TL
+            [self.width - ox - 1, oy],                      # TR
+            [self.width - ox - 1, self.height - oy - 1],    # BR
+            [ox, self.height - oy - 1]                      # BL
+        ], dtype=np.float32)
+
+        # Região do QR Code relativa ao warp (que é definido pelas âncoras). Deve ser justa:
+        # no template a âncora TL, a barra de calibração e a linha do cabeçalho encostam no QR
+        qr = self.get("qr_region_pct")
+        self.qr_region = None
+        if qr:
+            self.qr_region = (
+                int(qr["x"] * self.width), int(qr["y"] * self.height),
+                int(qr["w"] * self.width), int(qr["h"] * self.height),
+            )
+
+        self._compile_rois()
+
+    def _compile_rois(self):
+        # O gerador do frontend (GabaritoTemplate) usa colunas verticais (blocos):
+        # Bloco 1: Q1-Q7 | Bloco 2: Q8-Q14... então a ordem é Column -> Row.
+        x_centers_pct = np.asarray(self.get("x_centers_pct", [0.245, 0.318, 0.392, 0.465, 0.538]), dtype=np.float64)
+        x_offsets_pct = list(self.get("x_offsets_pct", [0.0]))
+        # O gerador industrial usa passo fixo de 11mm em um wrapper de 190mm
+        y_step_pct = float(self.get("y_step_pct_fixed", 0.0579))
+        y_start_pct = float(self.get("y_start_pct_fixed", 0.1079))
+
+        num_rows = math.ceil(self.num_questions / self.num_columns)
+        q_col = []
+        q_row = []
+        for col in range(self.num_columns):
+            for row in range(num_rows):
+                if len(q_col) >= self.num_questions:
+                    break
+                q_col.append(col)
+                q_row.append(row)
+
+        x_off = np.array([float(x_offsets_pct[c]) for c in q_col], dtype=np.float64) * self.width
+        y_center = (y_start_pct + np.asarray(q_row, dtype=np.float64) * y_step_pct) * self.height
+        x_center = x_off[:, None] + x_centers_pct[None, :] * self.width          # [Q, O]
+        y_center = np.broadcast_to(y_center[:, None], x_center.shape)           # [Q, O]
+        self.centers = np.stack([x_center, y_center], axis=-1).astype(np.float32)
+
+        # Mesmo arredondamento/clamp do cálculo original por bolha (int() trunca em direção a zero)
+        half = float(self.roi_size) / 2
+        x1 = np.maximum(0, np.trunc(x_center - half)).astype(np.int32)
+        y1 = np.maximum(0, np.trunc(y_center - half)).astype(np.int32)
+        x2 = np.minimum(self.width, x1 + self.roi_size)
+        y2 = np.minimum(self.height, y1 + self.roi_size)
+        self.roi_coords = np.stack([x1, y1, x2, y2], axis=-1).reshape(-1, 4).astype(np.int32)
+
+
 class OMREngine:
     def __init__(self, default_version=1):
         self.default_version = default_version
         self.target_width = 1120
         self.target_height = 1600
         self.MIN_CONFIDENCE = 0.80
+        self.AMBIGUOUS_MARGIN = 0.06  # Diferença mínima entre Top 1 e Top 2 para não ser ambíguo
         self.layout_cache = {}
+        self._bubble_mask_cache = {}
+        # QRCodeDetector não é thread-safe: um por thread, reaproveitado entre chamadas
+        self._local = threading.local()
         
-    def load_layout(self, layout_version: str = "v1"):
+        for version in PRELOAD_LAYOUTS:
+            self.load_layout(version)
+
+    def load_layout(self, layout_version: str = "v1") -> CompiledLayout:
+        """
+        Carrega e compila o layout (cacheado por versão).
+        Versões sem arquivo caem para v1; sem v1, usa DEFAULT_LAYOUT.
+        """
         # Normalizar: se for 1 virar v1
         version_str = str(layout_version)
         if version_str.isdigit() and not version_str.startswith("v"):
             version_str = f"v{version_str}"
             
-        if version_str in self.layout_cache:
-            return self.layout_cache[version_str]
-
-        default_layout = {
-            "version": "default",
-            "warped_size": {"w": 1120, "h": 1600},
-            "thresholds": {"marked": 0.20, "ambiguous": 0.10},
-            "roi_size_pct_of_width": 0.028,
-            "options": ["A", "B", "C", "D", "E"],
-            "x_centers_pct": [0.245, 0.318, 0.392, 0.465, 0.538],
-            "y_start_pct": 0.1079,
-            "y_end_pct": 0.88,
-            "num_questions": 26
-        }
+        layout = self.layout_cache.get(version_str)
+        if layout is None:
+            layout = self._compile_layout(version_str)
+            self.layout_cache[version_str] = layout
+
+        self.target_width = layout.width
+        self.target_height = layout.height
+        return layout
 
+    def _compile_layout(self, version_str: str) -> CompiledLayout:
         p = Path(__file__).parent / f"layout_{version_str}.json"
         if not p.exists():
             if version_str != "v1":
                 return self.load_layout("v1")
-            return default_layout
+            return CompiledLayout(DEFAULT_LAYOUT)
 
         try:
             layout_data = json.loads(p.read_text(encoding="utf-8"))
             # Fusing with default to ensure no missing keys
-            merged: Dict[str, Any] = {**default_layout, **layout_data}
-            
-            warped_size = cast(Dict[str, int], merged["warped_size"])
-            self.target_width = int(warped_size["w"])
-            self.target_height = int(warped_size["h"])
-
-            self.layout_cache[version_str] = merged
-            return merged
+            return CompiledLayout({**DEFAULT_LAYOUT, **layout_data})
         except Exception as e:
             print(f"Erro ao carregar layout {version_str}: {e}")
-            return default_layout
+            return CompiledLayout(DEFAULT_LAYOUT)
         
-    def process_image(self, image_base64, num_questions=None, return_images=True, return_audit=True, layout_version=None):
+    def _decode_image(self, image, flags=cv2.IMREAD_COLOR):
+        """
+        Decodifica a imagem recebida pela API.
+        Aceita bytes crus (upload multipart) ou string base64/data URI (legado).
+        """
+        return cv2.imdecode(self._image_buffer(image), flags)
+
+    def _image_buffer(self, image):
+        """Buffer uint8 da imagem codificada, para decodificar mais de uma vez sem copiar."""
+        if isinstance(image, str):
+            image = base64.b64decode(image.split(',')[-1])
+        # np.frombuffer não copia: o imdecode lê direto do buffer recebido
+        return np.frombuffer(image, np.uint8)
+
+    def process_image(self, image, num_questions=None, return_images=True, return_audit=True, layout_version=None,
+                      inline_images=True):
         """
         Processa uma imagem de cartão-resposta seguindo as melhores práticas de OMR profissional.
+        `image` pode ser bytes do JPEG/PNG (upload multipart) ou string base64 (legado).
+        Sem return_images/return_audit (ou com OMR_LOW_MEMORY=1) a foto é decodificada direto
+        em tons de cinza e nenhuma cópia colorida é criada: ~1/3 da memória por requisição.
+        Com inline_images=False as imagens não vão em base64: ficam no artifact_store e a
+        resposta traz só os nomes em "artifacts" (o mapa de auditoria é renderizado sob demanda).
         
         Retorna:
             dict: {
@@ -90,14 +422,31 @@ class OMREngine:
                 "answers": list,  # Respostas detectadas
                 "confidence_scores": list,  # Nível de confiança por questão (0-1)
                 "question_status": list,  # "valid", "blank", "invalid", "ambiguous"
+                "second_pass": list,  # Questões relidas: {"question", "first", "second", "applied"}
                 "processed_image": str,  # Base64 da imagem retificada
                 "audit_map": str,  # Base64 do mapa visual com bolhas destacadas
+                "artifacts": dict,  # inline_images=False: {"processed", "original", "audit"} no artifact_store
                 "original_image": str,  # Base64 da imagem original (auditoria)
                 "anchors_detected": bool,
                 "qr_data": dict,  # Dados decodificados do QR Code {"aid": student_id, "gid": gabarito_id}
+                "telemetry": dict,  # {"total_ms", "timings_ms" por etapa, "anchor_strategy", "reject_reason", "image_quality"}
                 "error": str  # Mensagem de erro, se houver
             }
         """
+        timer = StageTimer()
+        anchor_strategy = None
+        image_quality = None
+
+        def finish(response, reject_reason=None):
+            response["telemetry"] = {
+                "total_ms": round(timer.total_ms, 2),
+                "timings_ms": timer.report(),
+                "anchor_strategy": anchor_strategy,
+                "reject_reason": reject_reason,
+                "image_quality": image_quality,
+            }
+            return response
+
         try:
             # ===== 0. SELEÇÃO DE LAYOUT =====
             # Selecionar layout_version v1.1-a4-calibrated se não informado
@@ -109,70 +458,59 @@ class OMREngine:
             if num_questions is None:
                 num_questions = layout_nq
 
-            # Atualizar dimensões baseadas no layout escolhido
-            t_width = self.target_width
-            t_height = self.target_height
-
             # ===== 1. AQUISIÇÃO DA IMAGEM =====
-            img_data = base64.b64decode(image_base64.split(',')[-1])
-            nparr = np.frombuffer(img_data, np.uint8)
-            img_original = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Cor só serve para as imagens devolvidas: sem elas, decodifica direto em cinza
+            gray_only = LOW_MEMORY or not (return_images or return_audit)
+            image_buf = self._image_buffer(image)
+            img = cv2.imdecode(image_buf, cv2.IMREAD_GRAYSCALE if gray_only else cv2.IMREAD_COLOR)
             
-            if img_original is None:
-                return {"success": False, "error": "Imagem vazia ou corrompida"}
-            
-            # Salvar original para auditoria
-            _, buffer_orig = cv2.imencode('.jpg', img_original, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            original_base64 = base64.b64encode(buffer_orig).decode('utf-8')
+            if img is None:
+                return finish({"success": False, "error": "Imagem vazia ou corrompida"}, "image_unreadable")
             
             # Utiliza a imagem em formato original sem encolhê-la para não distorcer as âncoras
-            img = img_original.copy()
-            
-            # ===== 1.1 DECODIFICAÇÃO DE IDENTIDADE (QR CODE) =====
-            # Tentar decodificar o QR Code na imagem original para maior precisão
-            qr_data = self.decode_qr(img_original)
-            if not qr_data:
-                # Tentar na imagem redimensionada se falhar
-                qr_data = self.decode_qr(img)
-            
-            # ===== 2. PRÉ-PROCESSAMENTO AVANÇADO =====
-            # 2.1 Converter para escala de cinza
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # 2.2 Normalização de Iluminação (Flat-Field Correction)
-            # 2.2 Pré-processamento Padronizado (Mesmo do Preview)
-            # Aplicar CLAHE para equilibrar contraste local sem apagar as âncoras
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            gray_clahe = clahe.apply(gray)
-            
-            # 2.4 Aplicar Gaussian Blur para redução de ruído
-            blurred = cv2.GaussianBlur(gray_clahe, (3, 3), 0)
-            
-            # 2.5 Binarização Adaptativa (Sincronizada com Preview)
-            thresh = cv2.adaptiveThreshold(
-                blurred, 255, 
-                cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY_INV, 
-                31, 10
-            )
-            
-            # ===== 3. DETECÇÃO ROBUSTA DE ÂNCORAS =====
-            anchors = self.detect_anchors_robust(thresh, gray)
-            
-            if len(anchors) != 4:
-                # Fallback: tentar com threshold global
-                _, thresh_global = cv2.threshold(gray_clahe, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-                anchors = self.detect_anchors_robust(thresh_global, gray)
+            timer.lap("decode")
             
+            # ===== 2. PRÉ-PROCESSAMENTO (SOB DEMANDA, COMPARTILHADO ENTRE ESTRATÉGIAS) =====
+            prep = PreprocessCache(gray=img, timer=timer) if gray_only else PreprocessCache(img, timer=timer)
+
+            # ===== 2.1 PRÉ-TRIAGEM DE QUALIDADE =====
+            # Escura, estourada, sem folha ou tremida: pede outra foto sem rodar o resto do pipeline
+            if PRECHECK:
+                image_quality = self.assess_image_quality(prep.gray)
+                timer.lap("precheck")
+                reason = image_quality["reason"]
+                if reason:
+                    return finish({
+                        "success": False,
+                        "quality": "reject",
+                        "error": self.PRECHECK_MESSAGES[reason],
+                    }, reason)
+
+            # ===== 3. DETECÇÃO DE ÂNCORAS (GROSSA -> FINA) =====
+            # Localiza as âncoras na imagem reduzida e refina só janelas pequenas em resolução cheia
+            anchors = self.detect_anchors_coarse_to_fine(image_buf, prep)
+            if len(anchors) == 4:
+                anchor_strategy = "coarse"
+
+            # Fallback em resolução cheia: cada estratégia só calcula os buffers que ainda faltam
+            for strategy in ("strict", "adaptive", "otsu"):
+                if len(anchors) == 4:
+                    break
+                anchors = self.detect_anchors_robust(prep, strategy)
+                if len(anchors) == 4:
+                    anchor_strategy = strategy
+            timer.lap("anchors")
+
             if len(anchors) != 4:
                 error_msg = f"Erro de enquadramento: Detectadas {len(anchors)}/4 âncoras."
-                self._log_debug_event(img_original, error_msg, {"anchors_found": len(anchors)})
-                return {
+                self._log_debug_event(image_buf, error_msg, {"anchors_found": len(anchors)})
+                timer.lap("audit")
+                return finish({
                     "success": False,
                     "quality": "reject",
                     "error": f"{error_msg} Alinhe as 4 bolinhas pretas nos cantos.",
                     "anchors_found": len(anchors)
-                }
+                }, "anchors_not_found")
             
             # ===== 4. CORREÇÃO DE PERSPECTIVA (HOMOGRAFIA) =====
             rect = self.order_points(np.array(anchors))
@@ -182,19 +520,19 @@ class OMREngine:
             width_bottom = np.linalg.norm(br - bl)
             
             if width_bottom == 0 or width_top == 0:
-                return {
+                return finish({
                     "success": False, 
                     "quality": "reject", 
                     "error": "Perspectiva inválida (divisão por zero). Refaça a foto."
-                }
+                }, "degenerate_perspective")
                 
             ratio = width_top / width_bottom
             if ratio < 0.75 or ratio > 1.25:
-                return {
+                return finish({
                     "success": False, 
                     "quality": "reject",
                     "error": "Folha muito inclinada ou âncoras erradas detectadas localmente. Refaça a foto com o celular mais paralelo ao papel."
-                }
+                }, "excessive_tilt")
 
             warped = self.four_point_transform(img, rect, current_layout)
             
@@ -204,29 +542,42 @@ class OMREngine:
             perspective_quality = self._validate_perspective_quality(rect, img.shape[:2])
             if perspective_quality["warning"]:
                 logger.warning(f"Perspective warning: {perspective_quality['message']}")
+            timer.lap("warp")
             
-            # Limpeza de memória imediata
+            # ===== 4.1 DECODIFICAÇÃO DE IDENTIDADE (QR CODE) =====
+            # Só a região do QR declarada no layout, retificada a partir das âncoras
+            qr_timings: Dict[str, float] = {}
+            qr_data = self.decode_qr(prep.gray, rect, current_layout, timings=qr_timings)
+            timer.lap("qr")
+            
+            # Limpeza de memória imediata: daqui em diante só a retificada (e os bytes recebidos)
             del img
-            del gray
-            del blurred
-            del thresh
-            del gray_clahe
+            del prep
             
-            # ===== 4.1 VALIDAÇÃO PÓS-WARP =====
+            # ===== 4.2 VALIDAÇÃO PÓS-WARP =====
             # Verifica se os cantos da imagem retificada realmente contêm as âncoras pretas
-            if not self.validate_warped_anchors(warped, current_layout):
-                return {
+            valid_warp = self.validate_warped_anchors(warped, current_layout)
+            timer.lap("validate_anchors")
+            if not valid_warp:
+                return finish({
                     "success": False, 
                     "quality": "reject",
                     "error": "Alinhamento inválido (âncoras não confirmadas após retificação). Refaça a foto.", 
                     "anchors_found": 4
-                }
+                }, "anchors_not_confirmed")
             
             # ===== 5. LEITURA POR DENSIDADE DE PIXELS =====
             bubble_results = self.read_bubbles_by_density(warped, num_questions, version_str)
+            timer.lap("bubbles")
             
             # ===== 6. VALIDAÇÃO POR QUESTÃO =====
             validated_results = self.validate_questions(bubble_results, version_str)
+            timer.lap("validate")
+
+            # ===== 6.1 SEGUNDA PASSADA NAS QUESTÕES AMBÍGUAS/INVÁLIDAS =====
+            # Threshold por linha + busca de posição na retificada, sem nova foto
+            second_pass = self.reread_flagged_rows(warped, bubble_results, validated_results, version_str) if REREAD else []
+            timer.lap("reread")
             
             # ===== 7. DEFINICAO DA QUALIDADE DA LEITURA =====
             # Qualquer anomalia marca a prova para revisão humana invés de travar a API
@@ -247,6 +598,7 @@ class OMREngine:
                 
             needs_review = len(review_reasons) > 0
             quality = "review" if needs_review else "ok"
+            timer.lap("validate")
             
             # ===== 8. GERAÇÃO DE RETORNO OTIMIZADO E PADRONIZADO =====
             response = {
@@ -262,121 +614,301 @@ class OMREngine:
                 "anchors_detected": True,
                 "anchors_found": 4,
                 "qr_data": qr_data,
+                "qr_timings_ms": qr_timings,
+                "second_pass": second_pass,
                 "perspective_warning": perspective_quality.get("message", "")
             }
 
-            # ===== 9. SALVAR DIAGNÓSTICOS (DIAGNÓSTICOS PERMANENTES) =====
-            try:
-                # Criar pasta de auditoria estruturada
-                audit_dir = DEBUG_LOG_DIR / "auditoria"
-                audit_dir.mkdir(parents=True, exist_ok=True)
-                
-                timestamp = int(time.time())
-                prefix = f"{timestamp}_{'OK' if quality == 'ok' else 'CHECK'}"
-                
-                # Salvar Original
-                cv2.imwrite(str(audit_dir / f"{prefix}_0_orig.jpg"), img_original)
-                
-                # Salvar Warped (Retificada)
-                cv2.imwrite(str(audit_dir / f"{prefix}_1_warped.jpg"), warped)
-                
-                # Salvar Audit (Com marcações)
-                audit_map = self.generate_audit_map(warped, bubble_results, num_questions)
-                cv2.imwrite(str(audit_dir / f"{prefix}_2_audit.jpg"), audit_map)
-                
-                # Salvar Metadados JSON
-                with open(audit_dir / f"{prefix}_meta.json", 'w', encoding='utf-8') as f:
-                    json.dump(response, f, indent=4, default=str)
-                
-                logger.info(f"Auditoria salva em {audit_dir} (prefixo: {prefix})")
-            except Exception as e:
-                logger.error(f"Erro ao salvar auditoria física: {e}")
+            # ===== 9. SALVAR DIAGNÓSTICOS (AMOSTRADOS, GRAVADOS EM SEGUNDO PLANO) =====
+            audit_kind = 'OK' if quality == 'ok' else 'CHECK'
+            save_audit = audit_sink.should_sample(audit_kind)
             
-            if return_images:
+            inline_images = inline_images or not (return_images or return_audit)
+            buffer_warped = buffer_audit = None
+            if return_images or save_audit or not inline_images:
                 _, buffer_warped = cv2.imencode('.jpg', warped, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            timer.lap("encode")
+            if (return_audit and inline_images) or save_audit:
+                audit_map = self.generate_audit_map(warped, bubble_results, num_questions)
+                _, buffer_audit = cv2.imencode('.jpg', audit_map, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            timer.lap("audit_map")
+            
+            if save_audit:
+                # O original vai como foi recebido (sem reencode); metadados antes das imagens base64
+                prefix = audit_sink.submit(audit_kind, {
+                    f"0_orig{self._image_ext(image_buf)}": image_buf.tobytes(),
+                    "1_warped.jpg": buffer_warped.tobytes(),
+                    "2_audit.jpg": buffer_audit.tobytes(),
+                    "meta.json": dict(response),
+                })
+                if prefix:
+                    logger.info(f"Auditoria enfileirada em {AUDIT_DIR} (prefixo: {prefix})")
+            timer.lap("audit")
+            
+            if not inline_images:
+                # Imagens por referência: retificada e original gravadas uma vez, mapa só sob demanda
+                artifacts = {"processed": artifact_store.put(buffer_warped.tobytes())}
+                if return_images:
+                    ext = self._image_ext(image_buf)
+                    artifacts["original"] = artifact_store.put(image_buf.tobytes(), ext)
+                if return_audit:
+                    artifacts["audit"] = artifact_store.put_json({
+                        "warped": artifacts["processed"],
+                        "num_questions": num_questions,
+                        "questions": self._audit_manifest(bubble_results),
+                    })
+                if not return_images:
+                    # A retificada foi gravada só para o mapa de auditoria
+                    artifacts.pop("processed")
+                response["artifacts"] = artifacts
+                timer.lap("artifacts")
+            
+            elif return_images:
                 response["processed_image"] = f"data:image/jpeg;base64,{base64.b64encode(buffer_warped).decode('utf-8')}"
                 
-                # Original
-                response["original_image"] = f"data:image/jpeg;base64,{original_base64}"
+                # Original: os bytes recebidos, sem decodificar de novo nem reencodar
+                mime = "image/png" if self._image_ext(image_buf) == ".png" else "image/jpeg"
+                response["original_image"] = f"data:{mime};base64,{base64.b64encode(image_buf).decode('utf-8')}"
             
-            if return_audit:
-                # Se não geramos antes nos diagnósticos, gera agora
-                if 'audit_map' not in locals():
-                    audit_map = self.generate_audit_map(warped, bubble_results, num_questions)
-                _, buffer_audit = cv2.imencode('.jpg', audit_map, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            if return_audit and inline_images:
                 response["audit_map"] = f"data:image/jpeg;base64,{base64.b64encode(buffer_audit).decode('utf-8')}"
-            
-            # Limpar logs antigos para economizar espaço (Manter últimos 100)
-            self._cleanup_old_files(audit_dir, limit=300) # 300 arquivos = ~100 eventos (jpg+json)
-            self._cleanup_old_files(DEBUG_LOG_DIR, limit=50)
+            timer.lap("encode")
 
-            return response
+            return finish(response)
             
         except Exception as e:
             # Tentar salvar log de erro crítico se tivermos a imagem original
-            if 'img_original' in locals():
-                self._log_debug_event(img_original, f"Erro Crítico: {str(e)}")
-            return {"success": False, "error": f"Erro interno: {str(e)}"}
+            if 'img' in locals():
+                self._log_debug_event(image_buf, f"Erro Crítico: {str(e)}")
+            return finish({"success": False, "error": f"Erro interno: {str(e)}"}, "internal_error")
 
-    def _cleanup_old_files(self, directory: Path, limit: int = 100):
-        """
-        Mantém apenas os arquivos mais recentes no diretório.
-        """
-        try:
-            files = sorted(list(directory.glob("*")), key=lambda f: f.stat().st_mtime)
-            if len(files) > limit:
-                for i in range(len(files) - limit):
-                    f = files[i]
-                    if f.is_file():
-                        f.unlink()
-        except Exception as e:
-            logger.error(f"Erro ao limpar diretório {directory}: {e}")
+    @staticmethod
+    def _image_ext(buf) -> str:
+        """Extensão pelo cabeçalho do arquivo recebido (as câmeras mandam JPEG, o upload pode ser PNG)."""
+        return ".png" if bytes(buf[:4]) == b"\x89PNG" else ".jpg"
 
-    def _log_debug_event(self, image, message, context=None):
+    def _log_debug_event(self, image_buf, message, context=None):
         """
-        Salva imagem e log de erro para diagnóstico técnico.
+        Enfileira a imagem recebida (sem reencode) e o log de erro para diagnóstico técnico.
         """
         try:
-            timestamp = int(time.time())
-            event_id = f"fail_{timestamp}"
-            
-            # 1. Salvar Imagem
-            img_path = DEBUG_LOG_DIR / f"{event_id}.jpg"
-            cv2.imwrite(str(img_path), image)
-            
-            # 2. Salvar Log JSON
-            log_path = DEBUG_LOG_DIR / f"{event_id}.json"
             log_data = {
-                "timestamp": timestamp,
+                "timestamp": int(time.time()),
                 "message": message,
                 "context": context or {},
-                "image_file": img_path.name
             }
-            with open(log_path, 'w', encoding='utf-8') as f:
-                json.dump(log_data, f, indent=4)
-                
-            print(f"DEBUG_LOG: Evento salvo em {img_path}")
+            prefix = failure_sink.submit("fail", {
+                f"image{self._image_ext(image_buf)}": image_buf.tobytes(),
+                "log.json": log_data,
+            })
+            if prefix:
+                logger.info(f"DEBUG_LOG: Evento {prefix} enfileirado em {DEBUG_LOG_DIR}")
         except Exception as log_err:
             print(f"Erro ao salvar debug log: {log_err}")
 
-    def decode_qr(self, image):
+    # ===== INGESTÃO DE SCANNER (TIFF multipágina / várias folhas por imagem) =====
+    # Lado longo da imagem reduzida onde as âncoras das folhas são procuradas
+    SHEET_SEARCH_SIDE = 1600
+    # Abertura morfológica (px na imagem reduzida) antes de procurar os quadrados
+    SHEET_OPEN_KERNEL = 7
+    # Menor lado de uma âncora, em fração do lado longo da imagem (descarta módulos do QR, texto)
+    SHEET_ANCHOR_MIN_PCT = 0.005
+    # Inclinação máxima da aresta superior do quadrilátero (scanner/mesa: folhas quase retas)
+    SHEET_MAX_TILT_DEG = 15.0
+    # Erro máximo dos cantos inferiores previstos, em fração da largura do quadrilátero
+    SHEET_MAX_CORNER_ERR = 0.08
+
+    @staticmethod
+    def _is_tiff(buf) -> bool:
+        return bytes(buf[:4]) in (b"II*\x00", b"MM\x00*")
+
+    def _scan_page(self, image_buf, page: int):
+        """Página `page` do arquivo em cinza (só ela é decodificada), ou None se não existir."""
+        if self._is_tiff(image_buf):
+            ok, mats = cv2.imdecodemulti(image_buf, cv2.IMREAD_GRAYSCALE, range=(page, page + 1))
+            return mats[0] if ok and mats else None
+        if page > 0:
+            return None
+        return cv2.imdecode(image_buf, cv2.IMREAD_GRAYSCALE)
+
+    def find_sheet_quads(self, gray, layout_version: Optional[str] = None) -> List[np.ndarray]:
         """
-        Detecta e decodifica QR Codes na imagem usando OpenCV.
+        Localiza as folhas de uma imagem de scanner pelas âncoras: cada folha é um quadrilátero
+        de 4 quadrados pretos sólidos com a proporção do retângulo de âncoras do layout.
+        Retorna os cantos (TL, TR, BR, BL, float32, coordenadas da imagem) de cada folha,
+        em ordem de leitura (linhas de cima para baixo, esquerda para direita).
+        Só folhas em pé (inclinação até SHEET_MAX_TILT_DEG); não usa o filtro de cantos do
+        _anchor_candidate, que descartaria as âncoras internas de folhas lado a lado.
         """
+        layout = self.load_layout(layout_version or RADAR_LAYOUT)
+        dst = layout.warp_dst
+        aspect = float(np.linalg.norm(dst[1] - dst[0]) / np.linalg.norm(dst[3] - dst[0]))
+
+        # Escala fixa: o kernel e os limites de tamanho valem em pixels desta imagem reduzida
+        scale = min(1.0, self.SHEET_SEARCH_SIDE / max(gray.shape[:2]))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+        h, w = small.shape[:2]
+        _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        # A abertura separa a âncora do QR/cabeçalho quando encostam (folha girada, tinta espalhada)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (self.SHEET_OPEN_KERNEL, self.SHEET_OPEN_KERNEL))
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        # Quadrados sólidos: bolhas (círculos), finders do QR (anel) e a barra de calibração ficam de fora
+        min_side = max(self.SHEET_OPEN_KERNEL + 1, int(max(h, w) * self.SHEET_ANCHOR_MIN_PCT))
+        centers, sides = [], []
+        for cnt in contours:
+            x, y, bw, bh = cv2.boundingRect(cnt)
+            if min(bw, bh) < min_side or not 0.7 <= bw / bh <= 1.4:
+                continue
+            if cv2.countNonZero(binary[y:y + bh, x:x + bw]) < 0.85 * bw * bh:
+                continue
+            centers.append((x + bw / 2, y + bh / 2))
+            sides.append((bw + bh) / 2)
+        if len(centers) < 4:
+            return []
+        pts = np.array(centers, dtype=np.float32)
+        sides_arr = np.array(sides, dtype=np.float32)
+
+        # Cada par (TL, TR) prevê onde estão BL e BR; fica o quadrilátero se os dois existirem
+        max_tilt = math.tan(math.radians(self.SHEET_MAX_TILT_DEG))
+        found = []
+        for a in range(len(pts)):
+            for b in range(len(pts)):
+                v = pts[b] - pts[a]
+                length = float(np.hypot(*v))
+                if v[0] <= 0 or abs(v[1]) > v[0] * max_tilt or length < 8 * sides_arr[a]:
+                    continue
+                down = np.array([-v[1], v[0]], dtype=np.float32) / aspect
+                corners = [a, b]
+                err = 0.0
+                for predicted in (pts[b] + down, pts[a] + down):
+                    dist = np.hypot(*(pts - predicted).T)
+                    nearest = int(np.argmin(dist))
+                    corners.append(nearest)
+                    err = max(err, float(dist[nearest]) / length)
+                quad_sides = sides_arr[corners]
+                if err <= self.SHEET_MAX_CORNER_ERR and len(set(corners)) == 4 and quad_sides.max() <= 1.6 * quad_sides.min():
+                    found.append((err, corners))
+
+        # Menor erro primeiro; cada âncora pertence a uma folha só
+        quads, used = [], set()
+        for err, corners in sorted(found):
+            if used.isdisjoint(corners):
+                used.update(corners)
+                quads.append((pts[corners] + 0.5) / scale - 0.5)
+        quads.sort(key=lambda q: (round(float(q[:, 1].mean()) / max(1.0, float(np.ptp(q[:, 1])))), float(q[:, 0].mean())))
+        return quads
+
+    def split_scan(self, image, page: int = 0, layout_version: Optional[str] = None) -> Optional[List[bytes]]:
+        """
+        Folhas da página `page` de um arquivo de scanner (TIFF multipágina ou imagem única com
+        uma ou mais folhas), cada uma pronta para o process_image. Decodifica só essa página.
+        Cada folha é recortada pela página inteira do layout (a região do QR fica fora das
+        âncoras) e gravada em PNG. Uma imagem comum com uma folha (ou nenhuma achada) volta
+        como veio, sem reencode: o process_image dá o diagnóstico de sempre.
+        Retorna None quando a página não existe (fim do arquivo).
+        """
+        image_buf = self._image_buffer(image)
+        tiff = self._is_tiff(image_buf)
+        gray = self._scan_page(image_buf, page)
+        if gray is None:
+            # Arquivo ilegível: vai inteiro para o process_image, que o rejeita com a mensagem padrão
+            return [image_buf.tobytes()] if page == 0 else None
+
+        quads = self.find_sheet_quads(gray, layout_version)
+        if not tiff and len(quads) <= 1:
+            return [image_buf.tobytes()]
+        if not quads:
+            return [cv2.imencode(".png", gray, [cv2.IMWRITE_PNG_COMPRESSION, 1])[1].tobytes()]
+
+        layout = self.load_layout(layout_version or RADAR_LAYOUT)
+        canvas = np.array([[0, 0], [layout.width, 0], [layout.width, layout.height], [0, layout.height]], np.float32)
+        H, W = gray.shape[:2]
+        sheets = []
+        for quad in quads:
+            # Contorno da página = cantos do canvas do layout levados de volta para a imagem
+            M = cv2.getPerspectiveTransform(layout.warp_dst, quad)
+            outline = cv2.perspectiveTransform(canvas[None], M)[0]
+            x1, y1 = np.floor(outline.min(axis=0)).astype(int)
+            x2, y2 = np.ceil(outline.max(axis=0)).astype(int)
+            pad_x, pad_y = (x2 - x1) // 50, (y2 - y1) // 50
+            crop = gray[max(0, y1 - pad_y):min(H, y2 + pad_y), max(0, x1 - pad_x):min(W, x2 + pad_x)]
+            sheets.append(cv2.imencode(".png", crop, [cv2.IMWRITE_PNG_COMPRESSION, 1])[1].tobytes())
+        return sheets
+
+    def decode_qr(self, image, rect=None, layout=None, timings=None):
+        """
+        Detecta e decodifica o QR Code.
+        Com `rect` (âncoras ordenadas TL, TR, BR, BL) e um layout com `qr_region`, tenta antes
+        só a região do QR retificada; a imagem inteira fica como último recurso.
+        Em cada região tenta pyzbar (mais rápido) e depois o QRCodeDetector do OpenCV.
+        `timings` (dict opcional) recebe o tempo em ms de cada estratégia tentada.
+        """
+        if timings is None:
+            timings = {}
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        regions = []
+        if rect is not None and isinstance(layout, CompiledLayout) and layout.qr_region is not None:
+            regions.append(("region", lambda: self._warp_qr_region(gray, rect, layout)))
+        regions.append(("full", lambda: gray))
+
+        for region_name, get_region in regions:
+            t0 = time.perf_counter()
+            region = get_region()
+            if region_name != "full":
+                timings[f"{region_name}_warp"] = round((time.perf_counter() - t0) * 1000, 2)
+
+            for decoder_name, decoder in (("pyzbar", self._decode_qr_pyzbar), ("opencv", self._decode_qr_opencv)):
+                if decoder_name == "pyzbar" and pyzbar is None:
+                    continue
+                t0 = time.perf_counter()
+                data = decoder(region)
+                timings[f"{region_name}_{decoder_name}"] = round((time.perf_counter() - t0) * 1000, 2)
+                if data:
+                    logger.debug(f"QR Code lido via {region_name}_{decoder_name}: {timings}")
+                    return self._parse_qr(data)
+
+        logger.debug(f"QR Code não encontrado: {timings}")
+        return None
+
+    def _warp_qr_region(self, gray, rect, layout: CompiledLayout):
+        """Retifica só a região do QR (em QR_REGION_SCALE x o warp) e adiciona zona de silêncio."""
+        x, y, w, h = cast(tuple, layout.qr_region)
+        dst = (layout.warp_dst - np.float32([x, y])) * QR_REGION_SCALE
+        M = cv2.getPerspectiveTransform(np.asarray(rect, dtype=np.float32), dst)
+        size = (int(w * QR_REGION_SCALE), int(h * QR_REGION_SCALE))
+        region = cv2.warpPerspective(gray, M, size, flags=cv2.INTER_LINEAR, borderValue=255)
+        q = QR_QUIET_ZONE_PX
+        return cv2.copyMakeBorder(region, q, q, q, q, cv2.BORDER_CONSTANT, value=255)
+
+    def _decode_qr_pyzbar(self, gray):
         try:
-            detector = cv2.QRCodeDetector()
-            # O detector retorna: (data, bbox, straight_qrcode)
-            data, bbox, _ = detector.detectAndDecode(image)
-            
-            if data:
-                try:
-                    return json.loads(data)
-                except:
-                    return data
+            symbols = pyzbar.decode(gray, symbols=[pyzbar.ZBarSymbol.QRCODE])
+            return symbols[0].data.decode("utf-8") if symbols else None
+        except Exception as e:
+            logger.warning(f"Erro ao decodificar QR Code (pyzbar): {e}")
             return None
+
+    def _decode_qr_opencv(self, gray):
+        try:
+            detector = getattr(self._local, "qr_detector", None)
+            if detector is None:
+                detector = self._local.qr_detector = cv2.QRCodeDetector()
+            # O detector retorna: (data, bbox, straight_qrcode)
+            data, _, _ = detector.detectAndDecode(gray)
+            return data or None
         except Exception as e:
             print(f"Erro ao decodificar QR Code (OpenCV): {e}")
             return None
+
+    @staticmethod
+    def _parse_qr(data):
+        try:
+            return json.loads(data)
+        except (ValueError, TypeError):
+            return data
     
     def _validate_perspective_quality(self, rect_points, img_shape):
         """
@@ -431,106 +963,273 @@ class OMREngine:
                 "perspective_score": 0.0
             }
 
-    
-    def detect_anchors_robust(self, thresh, gray):
+    # Pré-triagem (miniatura de PRECHECK_SIDE px no lado longo). Limites conservadores, calibrados
+    # no corpus sintético: nenhuma folha clean/phone/hard é barrada, só fotos que o pipeline
+    # completo também não leria (ou leria com respostas erradas).
+    PRECHECK_SIDE = 400
+    PRECHECK_MIN_PAPER = 50         # p95 do brilho: abaixo disso o papel está escuro demais
+    PRECHECK_MAX_INK = 95           # p2 do brilho: acima disso nem a tinta fica escura (estourada)
+    PRECHECK_MAX_CLIPPED = 0.5      # ... junto com esta fração de pixels saturados (>= 250)
+    PRECHECK_SHARP_EDGES = 1000.0   # ... e bordas nítidas (o desfoque também clareia a tinta)
+    PRECHECK_MIN_COVERAGE = 0.2     # fração do quadro ocupada pela maior região clara (a folha)
+    PRECHECK_MIN_SHARPNESS = 15.0   # variância do Laplaciano normalizada pelo brilho do papel
+
+    PRECHECK_MESSAGES = {
+        "too_dark": "Foto muito escura. Procure um lugar mais iluminado e tire a foto de novo.",
+        "overexposed": "Foto estourada ou com reflexo forte. Evite o flash e a luz direta sobre a folha.",
+        "sheet_not_found": "Folha não encontrada ou muito distante. Aproxime o celular para a folha ocupar a tela.",
+        "too_blurry": "Foto tremida ou fora de foco. Segure o celular firme e espere focar antes de tirar.",
+    }
+
+    def assess_image_quality(self, gray) -> Dict[str, Any]:
         """
-        Versão Profissional: Suporta âncoras circulares (legado) e quadradas (novas).
+        Pré-triagem barata (poucos ms) numa miniatura da foto em cinza, antes do pipeline
+        completo: brilho do papel e da tinta (histograma), cobertura da folha e nitidez
+        (variância do Laplaciano). Fotos sem chance de leitura são rejeitadas aqui em vez de
+        passar pelas estratégias de âncoras e pelos fallbacks do QR (centenas de ms).
+
+        Retorna:
+            dict: {"reason": str | None, "paper": p95, "ink": p2, "clipped": fração,
+                   "coverage": fração, "sharpness": float}
         """
-        H, W = thresh.shape[:2]
-        total_area = H * W
+        # Fator inteiro e recorte múltiplo dele: o INTER_AREA cai no caminho rápido (média de blocos)
+        k = max(1, max(gray.shape[:2]) // self.PRECHECK_SIDE)
+        h, w = gray.shape[0] // k, gray.shape[1] // k
+        thumb = cv2.resize(gray[:h * k, :w * k], (w, h), interpolation=cv2.INTER_AREA) if k > 1 else gray
+
+        hist = cv2.calcHist([thumb], [0], None, [256], [0, 256]).ravel()
+        cdf = np.cumsum(hist) / thumb.size
+        ink = int(np.searchsorted(cdf, 0.02))
+        paper = int(np.searchsorted(cdf, 0.95))
+        clipped = float(hist[250:].sum() / thumb.size)
+
+        # Folha = maior região clara depois do Otsu (fundo escuro da mesa fica de fora)
+        _, bright = cv2.threshold(cv2.GaussianBlur(thumb, (5, 5), 0), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        n, _, stats, _ = cv2.connectedComponentsWithStats(bright)
+        coverage = float(stats[1:, cv2.CC_STAT_AREA].max() / thumb.size) if n > 1 else 0.0
+
+        # Normaliza pelo brilho do papel: uma foto escura (mas legível) tem menos contraste, não menos foco
+        sharpness = float(cv2.Laplacian(thumb, cv2.CV_32F).var()) * (255.0 / max(paper, 1)) ** 2
+
+        reason = None
+        if paper < self.PRECHECK_MIN_PAPER:
+            reason = "too_dark"
+        elif (ink > self.PRECHECK_MAX_INK and clipped > self.PRECHECK_MAX_CLIPPED
+              and sharpness >= self.PRECHECK_SHARP_EDGES):
+            reason = "overexposed"
+        elif coverage < self.PRECHECK_MIN_COVERAGE:
+            reason = "sheet_not_found"
+        elif sharpness < self.PRECHECK_MIN_SHARPNESS:
+            reason = "too_blurry"
+        return {
+            "reason": reason,
+            "paper": paper,
+            "ink": ink,
+            "clipped": round(clipped, 3),
+            "coverage": round(coverage, 3),
+            "sharpness": round(sharpness, 1),
+        }
+
+    # Fatores de redução suportados pelo imdecode (IMREAD_REDUCED_GRAYSCALE_2/4/8)
+    _REDUCED_FLAGS = {
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    }
+    # Menor lado longo aceitável para a busca grossa (abaixo disso as âncoras ficam pequenas demais)
+    COARSE_MIN_SIDE = 800
+
+    def _pyramid_factor(self, h, w):
+        """Maior fator de redução que mantém o lado longo >= COARSE_MIN_SIDE (1 = sem redução)."""
+        for factor in (8, 4, 2):
+            if max(h, w) / factor >= self.COARSE_MIN_SIDE:
+                return factor
+        return 1
+
+    def detect_anchors_coarse_to_fine(self, image_buf, prep: PreprocessCache):
+        """
+        Detecção em duas etapas:
+          1. Grossa: detect_anchors_robust numa versão reduzida decodificada direto do JPEG
+             (IMREAD_REDUCED_GRAYSCALE_N), onde o threshold adaptativo custa 1/N² do original.
+          2. Fina: cada âncora é refinada numa janela pequena em resolução cheia.
+        Retorna [] se a imagem já é pequena demais para reduzir ou se a etapa grossa
+        não achar as 4 âncoras: o chamador segue com detect_anchors_robust em `prep`.
+        """
+        gray = prep.gray
+        H, W = gray.shape[:2]
+        factor = self._pyramid_factor(H, W)
+        if factor == 1:
+            return []
+
+        coarse = cv2.imdecode(image_buf, self._REDUCED_FLAGS[factor])
+        if coarse is None:
+            return []
+        anchors = self.detect_anchors_robust(PreprocessCache(gray=coarse, scope="coarse"))
+        if len(anchors) != 4:
+            return []
+
+        # Escala real (o imdecode arredonda o tamanho reduzido para cima)
+        sx = W / coarse.shape[1]
+        sy = H / coarse.shape[0]
+        half = max(16, int(max(H, W) * 0.03))
+        tol = 3 * max(sx, sy)
+
+        refined = []
+        for (cx, cy) in anchors:
+            # Centro do pixel reduzido mapeado para a imagem cheia
+            x = (cx + 0.5) * sx - 0.5
+            y = (cy + 0.5) * sy - 0.5
+            point = self._refine_anchor(gray, x, y, half, tol)
+            refined.append(point if point is not None else (int(round(x)), int(round(y))))
+        return refined
+
+    def _refine_anchor(self, gray, x, y, half, tol):
+        """
+        Refina a posição de uma âncora numa janela (2*half)² em resolução cheia.
+        Usa Otsu local e o mesmo critério de centro do detect_anchors_robust.
+        Retorna None se não houver contorno confiável a até `tol` px da estimativa grossa.
+        """
+        H, W = gray.shape[:2]
+        x1, y1 = max(0, int(x - half)), max(0, int(y - half))
+        x2, y2 = min(W, int(x + half) + 1), min(H, int(y + half) + 1)
+        window = gray[y1:y2, x1:x2]
+        if window.size == 0:
+            return None
+
+        _, bw = cv2.threshold(window, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(bw, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        px, py = float(x - x1), float(y - y1)
+        best, best_dist = None, tol
+        for cnt in contours:
+            # Distância assinada: <= 0 quando o ponto grosso está dentro do contorno
+            dist = -cv2.pointPolygonTest(cnt, (px, py), True)
+            if dist <= best_dist:
+                best, best_dist = cnt, dist
+        if best is None:
+            return None
+
+        # Contorno ocupando quase toda a janela = fundo escuro, não a âncora
+        if cv2.contourArea(best) > 0.6 * window.size:
+            return None
+
+        peri = cv2.arcLength(best, True)
+        approx = cv2.approxPolyDP(best, 0.04 * peri, True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            bx, by, bw_, bh_ = cv2.boundingRect(best)
+            fx, fy = bx + bw_ // 2, by + bh_ // 2
+        else:
+            M = cv2.moments(best)
+            if M["m00"] == 0:
+                return None
+            fx, fy = int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])
+
+        # Um deslocamento grande indica que a âncora se fundiu com outra mancha (ex: QR Code)
+        if abs(fx - px) > tol or abs(fy - py) > tol:
+            return None
+        return (x1 + fx, y1 + fy)
+
+    def _anchor_candidate(self, cnt, gray, min_anchor_area, max_anchor_area):
+        """
+        Filtros de forma, posição e densidade de um contorno candidato a âncora.
+        Retorna {"cx", "cy", "area", "score"} ou None. O contorno deve estar em
+        coordenadas da imagem `gray` inteira (use offset no findContours de janelas).
+        """
+        H, W = gray.shape[:2]
+        area = cv2.contourArea(cnt)
+        # Relaxar para radar/preview e evitar falsos negativos usando limites proporcionais
+        if area < min_anchor_area or area > max_anchor_area: 
+            return None
         
-        # blockSize deve ser ímpar e proporcional à largura da imagem
-        block_size = int(W / 35)
-        if block_size % 2 == 0: block_size += 1
-        block_size = max(3, block_size)
-
-        # Usar adaptiveThreshold no lugar de um valor duro de 70 para garantir suporte a múltiplas iluminações
-        strict_thresh = cv2.adaptiveThreshold(
-            gray, 255, 
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY_INV, 
-            block_size, 10
-        )
+        # Filtro de Forma: Circularidade ou Quadrado
+        circ = _circularity(cnt)
         
-        contours, _ = cv2.findContours(strict_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        candidates = []
+        # Checar se é aproximadamente um retângulo/quadrado
+        peri = cv2.arcLength(cnt, True)
+        approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
+        is_square = len(approx) == 4 and cv2.isContourConvex(approx)
 
-        # Limites relativos para o tamanho das âncoras (0.005% a 2% da imagem)
-        min_anchor_area = total_area * 0.00005
-        max_anchor_area = total_area * 0.02
+        # Aceita se for redondo o suficiente OU um quadrado robusto
+        if circ < 0.50 and not is_square: # Reduzido circ de 0.65 para 0.50 para tolerar estiramento da câmera
+            return None
 
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            # Relaxar para radar/preview e evitar falsos negativos usando limites proporcionais
-            if area < min_anchor_area or area > max_anchor_area: 
-                continue
+        M = cv2.moments(cnt)
+        if M["m00"] == 0:
+            return None
+        cX = int(M["m10"] / M["m00"])
+        cY = int(M["m01"] / M["m00"])
+        
+        # Priorizar o centro do bounding box para quadrados
+        if is_square:
+            x, y, w, h = cv2.boundingRect(cnt)
+            cX, cY = x + w//2, y + h//2
             
-            # Filtro de Forma: Circularidade ou Quadrado
-            circ = _circularity(cnt)
+        # Margem relaxada: as âncoras agora podem estar mais longe das bordas 
+        # já que cercam apenas o gabarito e não a folha toda.
+        # Margem mais rigorosa para reduzir falsos positivos (0.28 industrial)
+        margin = 0.28 
+        valid = (
+            (cX < W*margin and cY < H*margin) or
+            (cX > W*(1-margin) and cY < H*margin) or
+            (cX > W*(1-margin) and cY > H*(1-margin)) or
+            (cX < W*margin and cY > H*(1-margin))
+        )
+        if not valid:
+            return None
+
+        # Filtros Robustos Extras
+        # 1. Aspect Ratio (Quadrados/Círculos devem ser próximos a 1:1)
+        x, y, w, h = cv2.boundingRect(cnt)
+        aspect_ratio = float(w) / float(h)
+        if aspect_ratio < 0.7 or aspect_ratio > 1.4:
+            return None
             
-            # Checar se é aproximadamente um retângulo/quadrado
-            peri = cv2.arcLength(cnt, True)
-            approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
-            is_square = len(approx) == 4 and cv2.isContourConvex(approx)
+        # 2. Densidade Interna (Deve ser bem preto)
+        # Criamos uma máscara local para o ROI da âncora (só o bounding box, não a imagem toda)
+        roi_mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.drawContours(roi_mask, [cnt], -1, 255, -1, offset=(-x, -y))
+        mean_val = cv2.mean(gray[y:y + h, x:x + w], mask=roi_mask)[0]
+        # O fundo é ~200+, preto é <100.
+        # Relaxar para 125 no preview/geral para suportar borrões leves
+        if mean_val > 125:
+            return None
 
-            # Aceita se for redondo o suficiente OU um quadrado robusto
-            if circ < 0.50 and not is_square: # Reduzido circ de 0.65 para 0.50 para tolerar estiramento da câmera
-                continue
+        # 3. Distância Euclidiana ao Canto Esperado (Score Bonus)
+        # Definir cantos alvos
+        targets = [ (0,0), (W,0), (W,H), (0,H) ]
+        dists = [np.sqrt((cX-tx)**2 + (cY-ty)**2) for tx, ty in targets]
+        min_dist = min(dists)
+        dist_score = 1.0 / (1.0 + min_dist/100.0) # Bonus que decai com a distância
 
-            M = cv2.moments(cnt)
-            if M["m00"] == 0:
-                continue
-            cX = int(M["m10"] / M["m00"])
-            cY = int(M["m01"] / M["m00"])
-            
-            # Priorizar o centro do bounding box para quadrados
-            if is_square:
-                x, y, w, h = cv2.boundingRect(cnt)
-                cX, cY = x + w//2, y + h//2
-                
-            # Margem relaxada: as âncoras agora podem estar mais longe das bordas 
-            # já que cercam apenas o gabarito e não a folha toda.
-            # Margem mais rigorosa para reduzir falsos positivos (0.28 industrial)
-            margin = 0.28 
-            valid = (
-                (cX < W*margin and cY < H*margin) or
-                (cX > W*(1-margin) and cY < H*margin) or
-                (cX > W*(1-margin) and cY > H*(1-margin)) or
-                (cX < W*margin and cY > H*(1-margin))
-            )
-            if not valid:
-                continue
+        return {
+            "cx": cX, 
+            "cy": cY, 
+            "area": area, 
+            "score": (max(circ, 0.9 if is_square else 0) * 0.7) + (dist_score * 0.3)
+        }
 
-            # Filtros Robustos Extras
-            # 1. Aspect Ratio (Quadrados/Círculos devem ser próximos a 1:1)
-            x, y, w, h = cv2.boundingRect(cnt)
-            aspect_ratio = float(w) / float(h)
-            if aspect_ratio < 0.7 or aspect_ratio > 1.4:
-                continue
-                
-            # 2. Densidade Interna (Deve ser bem preto)
-            # Criamos uma máscara local para o ROI da âncora
-            roi_mask = np.zeros(thresh.shape, dtype=np.uint8)
-            cv2.drawContours(roi_mask, [cnt], -1, 255, -1)
-            mean_val = cv2.mean(gray, mask=roi_mask)[0]
-            # O fundo é ~200+, preto é <100.
-            # Relaxar para 125 no preview/geral para suportar borrões leves
-            if mean_val > 125:
-                continue
+    def detect_anchors_robust(self, prep: PreprocessCache, strategy: str = "strict"):
+        """
+        Versão Profissional: Suporta âncoras circulares (legado) e quadradas (novas).
+        `strategy` escolhe a binarização do PreprocessCache onde os contornos são buscados
+        ("strict" = adaptativo W/35 sobre o gray, "adaptive" = CLAHE+blur bloco 31, "otsu").
+        """
+        gray = prep.gray
+        H, W = gray.shape[:2]
+        total_area = H * W
+        binary = prep.binary(strategy)
+        
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        candidates = []
 
-            # 3. Distância Euclidiana ao Canto Esperado (Score Bonus)
-            # Definir cantos alvos
-            targets = [ (0,0), (W,0), (W,H), (0,H) ]
-            dists = [np.sqrt((cX-tx)**2 + (cY-ty)**2) for tx, ty in targets]
-            min_dist = min(dists)
-            dist_score = 1.0 / (1.0 + min_dist/100.0) # Bonus que decai com a distância
-
-            candidates.append({
-                "cx": cX, 
-                "cy": cY, 
-                "area": area, 
-                "score": (max(circ, 0.9 if is_square else 0) * 0.7) + (dist_score * 0.3)
-            })
+        # Limites relativos para o tamanho das âncoras (0.005% a 2% da imagem)
+        min_anchor_area = total_area * 0.00005
+        max_anchor_area = total_area * 0.02
+
+        for cnt in contours:
+            candidate = self._anchor_candidate(cnt, gray, min_anchor_area, max_anchor_area)
+            if candidate is not None:
+                candidates.append(candidate)
 
         if len(candidates) < 4:
             return []
@@ -559,34 +1258,99 @@ class OMREngine:
 
         return final_anchors
 
-    def detect_anchors_only(self, image_base64):
+    def track_anchors(self, gray, track: Dict[str, Any]):
+        """
+        Rastreamento temporal do radar: procura cada âncora só numa janela em volta da
+        posição do frame anterior (`track["anchors"]`), com o mesmo threshold e os mesmos
+        filtros do detect_anchors_robust. Retorna [(x, y, área)] nas 4 posições, ou []
+        se alguma âncora sumiu, mudou muito de tamanho ou o quadrilátero ficou inválido
+        (o chamador volta para a detecção completa).
+        """
+        H, W = gray.shape[:2]
+        previous = track.get("anchors") or []
+        if len(previous) != 4:
+            return []
+        prev_areas = track.get("areas") or [None] * 4
+
+        half = max(12, int(max(H, W) * TRACK_WINDOW_PCT))
+        block_size = max(3, int(W / 35) | 1)  # Mesmo bloco do PreprocessCache.strict
+        min_anchor_area = H * W * 0.00005
+        max_anchor_area = H * W * 0.02
+
+        tracked = []
+        for (px, py), prev_area in zip(previous, prev_areas):
+            x1, y1 = max(0, int(px - half)), max(0, int(py - half))
+            x2, y2 = min(W, int(px + half) + 1), min(H, int(py + half) + 1)
+            window = gray[y1:y2, x1:x2]
+            if min(window.shape[:2]) <= block_size:
+                return []
+
+            bw = cv2.adaptiveThreshold(window, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, block_size, 10)
+            contours, _ = cv2.findContours(bw, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x1, y1))
+
+            best, best_dist = None, float(half)
+            for cnt in contours:
+                candidate = self._anchor_candidate(cnt, gray, min_anchor_area, max_anchor_area)
+                if candidate is None:
+                    continue
+                if prev_area and not (0.5 < candidate["area"] / prev_area < 2.0):
+                    continue  # Outra mancha (ex: QR Code) ou âncora cortada pela janela
+                dist = math.hypot(candidate["cx"] - px, candidate["cy"] - py)
+                if dist <= best_dist:
+                    best, best_dist = candidate, dist
+            if best is None:
+                return []
+            tracked.append((best["cx"], best["cy"], best["area"]))
+
+        # O quadrilátero deve continuar convexo e com área parecida com a do frame anterior
+        quad = np.array([(x, y) for x, y, _ in tracked], dtype=np.float32)
+        prev_quad = np.array(previous, dtype=np.float32)
+        if not cv2.isContourConvex(quad):
+            return []
+        prev_area = cv2.contourArea(prev_quad)
+        if prev_area <= 0 or not (0.6 < cv2.contourArea(quad) / prev_area < 1.6):
+            return []
+        return tracked
+
+    def detect_anchors_only(self, image, track: Optional[Dict[str, Any]] = None):
         """
         Detecta âncoras rapidamente para feedback em tempo real (Modo Alinhamento).
         Preserva a proporção (aspect ratio) da imagem e retorna coordenadas RELATIVAS (0.0 a 1.0),
         permitindo ao Frontend desenhar o polígono SVG perfeitamente por cima do videoRef.
+
+        `image` pode ser JPEG/PNG (bytes ou base64) ou um np.ndarray já em tons de cinza.
+        `track` é o estado devolvido no frame anterior da mesma sessão (campo "track" da
+        resposta). Com ele, as âncoras são só rastreadas em janelas pequenas e o QR já lido
+        não é decodificado de novo; se o rastreamento falhar, cai na detecção completa.
         """
         try:
-            img_data = base64.b64decode(image_base64.split(',')[-1])
-            np_img = np.frombuffer(img_data, np.uint8)
-            image = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+            if isinstance(image, np.ndarray):
+                # Frame já em tons de cinza (WebSocket do radar): nada a decodificar
+                image_buf, gray = None, image
+            else:
+                image_buf = self._image_buffer(image)
+                # O radar só precisa do gray: decodifica direto, sem passar pelo BGR
+                gray = cv2.imdecode(image_buf, cv2.IMREAD_GRAYSCALE)
 
-            if image is None:
+            if gray is None:
                 return {"success": False, "error": "Imagem inválida"}
             
-            H, W = image.shape[:2]
+            H, W = gray.shape[:2]
+            prep = PreprocessCache(gray=gray)
 
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            
-            # Cálculo do blockSize proporcional para o radar
-            block_size = int(W / 35)
-            if block_size % 2 == 0: block_size += 1
-            block_size = max(3, block_size)
-            
-            # Sincronizar com o filtro industrial robusto contra sombras
-            thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, block_size, 10)
+            anchors, areas, tracking = [], [None] * 4, "detected"
+            if track and track.get("size") == [W, H]:
+                tracked = self.track_anchors(gray, track)
+                if tracked:
+                    anchors = [(x, y) for x, y, _ in tracked]
+                    areas = [a for _, _, a in tracked]
+                    tracking = "locked"
 
-            anchors = self.detect_anchors_robust(thresh, gray)
+            if not anchors:
+                # Frames pequenos do radar vão direto para a resolução cheia; fotos grandes usam a pirâmide
+                anchors = self.detect_anchors_coarse_to_fine(image_buf, prep) if image_buf is not None else []
+                if len(anchors) != 4:
+                    anchors = self.detect_anchors_robust(prep)
             
             if len(anchors) == 4:
                 # Retornar coordenadas relativas (0 a 1)
@@ -594,22 +1358,35 @@ class OMREngine:
                 for (x, y) in anchors:
                     rel_anchors.append([round(x / W, 4), round(y / H, 4)])
                 
-                # Tentar decodificar QR Code para feedback de identidade (Instant Identity)
-                qr_data = self.decode_qr(image)
+                # Tentar decodificar QR Code para feedback de identidade (Instant Identity).
+                # Com a folha travada, a identidade lida antes continua valendo.
+                qr_data = track.get("qr_data") if tracking == "locked" else None
+                if qr_data is None:
+                    rect = self.order_points(np.array(anchors, dtype=np.float32))
+                    qr_data = self.decode_qr(prep.gray, rect, self.layout_cache.get(RADAR_LAYOUT))
                 
                 return {
                     "success": True,
                     "anchors_found": 4,
                     "anchors": rel_anchors,
                     "confidence": 0.95,
-                    "qr_data": qr_data
+                    "qr_data": qr_data,
+                    "tracking": tracking,
+                    "track": {
+                        "anchors": [[int(x), int(y)] for (x, y) in anchors],
+                        "areas": areas,
+                        "size": [W, H],
+                        "qr_data": qr_data,
+                    },
                 }
             
             return {
                 "success": False, 
                 "anchors_found": len(anchors), 
                 "confidence": 0.0,
-                "anchors": [[round(x / W, 4), round(y / H, 4)] for (x, y) in (anchors if anchors else [])]
+                "anchors": [[round(x / W, 4), round(y / H, 4)] for (x, y) in (anchors if anchors else [])],
+                "tracking": "lost",
+                "track": None,
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -637,7 +1414,7 @@ class OMREngine:
 
     def validate_warped_anchors(self, warped, layout=None):
         """Validação secundária: as âncoras devem estar nas posições de offset do warped."""
-        gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
+        gray = warped if warped.ndim == 2 else cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
         _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
         
         h_w, w_w = warped.shape[:2]
@@ -700,6 +1477,10 @@ class OMREngine:
     
     def four_point_transform(self, image, rect, layout=None):
         """Aplica transformação de perspectiva (homografia) usando centros das âncoras como destino"""
+        if isinstance(layout, CompiledLayout):
+            M = cv2.getPerspectiveTransform(rect, layout.warp_dst)
+            return cv2.warpPerspective(image, M, (layout.width, layout.height))
+
         # Se não houver layout (legado), usa os cantos do canvas
         offsets = layout.get("anchor_offsets_pct", {"x": 0.0, "y": 0.0}) if layout else {"x": 0.0, "y": 0.0}
         
@@ -721,6 +1502,73 @@ class OMREngine:
         
         return warped
 
+    def _bubble_masks(self, roi_h, roi_w):
+        """
+        Máscaras do disco central e do anel de fundo para um ROI (roi_h x roi_w),
+        desenhadas exatamente como em _masked_ratio e cacheadas por tamanho.
+        Retorna (matriz [roi_h*roi_w, 2] float32 com as duas máscaras, áreas [2]).
+        """
+        key = (int(roi_h), int(roi_w))
+        cached = self._bubble_mask_cache.get(key)
+        if cached is not None:
+            return cached
+
+        H, W = key
+        center = (W // 2, H // 2)
+        radius_inner = int(min(W, H) * 0.35)
+        radius_outer = int(min(W, H) * 0.48)
+
+        mask_inner = np.zeros((H, W), dtype=np.uint8)
+        cv2.circle(mask_inner, center, radius_inner, 255, -1)
+
+        mask_outer = np.zeros((H, W), dtype=np.uint8)
+        cv2.circle(mask_outer, center, radius_outer, 255, -1)
+        cv2.circle(mask_outer, center, radius_inner + 2, 0, -1)
+
+        masks = np.stack([mask_inner.ravel() > 0, mask_outer.ravel() > 0], axis=1).astype(np.float32)
+        areas = masks.sum(axis=0)
+        self._bubble_mask_cache[key] = (masks, areas)
+        return masks, areas
+
+    def _score_bubbles(self, thresh, coords):
+        """
+        Calcula (fill_ratio, bg_ratio) de todas as bolhas de uma vez.
+        coords: array int [N, 4] com (x1, y1, x2, y2) de cada ROI.
+        ROIs com o tamanho nominal são empilhados em um único array [N, h, w] e
+        reduzidos com um produto matricial contra as máscaras pré-calculadas;
+        ROIs cortados pela borda da imagem (raros) caem no caminho por bolha.
+        """
+        coords = np.asarray(coords, dtype=np.int32).reshape(-1, 4)
+        n = coords.shape[0]
+        ratios = np.zeros((n, 2), dtype=np.float32)
+        if n == 0:
+            return ratios
+
+        widths = coords[:, 2] - coords[:, 0]
+        heights = coords[:, 3] - coords[:, 1]
+        roi_w, roi_h = int(widths.max()), int(heights.max())
+        img_h, img_w = thresh.shape[:2]
+        full = (
+            (widths == roi_w) & (heights == roi_h) &
+            (coords[:, 0] + roi_w <= img_w) & (coords[:, 1] + roi_h <= img_h)
+        )
+
+        if roi_w > 0 and roi_h > 0 and full.any():
+            idx = np.flatnonzero(full)
+            # Janela deslizante é só uma view; a indexação copia os k ROIs de uma vez
+            windows = sliding_window_view(thresh, (roi_h, roi_w))
+            stack = windows[coords[idx, 1], coords[idx, 0]]  # [k, roi_h, roi_w]
+
+            masks, areas = self._bubble_masks(roi_h, roi_w)
+            counts = (stack.reshape(len(idx), -1) > 0).astype(np.float32) @ masks
+            ratios[idx] = np.divide(counts, areas, out=np.zeros_like(counts), where=areas > 0)
+
+        for i in np.flatnonzero(~full):
+            x1, y1, x2, y2 = coords[i]
+            ratios[i] = self._masked_ratio(thresh[y1:y2, x1:x2])
+
+        return ratios
+
     def _masked_ratio(self, roi):
         """
         Mede a densidade de pixels pretos usando uma máscara circular perfeita 
@@ -765,7 +1613,7 @@ class OMREngine:
             x1 = int(W * (2.0/180.0))
             x2 = int(W * (4.0/180.0))
             roi_strip = warped[int(H*0.2):int(H*0.8), x1:x2]
-            gray_strip = cv2.cvtColor(roi_strip, cv2.COLOR_BGR2GRAY)
+            gray_strip = roi_strip if roi_strip.ndim == 2 else cv2.cvtColor(roi_strip, cv2.COLOR_BGR2GRAY)
             
             min_val, max_val, _, _ = cv2.minMaxLoc(gray_strip)
             # min_val representa o preto mais denso na imagem
@@ -776,39 +1624,19 @@ class OMREngine:
 
     def read_bubbles_by_density(self, warped, num_questions, layout_version="v1"):
         """
-        Lê bolhas usando análise de densidade de pixels baseada no layout JSON.
+        Lê bolhas usando análise de densidade de pixels baseada no layout compilado.
+        A geometria dos ROIs vem pronta do CompiledLayout; aqui só binarizamos e indexamos.
         """
         layout = self.load_layout(layout_version)
-        if not layout or not isinstance(layout, dict):
+        if not layout:
             return []
-        
-        layout_dict = cast(Dict[str, Any], layout)
-
-        thr = cast(Dict[str, float], layout_dict.get("thresholds", {}))
-        marked_thr = float(thr.get("marked", 0.20))
-        amb_thr = float(thr.get("ambiguous", 0.10))
-
-        options = cast(List[str], layout_dict.get("options", ["A", "B", "C", "D", "E"]))
-        x_centers_pct = cast(List[float], layout_dict.get("x_centers_pct", [0.245, 0.318, 0.392, 0.465, 0.538]))
-        num_questions_raw = layout.get("num_questions", num_questions)
-        q_count: int = int(num_questions_raw) if num_questions_raw is not None else 26
 
-        num_cols = int(layout.get("num_columns", 1))
-        num_rows_val = math.ceil(q_count / num_cols)
-        
-        # O gerador industrial usa passo fixo de 11mm em um wrapper de 190mm
-        y_step_pct = float(layout.get("y_step_pct_fixed", 0.0579))
-        y_start_pct = float(layout.get("y_start_pct_fixed", 0.1079))
-        
-        roi_size = int(self.target_width * float(layout.get("roi_size_pct_of_width", 0.028)))
-        x_offsets_pct = layout.get("x_offsets_pct", [0.0])
-        
         # 1. Calibração de contraste via barra lateral
         black_lv, white_lv = self._get_contrast_calibration(warped)
         logger.debug(f"Contrast Calib: Black={black_lv}, White={white_lv}")
 
         # Binarizar a imagem retificada para leitura das bolhas
-        gray_warped = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
+        gray_warped = warped if warped.ndim == 2 else cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
         # Se detectamos um preto muito claro (ex: scanner/luz ruim), usamos threshold manual dinâmico
         if black_lv > 70:
             # Imagem está muito lavada, forçamos threshold mais agressivo
@@ -816,61 +1644,64 @@ class OMREngine:
             _, thresh = cv2.threshold(gray_warped, thresh_val, 255, cv2.THRESH_BINARY_INV)
         else:
             _, thresh = cv2.threshold(gray_warped, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        
-        thresh_indexed = cast(Any, thresh)
+
+        # 2. Densidade de todas as bolhas em uma única redução NumPy
+        ratios = self._score_bubbles(thresh, layout.roi_coords).tolist()
+        coords = layout.roi_coords.tolist()
+
         results: List[Dict[str, Any]] = []
-        
-        # O gerador do frontend (GabaritoTemplate) usa colunas verticais (blocos)
-        # Isso significa que ele preenche Bloco 1: Q1-Q7 | Bloco 2: Q8-Q14...
-        # Invertemos a ordem: Column -> Row
-        q_idx: int = 0
-        num_cols_val = int(cast(Union[int, float], num_cols))
-        num_rows_val = int(cast(Union[int, float], num_rows_val))
-        num_q_val = int(cast(Union[int, float], q_count))
-
-        for col in range(num_cols_val):
-            x_offset = float(x_offsets_pct[col]) * float(self.target_width)
-            
-            for row in range(num_rows_val):
-                if int(q_idx) >= int(num_q_val):
-                    break
-                
-                # Cálculo de Y usando passo fixo (Industrial)
-                y_center_f = (y_start_pct + (float(row) * y_step_pct)) * float(self.target_height)
-                y_center = float(y_center_f)
-                bubbles_data: List[Dict[str, Any]] = []
-                
-                for j, x_pct_rel in enumerate(x_centers_pct):
-                    # Coordenada X absoluta = x_offset (da coluna) + (x_pct_rel * largura)
-                    x_center = x_offset + (float(x_pct_rel) * float(self.target_width))
-                    
-                    # Definir ROI
-                    x1 = max(0, int(x_center - float(roi_size)/2))
-                    y1 = max(0, int(y_center - float(roi_size)/2))
-                    x2 = min(int(self.target_width), x1 + int(roi_size))
-                    y2 = min(int(self.target_height), y1 + int(roi_size))
-                    
-                    # Cast thresh to Any to allow slicing without Unknown errors
-                    thresh_img = cast(Any, thresh)
-                    roi = thresh_img[y1:y2, x1:x2]
-                    
-                    fill_ratio, bg_ratio = self._masked_ratio(roi)
-                    option_val = str(cast(List[str], options)[j])
-                    bubbles_data.append({
-                        'option': option_val,
-                        'score': float(fill_ratio),
-                        'bg_score': float(bg_ratio),
-                        'coords': [int(x1), int(y1), int(x2), int(y2)]
-                    })
-                
-                results.append({
-                    'question': q_idx + 1,  # type: ignore
-                    'bubbles': bubbles_data
-                })
-                q_idx += 1  # type: ignore
+        n_opts = len(layout.options)
+        for q in range(layout.num_questions):
+            base = q * n_opts
+            results.append({
+                'question': q + 1,
+                'bubbles': [
+                    {
+                        'option': option,
+                        'score': ratios[base + j][0],
+                        'bg_score': ratios[base + j][1],
+                        'coords': coords[base + j]
+                    }
+                    for j, option in enumerate(layout.options)
+                ]
+            })
         
         return results
     
+    @staticmethod
+    def _classify_question(scores, bg_scores, marked_thr, amb_thr, margin_thr):
+        """
+        Decide uma questão a partir dos scores das bolhas (na ordem das opções).
+        Retorna (status, índice da opção marcada ou None, confiança).
+        """
+        # 1. ANALISAR TOP 1 E TOP 2 COM SINAL ÚTIL DO BG_SCORE
+        # bg_score mede sujeira/borda perto da bolha. Bolha real tem bg_score baixo.
+        # Se bg_score for alto (ex > 0.10), penalizamos o score da bolha
+        adjusted = [max(0.0, score - max(0.0, bg - 0.05) * 0.5) for score, bg in zip(scores, bg_scores)]
+
+        # Ordenar bolhas por score ajustado (estável: no empate vale a primeira opção)
+        order = sorted(range(len(adjusted)), key=adjusted.__getitem__, reverse=True)
+        t1_score = adjusted[order[0]]
+        t2_score = adjusted[order[1]] if len(order) > 1 else 0.0
+        margin = t1_score - t2_score
+
+        # 1. Checar se está em branco (Mesmo o Top 1 é irrelevante)
+        if t1_score < amb_thr:
+            return "blank", None, 1.0 - (t1_score / amb_thr)
+
+        # 2. Checar múltiplas marcações reais
+        # Para ser inválido, t2_score deve ser alto E o margin deve ser pequeno
+        # Se margin for grande (> 0.10), provavelmente t2 é apenas sujeira
+        if t2_score >= marked_thr and margin < 0.10:
+            return "invalid", None, 0.0
+
+        # 3. Checar ambiguidade
+        if t2_score >= amb_thr and margin < margin_thr:
+            return "ambiguous", order[0], max(0.0, margin / margin_thr)
+
+        # 4. Válido e claro
+        return "valid", order[0], min(1.0, margin / (margin_thr * 2.5)) if margin_thr > 0 else 1.0
+
     def validate_questions(self, bubble_results: List[Dict[str, Any]], layout_version="v1"):
         """
         Lógica de Densidade Relativa por Score e Margem.
@@ -878,12 +1709,9 @@ class OMREngine:
         Anota final_status/final_conf/final_index na question_data para o audit_map.
         """
         layout = self.load_layout(layout_version)
-        layout_dict = cast(Dict[str, Any], layout)
-        thr = cast(Dict[str, Any], layout_dict.get("thresholds", {}))
-        
-        marked_thr = float(thr.get("marked", 0.15))   # Acima disso, consideramos que tem tinta real
-        amb_thr = float(thr.get("ambiguous", 0.08))      # Abaixo disso, é sujeira ou nada (em branco)
-        margin_thr = 0.06   # Diferença mínima entre Top 1 e Top 2 para não ser ambíguo
+        marked_thr = layout.marked_thr   # Acima disso, consideramos que tem tinta real
+        amb_thr = layout.ambiguous_thr   # Abaixo disso, é sujeira ou nada (em branco)
+        margin_thr = self.AMBIGUOUS_MARGIN
 
         answers: List[Optional[str]] = []
         confidence_scores: List[float] = []
@@ -892,54 +1720,10 @@ class OMREngine:
 
         for question_data in bubble_results:
             bubbles = question_data['bubbles']
-            
-            # 1. ANALISAR TOP 1 E TOP 2 COM SINAL ÚTIL DO BG_SCORE
-            # bg_score mede sujeira/borda perto da bolha. Bolha real tem bg_score baixo.
-            # Se bg_score for alto (ex > 0.10), penalizamos o score da bolha
-            def adjusted_score(b):
-                penalty = max(0.0, b['bg_score'] - 0.05) * 0.5
-                return max(0.0, b['score'] - penalty)
-
-            # Ordenar bolhas por score ajustado
-            sorted_bubbles = sorted(bubbles, key=adjusted_score, reverse=True)
-            
-            top1_b = sorted_bubbles[0]
-            top2_b = sorted_bubbles[1] if len(sorted_bubbles) > 1 else None
-            
-            t1_score = adjusted_score(top1_b)
-            t2_score = adjusted_score(top2_b) if top2_b else 0.0
-            
-            margin = t1_score - t2_score
-            
-            # 1. Checar se está em branco (Mesmo o Top 1 é irrelevante)
-            if t1_score < amb_thr:
-                status = "blank"
-                ans = None
-                conf = 1.0 - (t1_score / amb_thr)
-                final_idx = None
-            
-            # 2. Checar múltiplas marcações reais
-            # Para ser inválido, t2_score deve ser alto E o margin deve ser pequeno
-            # Se margin for grande (> 0.10), provavelmente t2 é apenas sujeira
-            elif t2_score >= marked_thr and margin < 0.10:
-                status = "invalid"
-                ans = None
-                conf = 0.0
-                final_idx = None
-                
-            # 3. Checar ambiguidade
-            elif t2_score >= amb_thr and margin < margin_thr:
-                status = "ambiguous"
-                ans = top1_b['option']
-                conf = max(0.0, margin / margin_thr)
-                final_idx = bubbles.index(top1_b)
-                
-            # 4. Válido e claro
-            else:
-                status = "valid"
-                ans = top1_b['option']
-                conf = min(1.0, margin / (margin_thr * 2.5)) if margin_thr > 0 else 1.0
-                final_idx = bubbles.index(top1_b)
+            status, final_idx, conf = self._classify_question(
+                [b['score'] for b in bubbles], [b['bg_score'] for b in bubbles], marked_thr, amb_thr, margin_thr
+            )
+            ans = bubbles[final_idx]['option'] if final_idx is not None else None
 
             # Anotar na question_data para o audit_map usar
             question_data["final_status"] = status
@@ -958,13 +1742,163 @@ class OMREngine:
             'status_counts': status_counts,
             'avg_confidence': float(np.mean(confidence_scores)) if confidence_scores else 0.0
         }
-    
+
+    # Segunda passada: só as linhas que a primeira leitura deixou ambíguas/inválidas
+    REREAD_STATUSES = ("ambiguous", "invalid")
+    # Deslocamento máximo do ROI na busca de posição, em fração do tamanho da bolha
+    REREAD_SEARCH_PCT = 0.15
+    # Ordem de preferência das decisões (menor = melhor); empate decide pela confiança
+    _STATUS_RANK = {"valid": 0, "blank": 0, "ambiguous": 1, "invalid": 2}
+
+    def reread_flagged_rows(self, warped, bubble_results: List[Dict[str, Any]],
+                            validated: Dict[str, Any], layout_version="v1") -> List[Dict[str, Any]]:
+        """
+        Relê na retificada (já em memória) só as questões ambíguas/inválidas, em vez de pedir
+        outra foto. Cada linha ganha um threshold próprio (Otsu na faixa da linha: resíduo de
+        borracha e sombra local deixam de contar como tinta) e uma busca de posição pequena
+        (±REREAD_SEARCH_PCT do ROI, a linha inteira junto) para compensar warp desalinhado.
+
+        A busca fica com a melhor decisão (válida/em branco > ambígua > inválida, depois a
+        confiança), mas só chega a "em branco" se a linha já não tiver tinta na posição original:
+        afastar o ROI da marcação não conta. A segunda decisão substitui a primeira apenas se
+        for conclusiva (válida ou em branco). `validated` e `bubble_results` são atualizados no
+        lugar. Retorna uma entrada por questão relida com as duas decisões.
+        """
+        flagged = [i for i, status in enumerate(validated["status_list"]) if status in self.REREAD_STATUSES]
+        if not flagged:
+            return []
+
+        layout = self.load_layout(layout_version)
+        gray = warped if warped.ndim == 2 else cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
+        img_h, img_w = gray.shape[:2]
+        rereads: List[Dict[str, Any]] = []
+        for i in flagged:
+            question_data = bubble_results[i]
+            coords = np.array([b["coords"] for b in question_data["bubbles"]], dtype=np.int32)
+            roi_w = int((coords[:, 2] - coords[:, 0]).max())
+            roi_h = int((coords[:, 3] - coords[:, 1]).max())
+            search = max(1, round(roi_w * self.REREAD_SEARCH_PCT))
+
+            # Faixa da linha com margem para a busca; coords passam a ser relativas à faixa
+            x1, y1 = max(0, int(coords[:, 0].min()) - search), max(0, int(coords[:, 1].min()) - search)
+            x2, y2 = min(img_w, int(coords[:, 2].max()) + search), min(img_h, int(coords[:, 3].max()) + search)
+            strip = gray[y1:y2, x1:x2]
+            row_thr, binary = cv2.threshold(strip, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+            # Densidade do disco e do anel para todas as posições de uma vez (correlação com as máscaras)
+            masks, areas = self._bubble_masks(roi_h, roi_w)
+            ink = (binary > 0).astype(np.float32)
+            maps = [
+                cv2.filter2D(ink, -1, masks[:, k].reshape(roi_h, roi_w), anchor=(0, 0),
+                             borderType=cv2.BORDER_CONSTANT) / max(float(areas[k]), 1.0)
+                for k in range(2)
+            ]
+
+            best = None
+            blank_allowed = None
+            lx, ly = coords[:, 0] - x1, coords[:, 1] - y1
+            # Começa na posição original: (0, 0) decide se "em branco" é uma leitura possível
+            offsets = [(0, 0)] + [(dx, dy) for dy in range(-search, search + 1)
+                                  for dx in range(-search, search + 1) if dx or dy]
+            for dx, dy in offsets:
+                xs, ys = lx + dx, ly + dy
+                if xs.min() < 0 or ys.min() < 0 or xs.max() + roi_w > strip.shape[1] or ys.max() + roi_h > strip.shape[0]:
+                    continue
+                scores, bg_scores = maps[0][ys, xs].tolist(), maps[1][ys, xs].tolist()
+                status, _, conf = self._classify_question(
+                    scores, bg_scores, layout.marked_thr, layout.ambiguous_thr, self.AMBIGUOUS_MARGIN
+                )
+                if blank_allowed is None:
+                    blank_allowed = status == "blank"
+                # Tirar o ROI de cima da tinta não vale: sem tinta na posição original, nada de "em branco"
+                rank = self._STATUS_RANK[status] if status != "blank" or blank_allowed else len(self._STATUS_RANK)
+                # Melhor decisão; no empate, o menor deslocamento
+                key = (rank, -conf, abs(dx) + abs(dy))
+                if best is None or key < best[0]:
+                    best = (key, (dx, dy), scores, bg_scores)
+            if best is None:
+                continue
+
+            _, offset, scores, bg_scores = best
+            candidate = {
+                "question": question_data["question"],
+                "bubbles": [
+                    {"option": b["option"], "score": score, "bg_score": bg,
+                     "coords": [b["coords"][0] + offset[0], b["coords"][1] + offset[1],
+                                b["coords"][2] + offset[0], b["coords"][3] + offset[1]]}
+                    for b, score, bg in zip(question_data["bubbles"], scores, bg_scores)
+                ],
+            }
+            decision = self.validate_questions([candidate], layout_version)
+            first = {
+                "status": validated["status_list"][i],
+                "answer": validated["answers"][i],
+                "confidence": validated["confidence_scores"][i],
+            }
+            second = {
+                "status": decision["status_list"][0],
+                "answer": decision["answers"][0],
+                "confidence": decision["confidence_scores"][0],
+                "offset": list(offset),
+                "threshold": int(row_thr),
+            }
+            # Só decisões conclusivas substituem a primeira: uma ambígua ainda chutaria uma resposta
+            applied = self._STATUS_RANK[second["status"]] == 0
+            if applied:
+                validated["status_counts"][first["status"]] -= 1
+                validated["status_counts"][second["status"]] += 1
+                validated["status_list"][i] = second["status"]
+                validated["answers"][i] = second["answer"]
+                validated["confidence_scores"][i] = second["confidence"]
+                # O mapa de auditoria mostra os ROIs e a decisão que valeram
+                bubble_results[i] = candidate
+            rereads.append({"question": question_data["question"], "first": first, "second": second,
+                            "applied": applied})
+
+        if any(r["applied"] for r in rereads):
+            scores = validated["confidence_scores"]
+            validated["avg_confidence"] = float(np.mean(scores)) if scores else 0.0
+        return rereads
+
+    @staticmethod
+    def _audit_manifest(bubble_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Só o que o generate_audit_map precisa para redesenhar o mapa depois."""
+        return [
+            {
+                "final_status": q.get("final_status"),
+                "final_index": q.get("final_index"),
+                "bubbles": [{"coords": b["coords"], "score": round(float(b.get("score", 0.0)), 4)} for b in q["bubbles"]],
+            }
+            for q in bubble_results
+        ]
+
+    def render_audit_map(self, manifest_name: str) -> Optional[str]:
+        """
+        Renderiza (uma vez) o mapa de auditoria a partir do manifesto gravado no process_image.
+        Retorna o nome do JPEG no artifact_store, ou None se o manifesto/retificada não existir mais.
+        """
+        rendered = artifact_store.derived_name(manifest_name)
+        if artifact_store.path(rendered):
+            return rendered
+
+        manifest = artifact_store.read_json(manifest_name)
+        if not isinstance(manifest, dict):
+            return None
+        warped_path = artifact_store.path(str(manifest.get("warped", "")))
+        if warped_path is None:
+            return None
+
+        warped = cv2.imread(str(warped_path), cv2.IMREAD_COLOR)
+        audit_map = self.generate_audit_map(warped, manifest["questions"], manifest.get("num_questions"))
+        _, buffer_audit = cv2.imencode('.jpg', audit_map, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        return artifact_store.put_derived(manifest_name, buffer_audit.tobytes())
+
     def generate_audit_map(self, warped, bubble_results: List[Dict[str, Any]], num_questions):
         """
         Gera mapa visual destacando as bolhas detectadas.
         Usa final_status anotado pelo validate_questions para cores consistentes.
         """
-        audit_img = warped.copy()
+        audit_img = cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR) if warped.ndim == 2 else warped.copy()
         
         for question_data in bubble_results:
             status = str(question_data.get("final_status", ""))
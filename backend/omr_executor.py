@@ -0,0 +1,136 @@
+"""
+Executor do OMR: tira o processamento pesado (OpenCV) de dentro do event loop.
+
+Modos (variável OMR_EXECUTION_MODE):
+  - "thread"  (padrão): usa o OMREngine do próprio processo em um pool de threads.
+                        O OpenCV libera o GIL, então o uvicorn continua atendendo.
+  - "process": usa um ProcessPoolExecutor. Cada worker tem o seu próprio OMREngine
+               com os layouts pré-carregados, isolando CPU e memória do processo web.
+
+Em ambos os modos a fila é limitada (OMR_POOL_MAX_QUEUE) e cada job tem timeout
+(OMR_JOB_TIMEOUT_S). Um job que estoura o timeout continua rodando no worker até
+terminar, mas segue ocupando sua vaga na fila, então o limite é sempre respeitado.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from omr_engine import OMREngine
+
+logger = logging.getLogger("lerprova-api")
+
+# Engine do processo worker (modo "process")
+_worker_engine: Optional[OMREngine] = None
+
+
+def _init_worker():
+    """Inicializador do ProcessPoolExecutor: cria o engine (que já pré-compila os layouts)."""
+    global _worker_engine
+    _worker_engine = OMREngine()
+
+
+def _run_job(method: str, args: tuple, kwargs: Dict[str, Any]):
+    """Executa um método do OMREngine dentro do processo worker."""
+    if _worker_engine is None:
+        _init_worker()
+    return getattr(_worker_engine, method)(*args, **kwargs)
+
+
+class OMRQueueFull(Exception):
+    """Fila do executor cheia: o cliente deve tentar novamente mais tarde."""
+
+
+class OMRJobTimeout(Exception):
+    """O job excedeu OMR_JOB_TIMEOUT_S."""
+
+
+class OMRExecutor:
+    def __init__(
+        self,
+        engine: OMREngine,
+        mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        timeout_s: Optional[float] = None,
+    ):
+        self.engine = engine
+        self.mode = (mode or os.getenv("OMR_EXECUTION_MODE", "thread")).strip().lower()
+        if self.mode not in ("thread", "process"):
+            logger.warning(f"OMR_EXECUTION_MODE inválido ({self.mode}), usando 'thread'")
+            self.mode = "thread"
+
+        default_workers = min(2, os.cpu_count() or 1)
+        self.max_workers = max(1, int(max_workers or os.getenv("OMR_POOL_WORKERS", default_workers)))
+        self.max_queue = max(1, int(max_queue or os.getenv("OMR_POOL_MAX_QUEUE", self.max_workers * 4)))
+        self.timeout_s = float(timeout_s or os.getenv("OMR_JOB_TIMEOUT_S", 30))
+
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Jobs na fila ou em execução (inclui jobs que já estouraram o timeout)."""
+        return self._pending
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.mode == "process":
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        initializer=_init_worker,
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="omr")
+                logger.info(f"OMR executor iniciado: mode={self.mode} workers={self.max_workers} max_queue={self.max_queue}")
+            return self._pool
+
+    def _release(self, _fut: Future):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, method: str, args: tuple, kwargs: Dict[str, Any]) -> Future:
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise OMRQueueFull(f"Fila OMR cheia ({self._pending}/{self.max_queue})")
+            self._pending += 1
+
+        try:
+            pool = self._get_pool()
+            if self.mode == "process":
+                cf = pool.submit(_run_job, method, args, kwargs)
+            else:
+                cf = pool.submit(functools.partial(getattr(self.engine, method), *args, **kwargs))
+        except Exception:
+            self._release(None)  # type: ignore[arg-type]
+            raise
+
+        cf.add_done_callback(self._release)
+        return cf
+
+    async def run(self, method: str, *args, **kwargs):
+        """Executa `OMREngine.<method>` fora do event loop, respeitando fila e timeout."""
+        cf = self._submit(method, args, kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cf), timeout=self.timeout_s)
+        except asyncio.TimeoutError:
+            cf.cancel()  # Só tem efeito se o job ainda não começou
+            raise OMRJobTimeout(f"Processamento OMR excedeu {self.timeout_s:.0f}s")
+        except BrokenProcessPool:
+            # Um worker morreu (ex: OOM). Descarta o pool para recriar na próxima chamada.
+            logger.error("Pool de processos OMR quebrado, recriando no próximo job")
+            with self._lock:
+                self._pool = None
+            raise
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,149 @@
+"""
+Métricas agregadas do OMR no processo web.
+
+O OMREngine.process_image devolve em "telemetry" o tempo de cada etapa da leitura
+(decode, gray, clahe, threshold, anchors, warp, qr, bubbles, validate, audit, encode...),
+a estratégia que achou as âncoras e o motivo da rejeição. O router registra isso aqui,
+junto com o tempo total e a espera na fila do omr_executor, e o /omr/metrics expõe os
+histogramas. Como a telemetria viaja no resultado do job, funciona igual nos dois modos
+do executor (thread e process).
+
+A seção "precheck" mostra o efeito da pré-triagem de qualidade: quantas fotos ela barrou,
+quanto custou e uma estimativa do tempo de engine economizado (cada foto barrada custaria
+em média o mesmo que as rejeições que passaram pela triagem e caíram no pipeline completo).
+"""
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+# Limites (ms) dos baldes dos histogramas; o último balde é "+inf"
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Histograma de baldes fixos (sem guardar as amostras), com percentis estimados."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Limite superior do balde onde cai o percentil `q` (0-100)."""
+        if not self.count:
+            return None
+        target = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 2) if self.count else None,
+            "max_ms": round(self.max, 2),
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class OMRMetrics:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages: Dict[str, Histogram] = {}
+            self.totals: Dict[str, Histogram] = {}
+            self.queue = Histogram(self.buckets)
+            self.counters: Dict[str, Dict[str, int]] = {
+                "requests": {}, "quality": {}, "rejects": {}, "anchor_strategy": {}, "review_reasons": {},
+                "second_pass": {},
+            }
+            self.precheck = {"checked": 0, "rejected": 0, "cost_ms": 0.0}
+            # Rejeições que passaram pela triagem: custo médio de uma foto ruim no pipeline completo
+            self.pipeline_rejects = Histogram(self.buckets)
+
+    def _inc(self, counter: str, key: Optional[str]):
+        bucket = self.counters[counter]
+        key = key or "none"
+        bucket[key] = bucket.get(key, 0) + 1
+
+    def observe(self, endpoint: str, result: Dict[str, Any], wall_ms: float):
+        """Registra uma leitura: `result` é a resposta do process_image, `wall_ms` o tempo visto pelo router."""
+        telemetry = result.get("telemetry") or {}
+        with self._lock:
+            self._inc("requests", endpoint)
+            self.totals.setdefault(endpoint, Histogram(self.buckets)).observe(wall_ms)
+            for stage, ms in (telemetry.get("timings_ms") or {}).items():
+                self.stages.setdefault(stage, Histogram(self.buckets)).observe(ms)
+            if "total_ms" in telemetry:
+                # O que o engine não viu: fila do executor, pickling (modo process) e agendamento
+                self.queue.observe(max(0.0, wall_ms - telemetry["total_ms"]))
+
+            self._inc("quality", result.get("quality") or ("ok" if result.get("success") else "reject"))
+            if not result.get("success"):
+                self._inc("rejects", telemetry.get("reject_reason"))
+            if "anchor_strategy" in telemetry:
+                self._inc("anchor_strategy", telemetry["anchor_strategy"])
+            for reason in result.get("review_reasons") or []:
+                self._inc("review_reasons", reason)
+            # Questões relidas na segunda passada: "applied" evitou revisão/nova foto
+            for reread in result.get("second_pass") or []:
+                self._inc("second_pass", "applied" if reread.get("applied") else "kept")
+
+            image_quality = telemetry.get("image_quality")
+            if image_quality is not None:
+                self.precheck["checked"] += 1
+                self.precheck["cost_ms"] += (telemetry.get("timings_ms") or {}).get("precheck", 0.0)
+                if image_quality.get("reason"):
+                    self.precheck["rejected"] += 1
+                elif not result.get("success") and "total_ms" in telemetry:
+                    self.pipeline_rejects.observe(telemetry["total_ms"])
+
+    def _precheck_snapshot(self) -> Dict[str, Any]:
+        checked, rejected = self.precheck["checked"], self.precheck["rejected"]
+        reject_ms = self.pipeline_rejects.total / self.pipeline_rejects.count if self.pipeline_rejects.count else None
+        return {
+            "checked": checked,
+            "rejected": rejected,
+            "cost_ms": round(self.precheck["cost_ms"], 2),
+            "mean_cost_ms": round(self.precheck["cost_ms"] / checked, 2) if checked else None,
+            "pipeline_reject_mean_ms": round(reject_ms, 2) if reject_ms is not None else None,
+            "saved_ms_estimate": round(rejected * reject_ms, 2) if reject_ms is not None else None,
+        }
+
+    def reject(self, endpoint: str, reason: str):
+        """Requisição recusada antes do engine (fila cheia, timeout)."""
+        with self._lock:
+            self._inc("requests", endpoint)
+            self._inc("quality", "reject")
+            self._inc("rejects", reason)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stages_ms": {name: h.snapshot() for name, h in sorted(self.stages.items())},
+                "total_ms": {name: h.snapshot() for name, h in sorted(self.totals.items())},
+                "queue_ms": self.queue.snapshot(),
+                "counters": {name: dict(values) for name, values in self.counters.items()},
+                "precheck": self._precheck_snapshot(),
+            }
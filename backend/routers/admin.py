@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
+import anyio
 from pydantic import BaseModel
 from typing import List, Optional
 import users_db
 import models
-from database import get_db
+from database import engine, get_db
+from db_pool import pool_metrics
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, distinct
 from dependencies import get_current_user
@@ -30,8 +32,21 @@ async def verify_admin(user = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
     return user
 
+@router.get("/db-pool")
+async def get_db_pool_metrics(reset: bool = False, admin_user = Depends(verify_admin)):
+    """
+    Estado do pool de conexões e histograma de espera por conexão (ver db_pool.py), mais a
+    ocupação do threadpool onde rodam as rotas síncronas (API_THREADPOOL_SIZE).
+    """
+    snapshot = pool_metrics.snapshot(engine.pool)
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    snapshot["threadpool"] = {"size": limiter.total_tokens, "in_use": limiter.borrowed_tokens}
+    if reset:
+        pool_metrics.reset()
+    return snapshot
+
 @router.get("/users")
-async def list_users(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def list_users(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     users = db.query(users_db.User).all()
     # Retorna usuários sem o hash da senha e em formato dicionário simples
     return [
@@ -49,7 +64,7 @@ async def list_users(admin_user = Depends(verify_admin), db: Session = Depends(g
     ]
 
 @router.post("/users")
-async def create_new_user(user: UserCreate, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def create_new_user(user: UserCreate, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     existing = users_db.get_user_by_email(db, user.email)
     if existing:
         raise HTTPException(status_code=400, detail="E-mail já cadastrado")
@@ -58,7 +73,7 @@ async def create_new_user(user: UserCreate, admin_user = Depends(verify_admin),
     return {"message": "Usuário criado com sucesso", "user": {"id": new_user.id, "email": new_user.email}}
 
 @router.delete("/users/{user_id}")
-async def delete_user(user_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def delete_user(user_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     user = db.query(users_db.User).filter(users_db.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
@@ -71,7 +86,7 @@ async def delete_user(user_id: int, admin_user = Depends(verify_admin), db: Sess
     return {"message": "Usuário removido com sucesso"}
 
 @router.post("/users/import")
-async def import_users(users: List[UserCreate], admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def import_users(users: List[UserCreate], admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Importação em massa de professores."""
     created = 0
     skipped = 0
@@ -106,7 +121,7 @@ async def import_users(users: List[UserCreate], admin_user = Depends(verify_admi
 
 
 @router.get("/turmas")
-async def list_all_turmas(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def list_all_turmas(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     # Retorna todas as turmas com info do professor
     turmas = db.query(models.Turma).options(joinedload(models.Turma.professor)).all()
     
@@ -124,7 +139,7 @@ async def list_all_turmas(admin_user = Depends(verify_admin), db: Session = Depe
     return result
 
 @router.put("/turmas/{turma_id}/transfer/{user_id}")
-async def transfer_turma(turma_id: int, user_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def transfer_turma(turma_id: int, user_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     turma = db.query(models.Turma).filter(models.Turma.id == turma_id).first()
     if not turma:
         raise HTTPException(status_code=404, detail="Turma não encontrada")
@@ -178,7 +193,7 @@ class EventImport(BaseModel):
     is_school_day: bool
 
 @router.post("/import-master")
-async def import_master_data(
+def import_master_data(
     schools: List[SchoolImport],
     academic_years: List[AcademicYearImport],
     periods: List[PeriodImport],
@@ -227,7 +242,7 @@ async def import_master_data(
     return {"message": "Estrutura master importada com sucesso"}
 
 @router.get("/schools")
-async def list_schools(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def list_schools(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Lista as escolas reais do banco de dados."""
     schools = db.query(models.School).all()
     return [
@@ -240,7 +255,7 @@ async def list_schools(admin_user = Depends(verify_admin), db: Session = Depends
     ]
 
 @router.get("/calendar")
-async def get_calendar_events(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def get_calendar_events(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Busca o calendário mestre real (2026)."""
     events = db.query(models.Event).all()
     periods = db.query(models.Period).all()
@@ -266,7 +281,7 @@ async def get_calendar_events(admin_user = Depends(verify_admin), db: Session =
     }
 
 @router.get("/students")
-async def list_all_students(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def list_all_students(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Busca a lista real de todos os alunos no ecossistema."""
     students = db.query(models.Aluno).options(joinedload(models.Aluno.turmas)).all()
     return [
@@ -280,7 +295,7 @@ async def list_all_students(admin_user = Depends(verify_admin), db: Session = De
     ]
 
 @router.post("/generate-carteirinha")
-async def generate_student_card(aluno_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def generate_student_card(aluno_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """
     Gera dados estruturados para a carteirinha (identidade estudantil).
     No futuro gerará PDF, por ora retorna o template de dados.
@@ -298,7 +313,7 @@ async def generate_student_card(aluno_id: int, admin_user = Depends(verify_admin
     }
 
 @router.get("/pendencias")
-async def list_teacher_pendencies(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def list_teacher_pendencies(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Busca pendências críticas de todos os professores no ecossistema."""
     from datetime import datetime
     hoje = datetime.utcnow().date()
@@ -358,7 +373,7 @@ async def list_teacher_pendencies(admin_user = Depends(verify_admin), db: Sessio
     return result
 
 @router.post("/notificar")
-async def notify_professor(payload: dict, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def notify_professor(payload: dict, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Simula o envio de uma notificação para o professor."""
     prof_id = payload.get("professor_id")
     prof = db.query(users_db.User).filter(users_db.User.id == prof_id).first()
@@ -396,7 +411,7 @@ class RoomImport(BaseModel):
     alunos: List[StudentImport]
 
 @router.post("/import-master")
-async def import_master_data(payload: List[RoomImport], admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def import_master_data(payload: List[RoomImport], admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """
     Importação em massa de salas e alunos pela base central (ADM).
     """
@@ -475,7 +490,7 @@ class NFCFrequenciaRequest(BaseModel):
     turma_id: Optional[int] = None  # Se None, registra para todas as turmas do aluno
 
 @router.get("/alunos/nfc/{nfc_id}")
-async def get_aluno_by_nfc(nfc_id: str, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def get_aluno_by_nfc(nfc_id: str, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Busca aluno pelo ID do cartão NFC"""
     aluno = db.query(models.Aluno).filter(models.Aluno.nfc_id == nfc_id).first()
     if not aluno:
@@ -492,7 +507,7 @@ async def get_aluno_by_nfc(nfc_id: str, admin_user = Depends(verify_admin), db:
     }
 
 @router.post("/alunos/{aluno_id}/nfc")
-async def register_nfc_to_aluno(aluno_id: int, data: NFCRegisterRequest, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def register_nfc_to_aluno(aluno_id: int, data: NFCRegisterRequest, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Vincula um cartão NFC a um aluno"""
     aluno = db.query(models.Aluno).filter(models.Aluno.id == aluno_id).first()
     if not aluno:
@@ -514,7 +529,7 @@ async def register_nfc_to_aluno(aluno_id: int, data: NFCRegisterRequest, admin_u
     }
 
 @router.delete("/alunos/{aluno_id}/nfc")
-async def remove_nfc_from_aluno(aluno_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def remove_nfc_from_aluno(aluno_id: int, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Remove vínculo de cartão NFC de um aluno"""
     aluno = db.query(models.Aluno).filter(models.Aluno.id == aluno_id).first()
     if not aluno:
@@ -526,7 +541,7 @@ async def remove_nfc_from_aluno(aluno_id: int, admin_user = Depends(verify_admin
     return {"message": "Vínculo NFC removido com sucesso"}
 
 @router.post("/frequencia/nfc")
-async def register_frequencia_nfc(data: NFCFrequenciaRequest, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def register_frequencia_nfc(data: NFCFrequenciaRequest, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Registra presença de aluno via leitura NFC"""
     from datetime import datetime
     
@@ -595,7 +610,7 @@ async def register_frequencia_nfc(data: NFCFrequenciaRequest, admin_user = Depen
     }
 
 @router.get("/frequencia/nfc/hoje")
-async def get_frequencia_nfc_hoje(turma_id: Optional[int] = None, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def get_frequencia_nfc_hoje(turma_id: Optional[int] = None, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Lista todas as presenças registradas via NFC hoje"""
     from datetime import datetime
     
@@ -629,7 +644,7 @@ async def get_frequencia_nfc_hoje(turma_id: Optional[int] = None, admin_user = D
     ]
 
 @router.get("/alunos/search")
-async def search_alunos(q: str, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def search_alunos(q: str, admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     """Busca alunos por nome ou código"""
     if len(q) < 2:
         return []
@@ -651,7 +666,7 @@ async def search_alunos(q: str, admin_user = Depends(verify_admin), db: Session
 
 
 @router.get("/system-overview")
-async def system_overview(admin_user=Depends(verify_admin), db: Session = Depends(get_db)):
+def system_overview(admin_user=Depends(verify_admin), db: Session = Depends(get_db)):
     """Visão geral do sistema para o painel admin"""
     total_users = db.query(func.count(models.User.id)).scalar()
     # Apenas turmas ativas (com alunos) para alinhar com o relatório gerencial
@@ -687,7 +702,7 @@ async def system_overview(admin_user=Depends(verify_admin), db: Session = Depend
 
 # ENDPOINT ADMINISTRATIVO: Remove todos os alunos sem turma (órfãos)
 @router.delete("/alunos/orfaos", tags=["admin"])
-async def remover_alunos_orfaos(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
+def remover_alunos_orfaos(admin_user = Depends(verify_admin), db: Session = Depends(get_db)):
     alunos_sem_turma = db.query(models.Aluno).filter(~models.Aluno.turmas.any()).all()
     total = len(alunos_sem_turma)
     for aluno in alunos_sem_turma:
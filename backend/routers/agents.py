@@ -282,10 +282,13 @@ def execute_tool_call(name: str, args: dict, current_user) -> str:
         return f"Erro ao executar '{name}': {str(e)}"
     
 @router.post("/chat", response_model=ChatResponse)
-async def chat_with_agent(request: ChatRequest, current_user: typing.Any = Depends(get_current_user)):
+def chat_with_agent(request: ChatRequest, current_user: typing.Any = Depends(get_current_user), db: Session = Depends(get_db)):
     """
     Principal Agent (Orchestrator): Categoriza a intenção do usuário e delega a um AGENTE ESPECIALISTA.
     """
+    # A sessão da autenticação segurava uma conexão do pool durante as chamadas ao Gemini
+    # (segundos); o usuário já está carregado e histórico/ferramentas abrem sessões próprias
+    db.close()
     try:
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
@@ -343,7 +346,8 @@ async def chat_with_agent(request: ChatRequest, current_user: typing.Any = Depen
                 except Exception as e_hist:
                     logger.error(f"Erro ao buscar histórico: {e_hist}")
                     history = []
-                db_session.close()
+                finally:
+                    db_session.close()
 
                 contents = []
                 for h in history:
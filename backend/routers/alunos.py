@@ -11,7 +11,7 @@ router = APIRouter(tags=["alunos"])
 logger = logging.getLogger("lerprova-api")
 
 @router.post("/alunos")
-async def create_aluno(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_aluno(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     codigo = data.get("codigo")
     raw_turma_id = data.get("turma_id")
     nome = data.get("nome")
@@ -87,7 +87,7 @@ async def create_aluno(data: dict, user: users_db.User = Depends(get_current_use
     return {"message": "Aluno processado com sucesso", "id": aluno.id, "novo_cadastro": aluno.nome == nome}
 
 @router.get("/alunos")
-async def get_alunos(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_alunos(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if user.role == "admin":
         alunos = db.query(models.Aluno).all()
     else:
@@ -105,7 +105,7 @@ async def get_alunos(user: users_db.User = Depends(get_current_user), db: Sessio
     ]
 
 @router.get("/alunos/turma/{turma_id}")
-async def get_alunos_by_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_alunos_by_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Validar acesso à turma
     query = db.query(models.Turma).filter(models.Turma.id == turma_id)
     if user.role != "admin":
@@ -125,7 +125,7 @@ async def get_alunos_by_turma(turma_id: int, user: users_db.User = Depends(get_c
     ]
 
 @router.delete("/alunos/{aluno_id}")
-async def delete_aluno(aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_aluno(aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     aluno = db.query(models.Aluno).filter(models.Aluno.id == aluno_id).first()
     if not aluno:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
@@ -141,7 +141,7 @@ async def delete_aluno(aluno_id: int, user: users_db.User = Depends(get_current_
     return {"message": "Aluno excluído com sucesso"}
 
 @router.delete("/turmas/{turma_id}/alunos/{aluno_id}")
-async def unlink_aluno_from_turma(turma_id: int, aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def unlink_aluno_from_turma(turma_id: int, aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Validar acesso à turma
     turma_query = db.query(models.Turma).filter(models.Turma.id == turma_id)
     if user.role != "admin":
@@ -165,7 +165,7 @@ async def unlink_aluno_from_turma(turma_id: int, aluno_id: int, user: users_db.U
 
 
 @router.put("/alunos/{aluno_id}")
-async def update_aluno(aluno_id: int, data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_aluno(aluno_id: int, data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Atualiza os dados de um aluno, incluindo contato do responsável"""
     aluno = db.query(models.Aluno).filter(models.Aluno.id == aluno_id).first()
     if not aluno:
@@ -214,7 +214,7 @@ async def update_aluno(aluno_id: int, data: dict, user: users_db.User = Depends(
 
 
 @router.get("/alunos/{aluno_id}")
-async def get_aluno(aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_aluno(aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Retorna os dados completos de um aluno"""
     aluno = db.query(models.Aluno).filter(models.Aluno.id == aluno_id).first()
     if not aluno:
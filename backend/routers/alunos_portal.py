@@ -10,7 +10,7 @@ router = APIRouter(prefix="/alunos-portal", tags=["alunos-portal"])
 logger = logging.getLogger("lerprova-api")
 
 @router.post("/login")
-async def aluno_login(data: dict, db: Session = Depends(get_db)):
+def aluno_login(data: dict, db: Session = Depends(get_db)):
     codigo = data.get("codigo")
     password = data.get("password")
     
@@ -44,7 +44,7 @@ async def aluno_login(data: dict, db: Session = Depends(get_db)):
     }
 
 @router.get("/me")
-async def get_aluno_me(current_aluno: models.Aluno = Depends(get_current_user)):
+def get_aluno_me(current_aluno: models.Aluno = Depends(get_current_user)):
     return {
         "id": current_aluno.id,
         "nome": current_aluno.nome,
@@ -53,7 +53,7 @@ async def get_aluno_me(current_aluno: models.Aluno = Depends(get_current_user)):
     }
 
 @router.get("/me/resultados")
-async def get_aluno_resultados(current_aluno: models.Aluno = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_aluno_resultados(current_aluno: models.Aluno = Depends(get_current_user), db: Session = Depends(get_db)):
     # Resultados do aluno com informações do gabarito
     resultados = db.query(models.Resultado).filter(models.Resultado.aluno_id == current_aluno.id).all()
     
@@ -70,7 +70,7 @@ async def get_aluno_resultados(current_aluno: models.Aluno = Depends(get_current
     ]
 
 @router.get("/me/frequencia")
-async def get_aluno_frequencia(current_aluno: models.Aluno = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_aluno_frequencia(current_aluno: models.Aluno = Depends(get_current_user), db: Session = Depends(get_db)):
     freqs = db.query(models.Frequencia).filter(models.Frequencia.aluno_id == current_aluno.id).all()
     
     # Agrupar por turma se necessário ou apenas listar
@@ -83,7 +83,7 @@ async def get_aluno_frequencia(current_aluno: models.Aluno = Depends(get_current
     ]
 
 @router.patch("/me/password")
-async def change_aluno_password(data: dict, current_aluno: models.Aluno = Depends(get_current_user), db: Session = Depends(get_db)):
+def change_aluno_password(data: dict, current_aluno: models.Aluno = Depends(get_current_user), db: Session = Depends(get_db)):
     new_password = data.get("new_password")
     if not new_password or len(new_password) < 4:
         raise HTTPException(status_code=400, detail="Senha deve ter pelo menos 4 caracteres")
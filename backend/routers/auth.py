@@ -18,7 +18,7 @@ class LoginRequest(BaseModel):
 
 
 @router.get("/stats")
-async def get_stats(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_stats(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Filtros baseados no papel do usuário
     if user.role != "admin":
         turmas_count = db.query(models.Turma).filter(models.Turma.user_id == user.id).count()
@@ -38,7 +38,7 @@ async def get_stats(user: users_db.User = Depends(get_current_user), db: Session
     }
 
 @router.get("/stats/turma/{turma_id}")
-async def get_stats_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_stats_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Validar Acesso à Turma (RBAC)
     turma = db.query(models.Turma).filter(models.Turma.id == turma_id).first()
     if not turma:
@@ -60,7 +60,7 @@ async def get_stats_turma(turma_id: int, user: users_db.User = Depends(get_curre
     }
 
 @router.get("/billing/status")
-async def get_billing_status(user: users_db.User = Depends(get_current_user)):
+def get_billing_status(user: users_db.User = Depends(get_current_user)):
     return {
         "plan": user.plan_type,
         "corrections_used": user.total_corrections_used,
@@ -69,7 +69,7 @@ async def get_billing_status(user: users_db.User = Depends(get_current_user)):
     }
 
 @router.post("/billing/upgrade")
-async def upgrade_plan(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def upgrade_plan(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Simulação de upgrade para Pro (Em prod, aqui integraria com o Webhook do Mercado Pago)
     target_plan = data.get("plan", "pro")
     user.plan_type = target_plan
@@ -77,7 +77,7 @@ async def upgrade_plan(data: dict, user: users_db.User = Depends(get_current_use
     return {"message": f"Sucesso! Seu plano foi atualizado para {target_plan}.", "plan": user.plan_type}
 
 @router.post("/auth/login")
-async def login(data: LoginRequest, db: Session = Depends(get_db)):
+def login(data: LoginRequest, db: Session = Depends(get_db)):
     email = data.email
     password = data.password
     
@@ -38,7 +38,7 @@ class EventUpdate(BaseModel):
 
 
 @router.get("/events")
-async def list_events(db: Session = Depends(get_db)):
+def list_events(db: Session = Depends(get_db)):
     """
     Lista todos os eventos do calendário escolar
     Retorna eventos com informações completas
@@ -67,7 +67,7 @@ async def list_events(db: Session = Depends(get_db)):
 
 
 @router.get("/events/{event_type}")
-async def list_events_by_type(event_type: str, db: Session = Depends(get_db)):
+def list_events_by_type(event_type: str, db: Session = Depends(get_db)):
     """
     Lista eventos filtrados por tipo
     Tipos: holiday, vacation, planning, meeting, planning, assessment, etc.
@@ -97,7 +97,7 @@ async def list_events_by_type(event_type: str, db: Session = Depends(get_db)):
 
 
 @router.get("/periods")
-async def list_periods(db: Session = Depends(get_db)):
+def list_periods(db: Session = Depends(get_db)):
     """
     Lista todos os períodos letivos
     """
@@ -124,7 +124,7 @@ async def list_periods(db: Session = Depends(get_db)):
 
 
 @router.get("/academic-years")
-async def list_academic_years(db: Session = Depends(get_db)):
+def list_academic_years(db: Session = Depends(get_db)):
     """
     Lista todos os anos letivos configurados
     """
@@ -151,7 +151,7 @@ async def list_academic_years(db: Session = Depends(get_db)):
 
 
 @router.get("/schools")
-async def list_schools(db: Session = Depends(get_db)):
+def list_schools(db: Session = Depends(get_db)):
     """
     Lista todas as escolas configuradas
     """
@@ -175,7 +175,7 @@ async def list_schools(db: Session = Depends(get_db)):
 
 
 @router.get("/full-calendar")
-async def get_full_calendar(db: Session = Depends(get_db)):
+def get_full_calendar(db: Session = Depends(get_db)):
     """
     Retorna o calendário completo com todas as informações
     (escolas, anos letivos, períodos e eventos)
@@ -242,7 +242,7 @@ async def get_full_calendar(db: Session = Depends(get_db)):
 # ==================== CRUD ENDPOINTS ====================
 
 @router.post("/events")
-async def create_event(event_data: EventCreate, db: Session = Depends(get_db)):
+def create_event(event_data: EventCreate, db: Session = Depends(get_db)):
     """Criar novo evento no calendário"""
     try:
         academic_year_id = event_data.academic_year_id
@@ -281,7 +281,7 @@ async def create_event(event_data: EventCreate, db: Session = Depends(get_db)):
 
 
 @router.put("/events/{event_id}")
-async def update_event(event_id: int, event_data: EventUpdate, db: Session = Depends(get_db)):
+def update_event(event_id: int, event_data: EventUpdate, db: Session = Depends(get_db)):
     """Atualizar evento existente"""
     try:
         event = db.query(Event).filter(Event.id == event_id).first()
@@ -316,7 +316,7 @@ async def update_event(event_id: int, event_data: EventUpdate, db: Session = Dep
 
 
 @router.delete("/events/{event_id}")
-async def delete_event(event_id: int, db: Session = Depends(get_db)):
+def delete_event(event_id: int, db: Session = Depends(get_db)):
     """Remover evento do calendário"""
     try:
         event = db.query(Event).filter(Event.id == event_id).first()
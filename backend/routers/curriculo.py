@@ -70,34 +70,34 @@ def load_csv(filename):
         return list(csv.DictReader(f))
 
 @router.get("/subjects", response_model=List[CurriculumSubject])
-async def get_subjects():
+def get_subjects():
     data = load_csv("curriculum_subjects.csv")
     return [CurriculumSubject(id=int(row['id']), code=row['code'], name=row['name'], area=row['area']) for row in data]
 
 @router.get("/subjects/{subject_id}/units", response_model=List[CurriculumUnit])
-async def get_units(subject_id: int):
+def get_units(subject_id: int):
     data = load_csv("curriculum_units.csv")
     units = [row for row in data if int(row['subject_id']) == subject_id]
     return [CurriculumUnit(id=int(row['id']), subject_id=int(row['subject_id']), grade=row['grade'], name=row['title'], title=row['title']) for row in units]
 
 @router.get("/units/{unit_id}/topics", response_model=List[CurriculumTopic])
-async def get_topics(unit_id: int):
+def get_topics(unit_id: int):
     data = load_csv("curriculum_topics.csv")
     topics = [row for row in data if int(row['unit_id']) == unit_id]
     return [CurriculumTopic(id=int(row['id']), unit_id=int(row['unit_id']), order_index=int(row['order_index']), name=row['title'], title=row['title'], objetivo=row.get('objetivo'), default_lessons=int(row['default_lessons'])) for row in topics]
 
 @router.get("/methodologies", response_model=List[CurriculumMethodology])
-async def get_methodologies():
+def get_methodologies():
     data = load_csv("curriculum_methodologies.csv")
     return [CurriculumMethodology(id=int(row['id']), name=row['name'], description=row.get('description'), modality=row.get('modality')) for row in data if row.get('active') != 'False']
 
 @router.get("/resources", response_model=List[CurriculumResource])
-async def get_resources():
+def get_resources():
     data = load_csv("curriculum_resources.csv")
     return [CurriculumResource(id=int(row['id']), name=row['name'], type=row.get('type'), url=row.get('url')) for row in data if row.get('active') != 'False']
 
 @router.get("/topics/{topic_id}/suggestions", response_model=CurriculumSuggestions)
-async def get_suggestions(topic_id: int):
+def get_suggestions(topic_id: int):
     # Load suggestion maps
     mapping_m = load_csv("curriculum_topic_methodologies.csv")
     mapping_r = load_csv("curriculum_topic_resources.csv")
@@ -123,7 +123,7 @@ async def get_suggestions(topic_id: int):
     return CurriculumSuggestions(methodologies=suggested_meths, resources=suggested_res)
 
 @router.get("/bncc/skills", response_model=List[BNCCSkillSchema])
-async def search_skills(q: Optional[str] = None, subject_id: Optional[int] = None, grade: Optional[str] = None, db: Session = Depends(get_db)):
+def search_skills(q: Optional[str] = None, subject_id: Optional[int] = None, grade: Optional[str] = None, db: Session = Depends(get_db)):
     query = db.query(BNCCSkill)
     if q:
         query = query.filter(BNCCSkill.description.ilike(f"%{q}%") | BNCCSkill.code.ilike(f"%{q}%"))
@@ -136,6 +136,6 @@ async def search_skills(q: Optional[str] = None, subject_id: Optional[int] = Non
     return skills
 
 @router.get("/bncc/competencies", response_model=List[BNCCCompetencySchema])
-async def get_competencies(db: Session = Depends(get_db)):
+def get_competencies(db: Session = Depends(get_db)):
     comps = db.query(BNCCCompetency).all()
     return comps
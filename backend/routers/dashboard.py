@@ -358,7 +358,7 @@ def _historico_recente(db: Session, turmas_ids: list, limit: int = 5):
 # ============================================================
 
 @router.get("/dashboard/operacional")
-async def dashboard_operacional(
+def dashboard_operacional(
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
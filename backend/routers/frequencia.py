@@ -12,7 +12,7 @@ router = APIRouter(tags=["frequencia"])
 logger = logging.getLogger("lerprova-api")
 
 @router.post("/frequencia")
-async def save_frequencia(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def save_frequencia(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     turma_id = data.get("turma_id")
     data_frequencia = data.get("data")
     alunos_lista = data.get("alunos", [])
@@ -54,7 +54,7 @@ async def save_frequencia(data: dict, user: users_db.User = Depends(get_current_
     return {"message": "Frequência salva com sucesso", "registros": count}
 
 @router.get("/frequencia/turma/{turma_id}")
-async def get_frequencia_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_frequencia_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if user.role != "admin":
          turma = db.query(models.Turma).filter(models.Turma.id == turma_id, models.Turma.user_id == user.id).first()
          if not turma:
@@ -62,7 +62,7 @@ async def get_frequencia_turma(turma_id: int, user: users_db.User = Depends(get_
     return db.query(models.Frequencia).filter(models.Frequencia.turma_id == turma_id).all()
 
 @router.get("/frequencia/aluno/{aluno_id}")
-async def get_frequencia_aluno(aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_frequencia_aluno(aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     query = db.query(models.Frequencia).filter(models.Frequencia.aluno_id == aluno_id)
     
     if user.role != "admin":
@@ -96,7 +96,7 @@ async def get_frequencia_aluno(aluno_id: int, user: users_db.User = Depends(get_
     }
 
 @router.get("/frequencia/turma/{turma_id}/dates")
-async def get_frequencia_dates_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_frequencia_dates_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if user.role != "admin":
          turma = db.query(models.Turma).filter(models.Turma.id == turma_id, models.Turma.user_id == user.id).first()
          if not turma:
@@ -106,7 +106,7 @@ async def get_frequencia_dates_turma(turma_id: int, user: users_db.User = Depend
     return [d[0] for d in dates]
 
 @router.get("/frequencia/turma/{turma_id}/aluno/{aluno_id}")
-async def get_frequencia_aluno_turma(turma_id: int, aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_frequencia_aluno_turma(turma_id: int, aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if user.role != "admin":
         turma = db.query(models.Turma).filter(models.Turma.id == turma_id, models.Turma.user_id == user.id).first()
         if not turma:
@@ -147,7 +147,7 @@ async def get_frequencia_aluno_turma(turma_id: int, aluno_id: int, user: users_d
     }
 
 @router.post("/qr-scan")
-async def scan_qr_attendance(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def scan_qr_attendance(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     qr_token = data.get("qr_token")
     if not qr_token:
         raise HTTPException(status_code=400, detail="Token QR não fornecido")
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import update
 from sqlalchemy.orm import Session, joinedload
 from pydantic import BaseModel, field_validator
 from typing import Optional, List
@@ -7,7 +8,10 @@ import users_db
 from database import get_db
 from dependencies import get_current_user
 from utils.answers import parse_json_list, dump_json_list
+from item_analysis import analisar_gabarito, item_analysis_cache
+import numpy as np
 import logging
+import time
 
 router = APIRouter(tags=["gabaritos"])
 logger = logging.getLogger("lerprova-api")
@@ -66,6 +70,51 @@ def _serialize_gabarito(g: models.Gabarito, db: Session) -> dict:
     }
 
 
+def _recalcular_notas(gabarito: models.Gabarito, db: Session) -> dict:
+    """
+    Recalcula acertos e nota de todos os Resultados do gabarito depois de mudar o gabarito.
+    As respostas viram uma matriz de caracteres (resultados × questões) comparada com a nova
+    chave de uma vez; só as linhas com nota diferente são gravadas, num único UPDATE em lote.
+    Mesma regra do _calcular_nota da correção: questão anulada (None) não conta ponto.
+    Não faz commit: entra na mesma transação da alteração do gabarito.
+    """
+    inicio = time.perf_counter()
+    linhas = db.query(
+        models.Resultado.id, models.Resultado.respostas_aluno, models.Resultado.acertos, models.Resultado.nota
+    ).filter(models.Resultado.gabarito_id == gabarito.id).all()
+    if not linhas:
+        return {"resultados": 0, "notas_alteradas": 0, "ms": 0.0}
+
+    corretas = parse_json_list(gabarito.respostas_corretas, "gabarito.respostas_corretas")
+    total = max(gabarito.num_questoes or len(corretas), len(corretas))
+
+    # "" = em branco/anulada; as respostas são completadas ou cortadas para `total` questões
+    def _linha(respostas):
+        respostas = [r or "" for r in parse_json_list(respostas, "respostas_aluno")[:total]]
+        return respostas + [""] * (total - len(respostas))
+
+    chave = np.array(_linha(corretas), dtype=str).reshape(1, total)
+    respostas = np.array([_linha(l.respostas_aluno) for l in linhas], dtype=str).reshape(len(linhas), total)
+    acertos = ((respostas == chave) & (chave != "")).sum(axis=1)
+    notas = acertos * (10.0 / total) if total else np.zeros(len(linhas))
+
+    antigos_acertos = np.array([-1 if l.acertos is None else l.acertos for l in linhas])
+    antigas_notas = np.array([np.nan if l.nota is None else l.nota for l in linhas], dtype=float)
+    alterados = np.flatnonzero((acertos != antigos_acertos) | ~np.isclose(notas, antigas_notas))
+    if len(alterados):
+        db.execute(update(models.Resultado), [
+            {"id": linhas[i].id, "acertos": int(acertos[i]), "nota": float(notas[i])} for i in alterados
+        ])
+
+    relatorio = {
+        "resultados": len(linhas),
+        "notas_alteradas": len(alterados),
+        "ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+    logger.info(f"Notas recalculadas (gabarito {gabarito.id}): {relatorio}")
+    return relatorio
+
+
 def _check_turma_access(user: users_db.User, turma_ids: list, db: Session):
     """Levanta 403 se o professor não tiver acesso a alguma das turmas."""
     if user.role != "admin" and turma_ids:
@@ -82,7 +131,7 @@ def _check_turma_access(user: users_db.User, turma_ids: list, db: Session):
 # ─────────────────────────────────────────────
 
 @router.post("/gabaritos")
-async def create_gabarito(
+def create_gabarito(
     data: GabaritoCreate,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -125,7 +174,7 @@ async def create_gabarito(
 
 
 @router.put("/gabaritos/{gabarito_id}")
-async def update_gabarito(
+def update_gabarito(
     gabarito_id: int,
     data: GabaritoUpdate,
     user: users_db.User = Depends(get_current_user),
@@ -173,12 +222,18 @@ async def update_gabarito(
             models.Turma.id.in_(data.turma_ids)
         ).all()
 
+    # Chave ou nº de questões mudou: as notas já lançadas são recalculadas na mesma transação
+    recalculo = None
+    if data.respostas is not None or num_questoes is not None:
+        db.flush()
+        recalculo = _recalcular_notas(gabarito, db)
+
     db.commit()
-    return {"message": "Gabarito atualizado com sucesso"}
+    return {"message": "Gabarito atualizado com sucesso", "recalculo": recalculo}
 
 
 @router.get("/gabaritos")
-async def get_gabaritos(
+def get_gabaritos(
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -192,7 +247,7 @@ async def get_gabaritos(
 
 
 @router.get("/gabaritos/{gabarito_id}")
-async def get_gabarito(
+def get_gabarito(
     gabarito_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -212,8 +267,38 @@ async def get_gabarito(
     return _serialize_gabarito(g, db)
 
 
+@router.get("/gabaritos/{gabarito_id}/analise-itens")
+def get_analise_itens(
+    gabarito_id: int,
+    user: users_db.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Análise de itens do gabarito: dificuldade, discriminação (ponto-bisserial), frequência
+    de cada alternativa e taxas de branco/ambígua por questão (ver item_analysis.py).
+    Fica em cache até o próximo Resultado gravado para este gabarito.
+    """
+    g = db.query(models.Gabarito).options(
+        joinedload(models.Gabarito.turmas)
+    ).filter(models.Gabarito.id == gabarito_id).first()
+
+    if not g:
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+
+    if user.role != "admin":
+        has_access = any(t.user_id == user.id for t in g.turmas)
+        if not has_access:
+            raise HTTPException(status_code=403, detail="Acesso negado")
+
+    analise, geracao = item_analysis_cache.get(gabarito_id)
+    if analise is None:
+        analise = {"gabarito_id": gabarito_id, **analisar_gabarito(g, db)}
+        item_analysis_cache.put(gabarito_id, geracao, analise)
+    return analise
+
+
 @router.delete("/gabaritos/{gabarito_id}")
-async def delete_gabarito(
+def delete_gabarito(
     gabarito_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -236,7 +321,7 @@ async def delete_gabarito(
 
 
 @router.get("/disciplinas")
-async def get_disciplinas(db: Session = Depends(get_db)):
+def get_disciplinas(db: Session = Depends(get_db)):
     disc_turmas = db.query(models.Turma.disciplina).filter(models.Turma.disciplina != None).distinct().all()
     disc_gabas = db.query(models.Gabarito.disciplina).filter(models.Gabarito.disciplina != None).distinct().all()
     all_discs = set([d[0] for d in disc_turmas] + [d[0] for d in disc_gabas])
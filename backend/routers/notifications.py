@@ -8,7 +8,7 @@ from dependencies import get_current_user
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
 @router.get("/")
-async def list_notifications(user = Depends(get_current_user), db: Session = Depends(get_db)):
+def list_notifications(user = Depends(get_current_user), db: Session = Depends(get_db)):
     """Lista todas as notificações do usuário atual."""
     notifications = db.query(models.Notification).filter(
         models.Notification.user_id == user.id
@@ -26,7 +26,7 @@ async def list_notifications(user = Depends(get_current_user), db: Session = Dep
     ]
 
 @router.patch("/{notification_id}/read")
-async def mark_as_read(notification_id: int, user = Depends(get_current_user), db: Session = Depends(get_db)):
+def mark_as_read(notification_id: int, user = Depends(get_current_user), db: Session = Depends(get_db)):
     """Marca uma notificação específica como lida."""
     notification = db.query(models.Notification).filter(
         models.Notification.id == notification_id,
@@ -42,7 +42,7 @@ async def mark_as_read(notification_id: int, user = Depends(get_current_user), d
     return {"status": "success", "message": "Notificação marcada como lida"}
 
 @router.get("/unread/count")
-async def get_unread_count(user = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_unread_count(user = Depends(get_current_user), db: Session = Depends(get_db)):
     """Retorna a contagem de notificações não lidas."""
     count = db.query(models.Notification).filter(
         models.Notification.user_id == user.id,
@@ -110,7 +110,7 @@ def _rbac_check_plano_owner(user: users_db.User, plano_user_id: int) -> None:
 
 
 @router.get("")
-async def list_todos_planos(
+def list_todos_planos(
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -145,7 +145,7 @@ async def list_todos_planos(
 
 
 @router.get("/{plano_id}")
-async def get_plano_detalhado(
+def get_plano_detalhado(
     plano_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -244,7 +244,7 @@ def _shift_ordens_after(db: Session, plano_id: int, after_ordem: int, delta: int
 # Routes
 # =========================
 @router.post("")
-async def create_plano(
+def create_plano(
     data: PlanoCreate,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -309,7 +309,7 @@ async def create_plano(
 
 
 @router.put("/{plano_id}")
-async def update_plano(
+def update_plano(
     plano_id: int,
     data: PlanoCreate,
     user: users_db.User = Depends(get_current_user),
@@ -384,7 +384,7 @@ async def update_plano(
 
 
 @router.get("/turma/{turma_id}")
-async def get_planos_turma(
+def get_planos_turma(
     turma_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -419,7 +419,7 @@ async def get_planos_turma(
 
 
 @router.get("/{plano_id}/hoje")
-async def get_aula_hoje(
+def get_aula_hoje(
     plano_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -452,7 +452,7 @@ async def get_aula_hoje(
 
 
 @router.get("/{plano_id}/aulas")
-async def get_plano_aulas(
+def get_plano_aulas(
     plano_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -494,7 +494,7 @@ async def get_plano_aulas(
 
 
 @router.post("/aulas/{aula_id}/concluir")
-async def concluir_aula(
+def concluir_aula(
     aula_id: int,
     data: RegistroAulaCreate,
     user: users_db.User = Depends(get_current_user),
@@ -629,7 +629,7 @@ async def concluir_aula(
 
 
 @router.post("/aulas/{aula_id}/inserir-reforco")
-async def inserir_reforco(
+def inserir_reforco(
     aula_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -676,7 +676,7 @@ async def inserir_reforco(
 
 
 @router.get("/analytics/turma/{turma_id}/heatmap")
-async def get_heatmap(
+def get_heatmap(
     turma_id: int,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -701,7 +701,7 @@ async def get_heatmap(
     ]
 
 @router.get("/{plano_id}/cobertura-pedagogica")
-async def get_cobertura_pedagogica(plano_id: int, db: Session = Depends(get_db)):
+def get_cobertura_pedagogica(plano_id: int, db: Session = Depends(get_db)):
     aulas = db.query(models.AulaPlanejada).filter(models.AulaPlanejada.plano_id == plano_id).all()
     
     all_codes = []
@@ -739,7 +739,7 @@ class VincularPlanoRequest(BaseModel):
 
 
 @router.post("/{plano_id}/vincular")
-async def vincular_plano_outra_turma(
+def vincular_plano_outra_turma(
     plano_id: int,
     data: VincularPlanoRequest,
     user: users_db.User = Depends(get_current_user),
@@ -863,7 +863,7 @@ class PlanoPeriodoCreate(BaseModel):
 
 
 @router.post("/anuais")
-async def create_plano_anual(
+def create_plano_anual(
     data: PlanoAnualCreate,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -879,7 +879,7 @@ async def create_plano_anual(
 
 
 @router.get("/anuais")
-async def get_planos_anuais(
+def get_planos_anuais(
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -891,7 +891,7 @@ async def get_planos_anuais(
 
 
 @router.post("/periodo")
-async def create_plano_periodo(
+def create_plano_periodo(
     data: PlanoPeriodoCreate,
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -907,7 +907,7 @@ async def create_plano_periodo(
 
 
 @router.get("/periodo")
-async def get_planos_periodo(
+def get_planos_periodo(
     user: users_db.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -919,7 +919,7 @@ async def get_planos_periodo(
 
 
 @router.post("/anuais/{plano_anual_id}/gerar-periodo")
-async def gerar_plano_periodo(
+def gerar_plano_periodo(
     plano_anual_id: int, 
     bimestre: int, 
     user: users_db.User = Depends(get_current_user), 
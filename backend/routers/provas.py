@@ -1,20 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+import asyncio
 import json
 import time
 import logging
 import os
 import base64
+import binascii
+import struct
 import uuid
 from pathlib import Path
+import numpy as np
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import models
 import users_db
 from database import get_db
-from dependencies import get_current_user
-from omr_engine import OMREngine
+from dependencies import get_current_user, user_from_token
+from omr_engine import OMREngine, artifact_store, audit_sink, failure_sink
+from omr_executor import OMRExecutor, OMRQueueFull, OMRJobTimeout
+from omr_metrics import OMRMetrics
+from omr_admission import AdmissionRejected, PixelBudget, image_megapixels, scan_page_megapixels
+from anchor_tracker import AnchorTracker
+from idempotency import REPLAY_HEADER, IdempotencyCache, IdempotencyConflict, ReadRejected, fingerprint
 from utils.answers import parse_json_list, dump_json_list
 
 # Pasta de armazenamento de fotos capturadas pelo scanner
@@ -33,6 +44,62 @@ def cleanup_old_scans(directory: Path, limit: int = 200):
 router = APIRouter(tags=["provas"])
 logger = logging.getLogger("lerprova-api")
 omr = OMREngine()
+omr_executor = OMRExecutor(omr)
+anchor_tracker = AnchorTracker()
+omr_metrics = OMRMetrics()
+idempotency_cache = IdempotencyCache()
+pixel_budget = PixelBudget()
+
+async def run_omr(method: str, *args, **kwargs):
+    """
+    Executa o OMR fora do event loop (thread ou processo, ver OMR_EXECUTION_MODE),
+    convertendo fila cheia/timeout em respostas HTTP.
+    """
+    try:
+        return await omr_executor.run(method, *args, **kwargs)
+    except OMRQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado processando outras provas. Tente novamente em instantes.",
+            headers={"Retry-After": "5"}
+        )
+    except OMRJobTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+async def run_omr_admitted(endpoint: str, megapixels: float, method: str, *args, **kwargs):
+    """
+    run_omr reservando antes `megapixels` no pixel_budget (o que o engine vai decodificar).
+    Orçamento esgotado vira 503 com Retry-After; recusas (orçamento, fila cheia, timeout)
+    são contadas em omr_metrics.
+    """
+    try:
+        async with pixel_budget.acquire(megapixels):
+            return await run_omr(method, *args, **kwargs)
+    except AdmissionRejected:
+        omr_metrics.reject(endpoint, "pixel_budget")
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado processando outras provas. Tente novamente em instantes.",
+            headers={"Retry-After": str(pixel_budget.retry_after_s)}
+        )
+    except HTTPException as e:
+        omr_metrics.reject(endpoint, "server_busy" if e.status_code == 503 else "timeout")
+        raise
+
+async def _read_sheet(endpoint: str, image, debug: bool = False, **kwargs):
+    """
+    process_image pelo executor, registrando a telemetria do engine (tempo por etapa,
+    estratégia das âncoras, motivo de rejeição) em omr_metrics.
+    Cada leitura reserva os megapixels da foto no pixel_budget antes de entrar no executor
+    (503 com Retry-After se o orçamento estiver esgotado).
+    Sem `debug`, a telemetria não vai na resposta.
+    """
+    start = time.perf_counter()
+    result = await run_omr_admitted(endpoint, image_megapixels(image), "process_image", image, **kwargs)
+    omr_metrics.observe(endpoint, result, (time.perf_counter() - start) * 1000)
+    if not debug:
+        result.pop("telemetry", None)
+    return result
 
 class ProcessRequest(BaseModel):
     image: str
@@ -40,6 +107,17 @@ class ProcessRequest(BaseModel):
     gabarito_id: Optional[int] = None
     aluno_id: Optional[int] = None
     layout_version: Optional[str] = None
+    images: bool = False  # True = gera as imagens de revisão (retificada, original e mapa de auditoria)
+    inline_images: bool = False  # True = imagens em base64 na resposta (clientes antigos)
+    debug: bool = False  # True = inclui "telemetry" (tempo por etapa do OMR) na resposta
+
+class ProcessLoteRequest(BaseModel):
+    images: List[str]
+    gabarito_id: Optional[int] = None
+    aluno_ids: Optional[List[Optional[int]]] = None  # Opcional, na mesma ordem de images (senão usa QR Code)
+    num_questions: Optional[int] = 10
+    layout_version: Optional[str] = None
+    debug: bool = False
 
 class ReviewRequest(BaseModel):
     resultado_id: int
@@ -48,12 +126,24 @@ class ReviewRequest(BaseModel):
 
 class ScanAnchorsRequest(BaseModel):
     image: str
+    session_id: Optional[str] = None  # Uma por abertura da câmera: ativa o rastreamento entre frames
+
+# Limite de folhas por chamada em /provas/processar-lote
+LOTE_MAX_IMAGENS = int(os.getenv("OMR_LOTE_MAX_IMAGENS", 60))
+# Limite de páginas por arquivo em /provas/processar-scanner
+SCANNER_MAX_PAGINAS = int(os.getenv("OMR_SCANNER_MAX_PAGINAS", 200))
 
 # ===== Segurança: API Key sem default hardcoded =====
 API_KEY_SECRET = os.getenv("API_KEY_SECRET")
 
-@router.post("/omr/process")
-async def process_omr(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def _contar_correcao(user: users_db.User, db: Session):
+    """Soma a correção na cota do plano (síncrona, roda no threadpool, fora do event loop)."""
+    user.total_corrections_used += 1
+    db.commit()
+
+async def _process_omr(image, num_questions: int, return_images: bool, return_audit: bool,
+                       layout_version: str, user: users_db.User, db: Session, inline_images: bool = True,
+                       debug: bool = False):
     FREE_LIMIT = 50
     if user.plan_type == "free" and user.total_corrections_used >= FREE_LIMIT:
         raise HTTPException(
@@ -62,26 +152,23 @@ async def process_omr(data: dict, user: users_db.User = Depends(get_current_user
         )
 
     start_time = time.time()
-    image_base64 = data.get("image")
-    num_questions = int(data.get("num_questions", 10))
-    return_images = bool(data.get("return_images", False))
-    return_audit = bool(data.get("return_audit", False))
-    layout_version = data.get("layout_version", "v1")
-    
-    if not image_base64:
+    if not image:
         return {"success": False, "error": "Imagem não enviada"}
         
-    result = omr.process_image(
-        image_base64, 
+    result = await _read_sheet(
+        "omr_process",
+        image, 
+        debug=debug,
         num_questions=num_questions, 
         return_images=return_images, 
         return_audit=return_audit, 
-        layout_version=layout_version
+        layout_version=layout_version,
+        inline_images=inline_images
     )
+    result.update(_artifact_urls(result))
     
     if result.get("success"):
-        user.total_corrections_used += 1
-        db.commit()
+        await run_in_threadpool(_contar_correcao, user, db)
 
     duration = time.time() - start_time
     telemetry = {
@@ -93,6 +180,119 @@ async def process_omr(data: dict, user: users_db.User = Depends(get_current_user
     logger.info(f"OMR_STAT: {json.dumps(telemetry)}")
     return result
 
+@router.post("/omr/process")
+async def process_omr(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    return await _process_omr(
+        data.get("image"),
+        num_questions=int(data.get("num_questions", 10)),
+        return_images=bool(data.get("return_images", False)),
+        return_audit=bool(data.get("return_audit", False)),
+        layout_version=data.get("layout_version", "v1"),
+        user=user,
+        db=db,
+        inline_images=bool(data.get("inline_images", True)),
+        debug=bool(data.get("debug", False))
+    )
+
+@router.post("/omr/process/upload")
+async def process_omr_upload(
+    file: UploadFile = File(...),
+    num_questions: int = Form(10),
+    return_images: bool = Form(False),
+    return_audit: bool = Form(False),
+    layout_version: str = Form("v1"),
+    inline_images: bool = Form(True),
+    debug: bool = Form(False),
+    user: users_db.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Variante multipart de /omr/process: recebe o JPEG cru em vez de base64."""
+    return await _process_omr(
+        await file.read(),
+        num_questions=num_questions,
+        return_images=return_images,
+        return_audit=return_audit,
+        layout_version=layout_version,
+        user=user,
+        db=db,
+        inline_images=inline_images,
+        debug=debug
+    )
+
+@router.get("/omr/metrics")
+async def get_omr_metrics(reset: bool = False, user: users_db.User = Depends(get_current_user)):
+    """
+    Histogramas de tempo por etapa do OMR e contadores (rejeições por motivo, estratégia
+    que achou as âncoras, motivos de revisão) desde o início do processo ou do último reset.
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
+
+    snapshot = omr_metrics.snapshot()
+    snapshot["executor"] = {
+        "mode": omr_executor.mode,
+        "workers": omr_executor.max_workers,
+        "max_queue": omr_executor.max_queue,
+        "pending": omr_executor.pending,
+    }
+    snapshot["radar"] = {"sessions": len(anchor_tracker), **anchor_tracker.stats}
+    snapshot["idempotency"] = {"entries": len(idempotency_cache), **idempotency_cache.stats}
+    snapshot["admission"] = pixel_budget.snapshot()
+    snapshot["audit"] = {"audit": dict(audit_sink.stats), "failures": dict(failure_sink.stats)}
+    if reset:
+        omr_metrics.reset()
+    return snapshot
+
+# ─────────────────────────────────────────────
+# Artefatos OMR (imagens por URL em vez de base64)
+# ─────────────────────────────────────────────
+
+ARTIFACTS_PREFIX = "/omr/artifacts"
+# O nome do artefato depende do conteúdo: pode ficar em cache para sempre.
+# "private" porque são folhas de alunos (nada de cache compartilhado/CDN).
+ARTIFACT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+def _artifact_urls(result: dict) -> dict:
+    """URLs curtas dos artefatos gravados pelo engine (process_image com inline_images=False)."""
+    artifacts = result.get("artifacts") or {}
+    urls = {}
+    if artifacts.get("processed"):
+        urls["processed_image_url"] = f"{ARTIFACTS_PREFIX}/{artifacts['processed']}"
+    if artifacts.get("original"):
+        urls["original_image_url"] = f"{ARTIFACTS_PREFIX}/{artifacts['original']}"
+    if artifacts.get("audit"):
+        urls["audit_map_url"] = f"{ARTIFACTS_PREFIX}/{artifacts['audit']}/audit.jpg"
+    return urls
+
+def _artifact_response(name: str, path: Path, request: Request):
+    etag = f'"{name}"'
+    headers = {"Cache-Control": ARTIFACT_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=artifact_store.media_type(path.name), headers=headers)
+
+@router.get(ARTIFACTS_PREFIX + "/{name}")
+async def get_omr_artifact(name: str, request: Request):
+    """
+    Serve (em streaming) um artefato do artifact_store.
+    Sem login: o nome é um hash com chave secreta, impossível de adivinhar (vai direto em <img src>).
+    """
+    path = artifact_store.path(name)
+    if path is None or path.suffix == ".json":
+        raise HTTPException(status_code=404, detail="Artefato não encontrado")
+    return _artifact_response(name, path, request)
+
+@router.get(ARTIFACTS_PREFIX + "/{name}/audit.jpg")
+async def get_omr_audit_map(name: str, request: Request):
+    """Mapa de auditoria renderizado só no primeiro acesso, a partir do manifesto da leitura."""
+    path = artifact_store.path(artifact_store.derived_name(name))
+    if path is None:
+        rendered = await run_omr("render_audit_map", name)
+        path = artifact_store.path(rendered) if rendered else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artefato não encontrado")
+    return _artifact_response(f"{name}-audit", path, request)
+
 @router.post("/omr/preview")
 async def process_omr_preview(data: dict, x_api_key: str = Header(None)):
     if not API_KEY_SECRET:
@@ -103,93 +303,356 @@ async def process_omr_preview(data: dict, x_api_key: str = Header(None)):
     image_base64 = data.get("image")
     if not image_base64:
         return {"success": False, "error": "Imagem não enviada"}
-        
-    return omr.detect_anchors_only(image_base64)
+
+    result = await run_omr_admitted("omr_preview", image_megapixels(image_base64), "detect_anchors_only", image_base64)
+    result.pop("track", None)  # Estado interno do rastreador (âncoras em pixels, QR já lido)
+    return result
+
+async def _scan_anchors(image, session_id: Optional[str], user: users_db.User):
+    """
+    Roda o radar. Com session_id, o estado do frame anterior (âncoras travadas e QR já
+    lido) vai junto para o engine, que só rastreia as âncoras em vez de procurá-las
+    na imagem toda. O estado interno não volta para o cliente.
+    """
+    megapixels = image_megapixels(image)
+    if not session_id:
+        result = await run_omr_admitted("radar", megapixels, "detect_anchors_only", image)
+        result.pop("track", None)
+        return result
+
+    key = (user.id, session_id[:64])
+    result = await run_omr_admitted("radar", megapixels, "detect_anchors_only", image, track=anchor_tracker.get(key))
+    if "tracking" in result:
+        anchor_tracker.update(key, result)
+    result.pop("track", None)
+    return result
 
 @router.post("/provas/scan-anchors")
 async def scan_anchors(req: ScanAnchorsRequest, current_user: users_db.User = Depends(get_current_user)):
     """
     Endpoint ultrarrápido (Radar) que apenas detecta se as 4 âncoras estão presentes
-    e bem posicionadas na foto do cliente AR, sem processar QR Code ou bolhas.
+    e bem posicionadas na foto do cliente AR, sem processar as bolhas.
     """
     if not req.image:
         return {"success": False, "error": "Imagem vazia"}
     
     # O OMREngine já tem um método detect_anchors_only leve e otimizado para isso.
-    return omr.detect_anchors_only(req.image)
+    return await _scan_anchors(req.image, req.session_id, current_user)
 
-@router.post("/provas/processar")
-async def processar_prova(req: ProcessRequest, db: Session = Depends(get_db), current_user: users_db.User = Depends(get_current_user)):
+@router.post("/provas/scan-anchors/upload")
+async def scan_anchors_upload(
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    current_user: users_db.User = Depends(get_current_user),
+):
+    """Variante multipart do Radar: recebe o frame como JPEG cru em vez de base64."""
+    image_bytes = await file.read()
+    if not image_bytes:
+        return {"success": False, "error": "Imagem vazia"}
+
+    return await _scan_anchors(image_bytes, session_id, current_user)
+
+# ─────────────────────────────────────────────
+# WebSocket do Radar
+# ─────────────────────────────────────────────
+
+# Cabeçalho de cada frame binário: seq (uint32), largura e altura (uint16), big-endian
+WS_FRAME_HEADER = struct.Struct(">IHH")
+WS_MAX_FRAME_BYTES = int(os.getenv("OMR_WS_MAX_FRAME_BYTES", 1_000_000))
+
+def _parse_ws_frame(data: bytes):
+    """
+    Converte uma mensagem binária do radar em (seq, imagem).
+    Com largura e altura > 0 o corpo são os pixels em tons de cinza (largura*altura bytes);
+    com 0x0 o corpo é um JPEG/PNG. Levanta ValueError se o frame for inválido.
+    """
+    if len(data) < WS_FRAME_HEADER.size:
+        raise ValueError("Frame sem cabeçalho")
+    if len(data) > WS_MAX_FRAME_BYTES:
+        raise ValueError(f"Frame maior que {WS_MAX_FRAME_BYTES} bytes")
+    seq, width, height = WS_FRAME_HEADER.unpack_from(data)
+    body = data[WS_FRAME_HEADER.size:]
+    if width == 0 and height == 0:
+        return seq, body
+    if len(body) != width * height:
+        raise ValueError(f"Frame {width}x{height} com {len(body)} bytes")
+    return seq, np.frombuffer(body, np.uint8).reshape(height, width)
+
+@router.websocket("/ws/scan-anchors")
+async def scan_anchors_ws(websocket: WebSocket, token: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    """
+    Radar em tempo real. Autentica uma única vez (?token=<JWT>) e recebe frames binários
+    (ver _parse_ws_frame). Para cada frame processado responde um JSON no formato do
+    /provas/scan-anchors, mais "seq", "dropped" (frames descartados até agora) e "latency_ms".
+
+    Só o frame mais recente fica esperando: se chegar outro antes do engine terminar,
+    o anterior é descartado, então a latência não acumula quando o servidor atrasa.
+    As âncoras são rastreadas entre frames da conexão (ver anchor_tracker).
+    """
+    try:
+        user = user_from_token(token, db)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail)[:120])
+        return
+    finally:
+        db.close()  # Não segura conexão do banco enquanto o socket estiver aberto
+
+    await websocket.accept()
+    logger.info(f"Radar WebSocket conectado: user={getattr(user, 'id', None)}")
+
+    latest = None  # (recebido_em, bytes) do frame mais recente ainda não processado
+    dropped = 0
+    closed = False
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        nonlocal latest, dropped, closed
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if data is None:
+                    continue  # Mensagens de texto são ignoradas
+                if latest is not None:
+                    dropped += 1
+                latest = (time.perf_counter(), data)
+                frame_ready.set()
+        finally:
+            closed = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    track = None
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if closed:
+                break
+            if latest is None:
+                continue
+            received_at, data = latest
+            latest = None
+
+            seq = None
+            try:
+                seq, image = _parse_ws_frame(data)
+                # Frame cru (pixels em cinza) ou JPEG/PNG: os megapixels que o engine vai decodificar
+                megapixels = image.size / 1e6 if isinstance(image, np.ndarray) else image_megapixels(image)
+                async with pixel_budget.acquire(megapixels):
+                    result = await omr_executor.run("detect_anchors_only", image, track=track)
+            except ValueError as e:
+                result = {"success": False, "error": str(e)}
+            except (AdmissionRejected, OMRQueueFull):
+                result = {"success": False, "error": "Servidor ocupado"}
+            except OMRJobTimeout as e:
+                result = {"success": False, "error": str(e)}
+
+            if "tracking" in result:
+                # Frames com erro (inválido, fila cheia) mantêm o rastreamento anterior
+                anchor_tracker.count(result["tracking"])
+                track = result.get("track")
+            result.pop("track", None)
+            result.update(seq=seq, dropped=dropped, latency_ms=round((time.perf_counter() - received_at) * 1000, 1))
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        logger.info(f"Radar WebSocket encerrado: user={getattr(user, 'id', None)} descartados={dropped}")
+
+# ─────────────────────────────────────────────
+# Helpers de correção (compartilhados entre /provas/processar e /provas/processar-lote)
+# ─────────────────────────────────────────────
+
+def _identificar_prova(result: dict, gabarito_id: Optional[int], aluno_id: Optional[int]):
+    """
+    Combina o QR Code lido pelo OMR com os IDs informados manualmente.
+    Retorna (gabarito_id, aluno_id) ou levanta 422.
+    """
+    qr = result.get("qr_data")
+    informado_gid = gabarito_id
+
+    if qr and isinstance(qr, dict):
+        qr_aid = int(qr.get("aid") or 0)
+        qr_gid = int(qr.get("gid") or 0)
+
+        # Validação cruzada: QR gid deve bater com gabarito_id informado
+        if informado_gid and qr_gid and qr_gid != informado_gid:
+            raise HTTPException(status_code=422, detail="QR Code não corresponde ao gabarito selecionado.")
+
+        if qr_gid:
+            gabarito_id = qr_gid
+        if qr_aid:
+            aluno_id = qr_aid
+
+    if not gabarito_id:
+        raise HTTPException(status_code=422, detail="Identificação falhou: Gabarito não encontrado via QR Code e não informado manualmente.")
+
+    return gabarito_id, aluno_id
+
+
+def _calcular_nota(gabarito: models.Gabarito, answers: Optional[list]):
+    """Compara as respostas detectadas com o gabarito. Retorna (detectadas, acertos, nota)."""
+    corretas = parse_json_list(gabarito.respostas_corretas, "gabarito.respostas_corretas")
+    total = gabarito.num_questoes or len(corretas)
+    total = max(total, len(corretas))
+
+    # Respostas detectadas padronizadas (mesmo tamanho do gabarito)
+    detectadas = ((answers or []) + [None] * total)[:total]
+    corretas = (corretas + [None] * total)[:total]
+
+    acertos = sum(
+        1 for i in range(total)
+        if detectadas[i] is not None and corretas[i] is not None and detectadas[i] == corretas[i]
+    )
+    nota = (acertos / total) * 10 if total else 0.0
+    return detectadas, acertos, nota
+
+
+def _dados_auditoria(result: dict, layout_version: str) -> dict:
+    """Campos de auditoria OMR gravados no Resultado."""
+    needs_review = result.get("needs_review", False)
+    review_reasons = result.get("review_reasons", [])
+    second_pass = result.get("second_pass")
+    return {
+        "status_list": json.dumps(result.get("question_status")),
+        "confidence_scores": json.dumps(result.get("confidence_scores")),
+        "avg_confidence": float(result.get("avg_confidence") or 0.0),
+        "layout_version": layout_version,
+        "anchors_found": int(result.get("anchors_found") or 0),
+        "needs_review": needs_review,
+        "review_reasons": json.dumps(review_reasons) if review_reasons else None,
+        "review_status": "pending" if needs_review else "confirmed",
+        # Primeira e segunda leitura das questões relidas, e qual valeu
+        "second_pass": json.dumps(second_pass) if second_pass else None
+    }
+
+
+def _aplicar_resultado(db: Session, existente: Optional[models.Resultado], aluno_id: int, gabarito_id: int,
+                       detectadas: list, acertos: int, nota: float, audit_data: dict) -> models.Resultado:
+    """Atualiza ou cria o Resultado na sessão (sem commit)."""
+    if existente:
+        existente.acertos = acertos
+        existente.nota = nota
+        existente.respostas_aluno = dump_json_list(detectadas)
+        existente.data_correcao = datetime.utcnow()
+        for k, v in audit_data.items():
+            setattr(existente, k, v)
+        return existente
+
+    novo_resultado = models.Resultado(
+        aluno_id=aluno_id,
+        gabarito_id=gabarito_id,
+        acertos=acertos,
+        nota=nota,
+        respostas_aluno=dump_json_list(detectadas),
+        data_correcao=datetime.utcnow(),
+        **audit_data
+    )
+    db.add(novo_resultado)
+    return novo_resultado
+
+
+def _proxima_acao(quality: str) -> str:
+    """Determina a próxima ação para o frontend guiar a UX."""
+    if quality == "ok":
+        return "confirm"
+    if quality == "review":
+        return "review"
+    return "retake"
+
+
+def _gravar_correcao(result: dict, gabarito_id: int, aluno_id: Optional[int], layout_version: str,
+                     db: Session, current_user: users_db.User) -> dict:
+    """
+    Parte de banco do /provas/processar (síncrona, roda no threadpool): RBAC do gabarito,
+    matrícula do aluno, nota e gravação do Resultado. Retorna só valores prontos, para a
+    resposta não tocar em objetos expirados pelo commit no event loop.
+    """
+    # ===== 2. Autorização: professor só corrige seus gabaritos =====
+    if current_user.role != "admin":
+        gabarito = db.query(models.Gabarito).filter(
+            models.Gabarito.id == gabarito_id,
+            models.Gabarito.turmas.any(models.Turma.user_id == current_user.id)
+        ).first()
+    else:
+        gabarito = db.query(models.Gabarito).filter(models.Gabarito.id == gabarito_id).first()
+
+    if not gabarito:
+        raise HTTPException(status_code=422, detail=f"Gabarito ID {gabarito_id} não encontrado ou acesso negado.")
+
+    # ===== 3. Validação cruzada: aluno pertence às turmas do gabarito =====
+    aluno = None
+    if aluno_id:
+        turma_ids_gabarito = [t.id for t in gabarito.turmas]
+        aluno = db.query(models.Aluno).filter(
+            models.Aluno.id == aluno_id,
+            models.Aluno.turmas.any(models.Turma.id.in_(turma_ids_gabarito))
+        ).first()
+        if not aluno:
+            raise HTTPException(status_code=422, detail="Aluno não pertence às turmas deste gabarito.")
+
+    # ===== 5. Cálculo de acertos baseado no total do gabarito =====
+    detectadas, acertos, nota = _calcular_nota(gabarito, result.get("answers"))
+    correcao = {
+        "aluno_nome": aluno.nome if aluno else "Digitalizado (Não Identificado)",
+        "assunto": gabarito.assunto,
+        "acertos": acertos,
+        "nota": nota,
+        "resultado_id": None,
+    }
+
+    # ===== 6. Salvar resultado com auditoria OMR =====
+    if aluno:
+        resultado_existente = db.query(models.Resultado).filter(
+            models.Resultado.aluno_id == aluno.id,
+            models.Resultado.gabarito_id == gabarito.id
+        ).first()
+
+        resultado = _aplicar_resultado(
+            db, resultado_existente, aluno.id, gabarito.id,
+            detectadas, acertos, nota, _dados_auditoria(result, layout_version)
+        )
+        db.commit()
+        db.refresh(resultado)
+        correcao["resultado_id"] = resultado.id
+    return correcao
+
+
+async def _corrigir_prova(image, num_questions: Optional[int], req_gabarito_id: Optional[int], req_aluno_id: Optional[int],
+                          layout_version: Optional[str], db: Session, current_user: users_db.User,
+                          images: bool = False, inline_images: bool = False, debug: bool = False):
     try:
-        layout_version = req.layout_version or "v1.1-a4-calibrated"
-        result = omr.process_image(
-            req.image,
-            num_questions=req.num_questions,
+        layout_version = layout_version or "v1.1-a4-calibrated"
+        # Sem imagens de revisão pedidas, o engine decodifica a foto só em cinza (~1/3 da memória)
+        com_imagens = images or inline_images
+        result = await _read_sheet(
+            "provas_processar",
+            image,
+            debug=debug,
+            num_questions=num_questions,
             layout_version=layout_version,
-            return_images=True,
-            return_audit=True
+            return_images=com_imagens,
+            return_audit=com_imagens,
+            inline_images=inline_images
         )
         
         # Só bloqueia hard se for erro estrutural ou falta de âncoras (quality = reject)
         if result.get("quality") == "reject" or not result.get("success"):
-            raise HTTPException(status_code=422, detail=result.get("error", "Falha catastrófica no processamento da imagem."))
+            raise ReadRejected(result.get("error", "Falha catastrófica no processamento da imagem."))
 
         # ===== 1. QR Code e Identificação =====
-        qr = result.get("qr_data")
-        aluno_id = req.aluno_id
-        gabarito_id = req.gabarito_id
-        
-        if qr and isinstance(qr, dict):
-            qr_aid = int(qr.get("aid") or 0)
-            qr_gid = int(qr.get("gid") or 0)
-
-            # Validação cruzada: QR gid deve bater com gabarito_id informado
-            if req.gabarito_id and qr_gid and qr_gid != req.gabarito_id:
-                raise HTTPException(status_code=422, detail="QR Code não corresponde ao gabarito selecionado.")
-
-            if qr_gid:
-                gabarito_id = qr_gid
-            if qr_aid:
-                aluno_id = qr_aid
-            
-        if not gabarito_id:
-            raise HTTPException(status_code=422, detail="Identificação falhou: Gabarito não encontrado via QR Code e não informado manualmente.")
+        gabarito_id, aluno_id = _identificar_prova(result, req_gabarito_id, req_aluno_id)
 
-        # ===== 2. Autorização: professor só corrige seus gabaritos =====
-        if current_user.role != "admin":
-            gabarito = db.query(models.Gabarito).filter(
-                models.Gabarito.id == gabarito_id,
-                models.Gabarito.turmas.any(models.Turma.user_id == current_user.id)
-            ).first()
-        else:
-            gabarito = db.query(models.Gabarito).filter(models.Gabarito.id == gabarito_id).first()
+        # ===== 2, 3, 5 e 6: consultas e gravação no threadpool, fora do event loop =====
+        correcao = await run_in_threadpool(
+            _gravar_correcao, result, gabarito_id, aluno_id, layout_version, db, current_user
+        )
 
-        if not gabarito:
-            raise HTTPException(status_code=422, detail=f"Gabarito ID {gabarito_id} não encontrado ou acesso negado.")
-
-        # ===== 3. Validação cruzada: aluno pertence às turmas do gabarito =====
-        aluno = None
-        if aluno_id:
-            turma_ids_gabarito = [t.id for t in gabarito.turmas]
-            aluno = db.query(models.Aluno).filter(
-                models.Aluno.id == aluno_id,
-                models.Aluno.turmas.any(models.Turma.id.in_(turma_ids_gabarito))
-            ).first()
-            if not aluno:
-                raise HTTPException(status_code=422, detail="Aluno não pertence às turmas deste gabarito.")
-
-        # ===== 4. Parse robusto das respostas corretas =====
-        corretas = parse_json_list(gabarito.respostas_corretas, "gabarito.respostas_corretas")
-        total = gabarito.num_questoes or len(corretas)
-        total = max(total, len(corretas))
-
-        # Respostas detectadas padronizadas
-        detectadas = result.get("answers") or []
-        # Garante mesmo tamanho
-        detectadas = (detectadas + [None] * total)[:total]
-        corretas = (corretas + [None] * total)[:total]
-
-        # ===== 5. Qualidade OMR: Extrair métricas unificadas =====
+        # ===== 4. Qualidade OMR: Extrair métricas unificadas =====
         # As lógicas de rejeição migraram pro Engine (Etapas 2 e 3).
         # Aqui apenas repassamos o que o OMR Engine decidiu.
         quality = result.get("quality", "ok")
@@ -212,86 +675,30 @@ async def processar_prova(req: ProcessRequest, db: Session = Depends(get_db), cu
             "gabarito_id": gabarito_id if gabarito_id else "unknown"
         }))
 
-        # ===== 6. Cálculo de acertos baseado no total do gabarito =====
-        acertos = sum(
-            1 for i in range(total)
-            if detectadas[i] is not None and corretas[i] is not None and detectadas[i] == corretas[i]
-        )
-        nota = (acertos / total) * 10 if total else 0.0
-        
-        # ===== 7. Salvar resultado com auditoria OMR =====
-        resultado_id = None
-        if aluno_id and aluno:
-            resultado_existente = db.query(models.Resultado).filter(
-                models.Resultado.aluno_id == aluno.id,
-                models.Resultado.gabarito_id == gabarito.id
-            ).first()
-            
-            
-            audit_data = {
-                "status_list": json.dumps(result.get("question_status")),
-                "confidence_scores": json.dumps(result.get("confidence_scores")),
-                "avg_confidence": avg_conf,
-                "layout_version": layout_version,
-                "anchors_found": int(result.get("anchors_found") or 0),
-                "needs_review": needs_review,
-                "review_reasons": json.dumps(review_reasons) if review_reasons else None,
-                "review_status": "pending" if needs_review else "confirmed"
-            }
-            
-            db_audit_data = audit_data
-            
-            if resultado_existente:
-                resultado_existente.acertos = acertos
-                resultado_existente.nota = nota
-                resultado_existente.respostas_aluno = dump_json_list(detectadas)
-                resultado_existente.data_correcao = datetime.utcnow()
-                for k, v in db_audit_data.items():
-                    setattr(resultado_existente, k, v)
-                db.commit()
-                db.refresh(resultado_existente)
-                resultado_id = resultado_existente.id
-            else:
-                novo_resultado = models.Resultado(
-                    aluno_id=aluno.id,
-                    gabarito_id=gabarito.id,
-                    acertos=acertos,
-                    nota=nota,
-                    respostas_aluno=dump_json_list(detectadas),
-                    data_correcao=datetime.utcnow(),
-                    **db_audit_data
-                )
-                db.add(novo_resultado)
-                db.commit()
-                db.refresh(novo_resultado)
-                resultado_id = novo_resultado.id
-
-        # Determinar a próxima ação para o frontend guiar a UX
-        if quality == "ok":
-            next_action = "confirm"
-        elif quality == "review":
-            next_action = "review"
-        else:
-            next_action = "retake"
-
-        return {
+        resposta = {
             "success": True,
             "quality": quality,
             "needs_review": needs_review,
             "review_reasons": review_reasons,
-            "next_action": next_action,
+            "next_action": _proxima_acao(quality),
             "aluno_id": aluno_id,
-            "aluno_nome": aluno.nome if aluno else "Digitalizado (Não Identificado)",
+            "aluno_nome": correcao["aluno_nome"],
             "gabarito_id": gabarito_id,
-            "assunto": gabarito.assunto,
-            "acertos": acertos,
-            "nota": round(nota, 1),
-            "resultado_id": resultado_id,
+            "assunto": correcao["assunto"],
+            "acertos": correcao["acertos"],
+            "nota": round(correcao["nota"], 1),
+            "resultado_id": correcao["resultado_id"],
+            "second_pass": result.get("second_pass"),
             "perspective_warning": result.get("perspective_warning"),
-            "processed_image": result.get("processed_image"),
-            "original_image": result.get("original_image"),
-            "audit_map": result.get("audit_map")
+            **_artifact_urls(result)
         }
+        if inline_images:
+            resposta["processed_image"] = result.get("processed_image")
+            resposta["original_image"] = result.get("original_image")
+            resposta["audit_map"] = result.get("audit_map")
+        if debug:
+            resposta["telemetry"] = result.get("telemetry")
+        return resposta
 
     except HTTPException:
         raise
@@ -299,6 +706,366 @@ async def processar_prova(req: ProcessRequest, db: Session = Depends(get_db), cu
         logger.error(f"Erro no processamento de prova: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+
+async def _corrigir_prova_idempotente(image, num_questions: Optional[int], gabarito_id: Optional[int],
+                                      aluno_id: Optional[int], layout_version: Optional[str], db: Session,
+                                      current_user: users_db.User, response: Response,
+                                      idempotency_key: Optional[str], images: bool = False, inline_images: bool = False,
+                                      debug: bool = False):
+    """
+    _corrigir_prova com cache de idempotência (ver idempotency.py): o reenvio da mesma
+    foto, ou da mesma Idempotency-Key, devolve a resposta guardada sem rodar o OMR e sem
+    gravar o Resultado de novo. Respostas reaproveitadas vêm com o header REPLAY_HEADER.
+    """
+    if isinstance(image, str):
+        # Decodifica uma vez aqui: o hash é dos bytes da imagem e o engine recebe os bytes prontos
+        try:
+            image = base64.b64decode(image.split(',')[-1])
+        except (binascii.Error, ValueError):
+            pass  # O engine rejeita a imagem como antes
+    layout_version = layout_version or "v1.1-a4-calibrated"
+    conteudo = image if isinstance(image, bytes) else str(image).encode()
+    fp = fingerprint(conteudo, layout_version, gabarito_id, aluno_id, num_questions, images, inline_images)
+
+    keys = [(current_user.id, "conteudo", fp)]
+    if idempotency_key:
+        keys.insert(0, (current_user.id, "chave", idempotency_key[:128]))
+
+    try:
+        resposta, reaproveitada = await idempotency_cache.run(
+            keys, fp,
+            lambda: _corrigir_prova(image, num_questions, gabarito_id, aluno_id, layout_version, db, current_user,
+                                    images=images, inline_images=inline_images, debug=debug),
+            # Imagens em base64 (clientes antigos) ocupariam MBs por resposta no cache
+            cacheable=not inline_images
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key já usada com outra imagem ou outros parâmetros.")
+
+    if reaproveitada:
+        response.headers[REPLAY_HEADER] = "true"
+        logger.info(f"Correção reaproveitada do cache de idempotência: user={current_user.id}")
+    return resposta
+
+@router.post("/provas/processar")
+async def processar_prova(
+    req: ProcessRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: users_db.User = Depends(get_current_user)
+):
+    return await _corrigir_prova_idempotente(
+        req.image, req.num_questions, req.gabarito_id, req.aluno_id, req.layout_version, db, current_user,
+        response, idempotency_key, images=req.images, inline_images=req.inline_images, debug=req.debug
+    )
+
+@router.post("/provas/processar/upload")
+async def processar_prova_upload(
+    response: Response,
+    file: UploadFile = File(...),
+    num_questions: Optional[int] = Form(10),
+    gabarito_id: Optional[int] = Form(None),
+    aluno_id: Optional[int] = Form(None),
+    layout_version: Optional[str] = Form(None),
+    images: bool = Form(False),
+    inline_images: bool = Form(False),
+    debug: bool = Form(False),
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: users_db.User = Depends(get_current_user)
+):
+    """
+    Variante multipart de /provas/processar: o JPEG chega cru (sem base64),
+    ~33% menor no upload e sem cópias intermediárias da imagem em memória.
+    """
+    return await _corrigir_prova_idempotente(
+        await file.read(), num_questions, gabarito_id, aluno_id, layout_version, db, current_user,
+        response, idempotency_key, images=images, inline_images=inline_images, debug=debug
+    )
+
+def _gravar_lote(validas: list, layout_version: str, db: Session, current_user: users_db.User):
+    """
+    Parte de banco do /provas/processar-lote (síncrona, roda no threadpool). Completa cada
+    folha com nota, assunto e resultado_id (ou error) e grava tudo em uma transação.
+    Retorna (nº de folhas gravadas, nomes dos alunos).
+    """
+    # ===== 3. Gabaritos (uma consulta, já com RBAC e turmas) =====
+    gabarito_ids = {f["gabarito_id"] for f in validas}
+    gabaritos = {}
+    if gabarito_ids:
+        query = db.query(models.Gabarito).options(selectinload(models.Gabarito.turmas)).filter(
+            models.Gabarito.id.in_(gabarito_ids)
+        )
+        if current_user.role != "admin":
+            query = query.filter(models.Gabarito.turmas.any(models.Turma.user_id == current_user.id))
+        gabaritos = {g.id: g for g in query.all()}
+
+    # ===== 4. Matrículas: (aluno, turma) para todos os alunos do lote (uma consulta) =====
+    aluno_ids = {f["aluno_id"] for f in validas if f["aluno_id"]}
+    turma_ids = {t.id for g in gabaritos.values() for t in g.turmas}
+    turmas_por_aluno: dict = {}
+    nomes_alunos: dict = {}
+    if aluno_ids and turma_ids:
+        rows = db.query(models.Aluno.id, models.Aluno.nome, models.aluno_turma.c.turma_id).join(
+            models.aluno_turma, models.aluno_turma.c.aluno_id == models.Aluno.id
+        ).filter(
+            models.Aluno.id.in_(aluno_ids),
+            models.aluno_turma.c.turma_id.in_(turma_ids)
+        ).all()
+        for a_id, a_nome, t_id in rows:
+            turmas_por_aluno.setdefault(a_id, set()).add(t_id)
+            nomes_alunos[a_id] = a_nome
+
+    # ===== 5. Resultados existentes (uma consulta) =====
+    existentes = {}
+    if aluno_ids and gabaritos:
+        for r in db.query(models.Resultado).filter(
+            models.Resultado.aluno_id.in_(aluno_ids),
+            models.Resultado.gabarito_id.in_(gabaritos.keys())
+        ).all():
+            existentes[(r.aluno_id, r.gabarito_id)] = r
+
+    # ===== 6. Pontuação e gravação (uma transação) =====
+    gravados = []
+    for folha in validas:
+        gabarito = gabaritos.get(folha["gabarito_id"])
+        if not gabarito:
+            folha["error"] = f"Gabarito ID {folha['gabarito_id']} não encontrado ou acesso negado."
+            continue
+
+        aluno_id = folha["aluno_id"]
+        aluno_ok = bool(aluno_id) and bool(turmas_por_aluno.get(aluno_id, set()) & {t.id for t in gabarito.turmas})
+        if aluno_id and not aluno_ok:
+            folha["error"] = "Aluno não pertence às turmas deste gabarito."
+            continue
+
+        result = folha["result"]
+        detectadas, acertos, nota = _calcular_nota(gabarito, result.get("answers"))
+        folha.update({"acertos": acertos, "nota": nota, "assunto": gabarito.assunto})
+
+        if aluno_ok:
+            chave = (aluno_id, gabarito.id)
+            # Folhas repetidas do mesmo aluno no lote: a última prevalece
+            existentes[chave] = folha["resultado"] = _aplicar_resultado(
+                db, existentes.get(chave), aluno_id, gabarito.id,
+                detectadas, acertos, nota, _dados_auditoria(result, layout_version)
+            )
+            gravados.append(folha)
+
+    if gravados:
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erro ao gravar lote de resultados: {e}")
+            raise HTTPException(status_code=500, detail=f"Erro ao gravar resultados: {str(e)}")
+
+    for folha in gravados:
+        # Depois do commit (ids novos); folhas repetidas apontam para o mesmo Resultado
+        folha["resultado_id"] = folha.pop("resultado").id
+    return len(gravados), nomes_alunos
+
+
+@router.post("/provas/processar-lote")
+async def processar_lote(req: ProcessLoteRequest, db: Session = Depends(get_db), current_user: users_db.User = Depends(get_current_user)):
+    """
+    Corrige uma pilha de cartões de uma vez.
+    O OMR roda em paralelo no executor; gabaritos, matrículas e resultados existentes
+    são resolvidos com uma consulta cada e tudo é gravado em uma única transação.
+    """
+    if not req.images:
+        raise HTTPException(status_code=422, detail="Nenhuma imagem enviada.")
+    if len(req.images) > LOTE_MAX_IMAGENS:
+        raise HTTPException(status_code=422, detail=f"Máximo de {LOTE_MAX_IMAGENS} imagens por lote.")
+    if req.aluno_ids is not None and len(req.aluno_ids) != len(req.images):
+        raise HTTPException(status_code=422, detail="aluno_ids deve ter o mesmo tamanho de images.")
+
+    layout_version = req.layout_version or "v1.1-a4-calibrated"
+    aluno_ids_informados = req.aluno_ids or [None] * len(req.images)
+
+    # ===== 1. OMR em paralelo (limitado ao nº de workers para não estourar a fila) =====
+    limite = asyncio.Semaphore(omr_executor.max_workers)
+
+    async def _ler(image: str):
+        async with limite:
+            return await _read_sheet(
+                "provas_processar_lote",
+                image,
+                debug=req.debug,
+                num_questions=req.num_questions,
+                layout_version=layout_version,
+                return_images=False,
+                return_audit=False
+            )
+
+    leituras = await asyncio.gather(*(_ler(img) for img in req.images), return_exceptions=True)
+
+    # ===== 2. Identificação de cada folha =====
+    folhas = []
+    for i, leitura in enumerate(leituras):
+        folha = {"index": i, "result": None, "gabarito_id": None, "aluno_id": None, "error": None}
+        folhas.append(folha)
+        if req.debug and isinstance(leitura, dict):
+            folha["telemetry"] = leitura.get("telemetry")
+        if isinstance(leitura, HTTPException):
+            folha["error"] = leitura.detail
+            continue
+        if isinstance(leitura, BaseException):
+            logger.error(f"Erro no OMR do lote (folha {i}): {leitura}")
+            folha["error"] = f"Erro interno: {str(leitura)}"
+            continue
+        if leitura.get("quality") == "reject" or not leitura.get("success"):
+            folha["error"] = leitura.get("error", "Falha catastrófica no processamento da imagem.")
+            continue
+        try:
+            folha["gabarito_id"], folha["aluno_id"] = _identificar_prova(leitura, req.gabarito_id, aluno_ids_informados[i])
+        except HTTPException as e:
+            folha["error"] = e.detail
+            continue
+        folha["result"] = leitura
+
+    validas = [f for f in folhas if f["error"] is None]
+
+    # ===== 3 a 6. Consultas e gravação no threadpool, fora do event loop =====
+    gravados, nomes_alunos = await run_in_threadpool(_gravar_lote, validas, layout_version, db, current_user)
+
+    # ===== 7. Resposta por folha =====
+    saida = []
+    for folha in folhas:
+        if folha["error"] is not None:
+            saida.append({"index": folha["index"], "success": False, "error": folha["error"]})
+            if req.debug:
+                saida[-1]["telemetry"] = folha.get("telemetry")
+            continue
+
+        result = folha["result"]
+        aluno_id = folha["aluno_id"]
+        quality = result.get("quality", "ok")
+        resultado_id = folha.get("resultado_id")
+        saida.append({
+            "index": folha["index"],
+            "success": True,
+            "quality": quality,
+            "needs_review": result.get("needs_review", False),
+            "review_reasons": result.get("review_reasons", []),
+            "next_action": _proxima_acao(quality),
+            "aluno_id": aluno_id,
+            "aluno_nome": nomes_alunos[aluno_id] if resultado_id else "Digitalizado (Não Identificado)",
+            "gabarito_id": folha["gabarito_id"],
+            "assunto": folha["assunto"],
+            "acertos": folha["acertos"],
+            "nota": round(folha["nota"], 1),
+            "resultado_id": resultado_id,
+            "second_pass": result.get("second_pass"),
+            "perspective_warning": result.get("perspective_warning"),
+        })
+        if req.debug:
+            saida[-1]["telemetry"] = folha.get("telemetry")
+
+    sucesso = sum(1 for s_ in saida if s_["success"])
+    logger.info(json.dumps({
+        "event": "omr_batch",
+        "total": len(saida),
+        "success": sucesso,
+        "saved": gravados,
+        "layout_version": layout_version
+    }))
+
+    return {"success": True, "total": len(saida), "processadas": sucesso, "resultados": saida}
+
+@router.post("/provas/processar-scanner")
+async def processar_scanner(
+    file: UploadFile = File(...),
+    gabarito_id: Optional[int] = Form(None),
+    num_questions: Optional[int] = Form(10),
+    layout_version: Optional[str] = Form(None),
+    debug: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: users_db.User = Depends(get_current_user)
+):
+    """
+    Corrige o arquivo de um scanner de documentos: TIFF multipágina e/ou imagem com várias
+    folhas (ex.: duas lado a lado). Cada página é separada em folhas (OMREngine.split_scan) e
+    cada folha passa pelo fluxo de /provas/processar, em paralelo no executor, com a sua
+    própria sessão do banco.
+    A resposta é NDJSON: uma linha por folha, na ordem em que terminam ({"page", "sheet", ...}
+    como em /provas/processar, ou "success": false com "error"), e uma linha final de resumo
+    ({"done": true, ...}). O app mostra as notas enquanto o resto do arquivo é lido.
+    """
+    data = await file.read()
+    if not data:
+        raise HTTPException(status_code=422, detail="Arquivo vazio.")
+    layout_version = layout_version or "v1.1-a4-calibrated"
+    limite = asyncio.Semaphore(omr_executor.max_workers)
+    fila: asyncio.Queue = asyncio.Queue()
+
+    async def _corrigir_folha(page: int, sheet: int, image: bytes):
+        async with limite:
+            # Uma sessão por folha (mesmo engine da requisição): as gravações das folhas
+            # rodam em paralelo no threadpool e uma Session não pode ser compartilhada entre threads
+            folha_db = Session(bind=db.get_bind(), autoflush=False)
+            try:
+                resposta = await _corrigir_prova(image, num_questions, gabarito_id, None, layout_version,
+                                                 folha_db, current_user, debug=debug)
+            except HTTPException as e:
+                resposta = {"success": False, "error": e.detail}
+            finally:
+                await run_in_threadpool(folha_db.close)
+        await fila.put({"page": page, "sheet": sheet, **resposta})
+
+    async def _separar(tarefas: list):
+        # Separa uma página por vez (só ela fica decodificada); as folhas já vão sendo corrigidas
+        paginas = 0
+        try:
+            # O tamanho de cada página vem do cabeçalho: o limite de páginas e o pixel_budget
+            # são verificados antes de decodificar a página
+            while (megapixels := scan_page_megapixels(data, paginas)) is not None:
+                if paginas == SCANNER_MAX_PAGINAS:
+                    await fila.put({"page": paginas, "sheet": None, "success": False,
+                                    "error": f"Máximo de {SCANNER_MAX_PAGINAS} páginas por arquivo."})
+                    break
+                folhas = await run_omr_admitted("provas_processar_scanner", megapixels,
+                                                "split_scan", data, paginas, layout_version)
+                if folhas is None:
+                    break
+                for sheet, image in enumerate(folhas):
+                    tarefas.append(asyncio.create_task(_corrigir_folha(paginas, sheet, image)))
+                paginas += 1
+        except HTTPException as e:
+            await fila.put({"page": paginas, "sheet": None, "success": False, "error": e.detail})
+        except Exception as e:
+            logger.error(f"Erro ao separar as folhas do scanner (página {paginas}): {e}")
+            await fila.put({"page": paginas, "sheet": None, "success": False, "error": f"Erro interno: {str(e)}"})
+        await asyncio.gather(*tarefas)
+        await fila.put(None)
+        return paginas
+
+    async def _linhas():
+        tarefas: list = []
+        separacao = asyncio.create_task(_separar(tarefas))
+        total = sucesso = 0
+        try:
+            while (linha := await fila.get()) is not None:
+                total += 1
+                sucesso += bool(linha.get("success"))
+                yield json.dumps(linha, default=str) + "\n"
+            paginas = await separacao
+            logger.info(json.dumps({
+                "event": "omr_scanner",
+                "pages": paginas,
+                "total": total,
+                "success": sucesso,
+                "layout_version": layout_version
+            }))
+            yield json.dumps({"done": True, "paginas": paginas, "total": total, "processadas": sucesso}) + "\n"
+        finally:
+            # Cliente desconectou no meio: não continua lendo o resto do arquivo
+            for tarefa in [separacao, *tarefas]:
+                tarefa.cancel()
+
+    return StreamingResponse(_linhas(), media_type="application/x-ndjson")
+
 @router.post("/provas/revisar")
 def revisar_prova(req: ReviewRequest, db: Session = Depends(get_db), current_user: users_db.User = Depends(get_current_user)):
     """
@@ -371,7 +1138,7 @@ class SalvarFotoRequest(BaseModel):
     timestamp: Optional[str] = None
 
 @router.post("/provas/salvar-foto")
-async def salvar_foto_scanner(req: SalvarFotoRequest, current_user: users_db.User = Depends(get_current_user)):
+def salvar_foto_scanner(req: SalvarFotoRequest, current_user: users_db.User = Depends(get_current_user)):
     """
     Salva a foto capturada pelo scanner na pasta scannerfoto/ para auditoria.
     """
@@ -20,7 +20,7 @@ class SyncRequest(BaseModel):
 API_KEY_SECRET = os.getenv("API_KEY_SECRET")
 
 @router.post("/batch/sync")
-async def batch_sync(request: SyncRequest, x_api_key: str = Header(None), current_user: models.User = Depends(get_current_user)):
+def batch_sync(request: SyncRequest, x_api_key: str = Header(None), current_user: models.User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
         
@@ -44,7 +44,7 @@ async def batch_sync(request: SyncRequest, x_api_key: str = Header(None), curren
     }
 
 @router.get("/relatorios/{turma_id}")
-async def get_relatorio(turma_id: int, disciplina: str = None):
+def get_relatorio(turma_id: int, disciplina: str = None):
     # Mock de geração de relatório
     base_data = [
         {"materia": "Matemática", "media": 6.8},
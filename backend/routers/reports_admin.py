@@ -304,8 +304,18 @@ def calcular_idade(data_nascimento: str) -> int:
 # ==================== FUNÇÕES OTIMIZADAS (BATCH) ====================
 
 def carregar_frequencias_batch(db: Session, dias: List[str], aluno_ids: List[int] = None) -> dict:
-    """Carrega todas as frequências de uma vez e retorna dict por aluno_id"""
-    query = db.query(models.Frequencia).filter(models.Frequencia.data.in_(dias))
+    """
+    Carrega todas as frequências de uma vez e retorna dict por aluno_id.
+    Só as colunas usadas nos relatórios (linhas, não objetos ORM): num período longo são
+    dezenas de milhares de registros e montar cada objeto custava a maior parte do relatório.
+    """
+    query = db.query(
+        models.Frequencia.aluno_id,
+        models.Frequencia.turma_id,
+        models.Frequencia.data,
+        models.Frequencia.presente,
+        models.Frequencia.falta_justificada,
+    ).filter(models.Frequencia.data.in_(dias))
     if aluno_ids:
         query = query.filter(models.Frequencia.aluno_id.in_(aluno_ids))
     
@@ -396,7 +406,7 @@ def calcular_faltas_consecutivas_batch(frequencias_aluno: List, dias_ordenados:
 # ==================== ENDPOINTS ====================
 
 @router.get("/configuracao")
-async def get_configuracao_frequencia(
+def get_configuracao_frequencia(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -427,7 +437,7 @@ async def get_configuracao_frequencia(
 
 
 @router.post("/configuracao")
-async def update_configuracao_frequencia(
+def update_configuracao_frequencia(
     request: ConfiguracaoFrequenciaRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -451,7 +461,7 @@ async def update_configuracao_frequencia(
 # ==================== 1. RELATÓRIO DE INFREQUÊNCIA POR PERÍODO (OTIMIZADO) ====================
 
 @router.post("/infrequencia")
-async def relatorio_infrequencia(
+def relatorio_infrequencia(
     request: PeriodoRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -585,7 +595,7 @@ async def relatorio_infrequencia(
 # ==================== 2. RELATÓRIO DE FALTAS CONSECUTIVAS (OTIMIZADO) ====================
 
 @router.get("/faltas-consecutivas")
-async def relatorio_faltas_consecutivas(
+def relatorio_faltas_consecutivas(
     minimo: int = Query(2, description="Mínimo de faltas consecutivas"),
     turma_id: Optional[int] = None,
     db: Session = Depends(get_db),
@@ -699,7 +709,7 @@ async def relatorio_faltas_consecutivas(
 # ==================== 3. ALUNOS EM RISCO DE EVASÃO (OTIMIZADO) ====================
 
 @router.post("/risco-evasao")
-async def relatorio_risco_evasao(
+def relatorio_risco_evasao(
     request: PeriodoRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -821,7 +831,7 @@ async def relatorio_risco_evasao(
 # ==================== 4. POSSÍVEL EVASÃO / ABANDONO ====================
 
 @router.get("/evasao-abandono")
-async def relatorio_evasao_abandono(
+def relatorio_evasao_abandono(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -903,7 +913,7 @@ async def relatorio_evasao_abandono(
 # ==================== 5. MENORES COM COMUNICAÇÃO OBRIGATÓRIA (OTIMIZADO) ====================
 
 @router.get("/menores-comunicacao")
-async def relatorio_menores_comunicacao(
+def relatorio_menores_comunicacao(
     minimo_faltas: int = Query(3, description="Mínimo de faltas para alerta"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1038,7 +1048,7 @@ async def relatorio_menores_comunicacao(
 # ==================== 6. RELATÓRIO GERENCIAL (OTIMIZADO) ====================
 
 @router.post("/gerencial")
-async def relatorio_gerencial(
+def relatorio_gerencial(
     request: PeriodoRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1171,7 +1181,7 @@ async def relatorio_gerencial(
 # ==================== GESTÃO DE ACOMPANHAMENTO ====================
 
 @router.post("/acompanhamento")
-async def registrar_acompanhamento(
+def registrar_acompanhamento(
     request: AcompanhamentoRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1214,7 +1224,7 @@ async def registrar_acompanhamento(
 
 
 @router.get("/acompanhamento/aluno/{aluno_id}")
-async def listar_acompanhamentos_aluno(
+def listar_acompanhamentos_aluno(
     aluno_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1240,7 +1250,7 @@ async def listar_acompanhamentos_aluno(
 
 
 @router.put("/acompanhamento/{acompanhamento_id}/retorno")
-async def registrar_retorno_aluno(
+def registrar_retorno_aluno(
     acompanhamento_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1277,7 +1287,7 @@ async def registrar_retorno_aluno(
 
 
 @router.put("/aluno/status")
-async def atualizar_status_aluno(
+def atualizar_status_aluno(
     request: AtualizarStatusAlunoRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1303,7 +1313,7 @@ async def atualizar_status_aluno(
 # ==================== ALERTAS ====================
 
 @router.get("/alertas")
-async def listar_alertas(
+def listar_alertas(
     status: Optional[str] = Query(None, description="Filtrar por status: aberto, em_acompanhamento, resolvido"),
     nivel: Optional[str] = Query(None, description="Filtrar por nível: atencao, alerta, risco, critico"),
     limit: int = Query(50, description="Limite de resultados"),
@@ -1342,7 +1352,7 @@ async def listar_alertas(
 
 
 @router.post("/gerar-alertas")
-async def gerar_alertas_automaticos(
+def gerar_alertas_automaticos(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -1486,7 +1496,7 @@ async def gerar_alertas_automaticos(
 # ==================== DASHBOARD RESUMO ====================
 
 @router.get("/dashboard")
-async def dashboard_frequencia(
+def dashboard_frequencia(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -1604,7 +1614,7 @@ async def dashboard_frequencia(
 
 
 @router.get("/dashboard/alunos")
-async def dashboard_alunos_por_situacao(
+def dashboard_alunos_por_situacao(
     situacao: str = Query(..., description="ativo, infrequente, em_risco, abandono_presumido, evadido"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1685,7 +1695,7 @@ async def dashboard_alunos_por_situacao(
 # ==================== HISTÓRICO DETALHADO DE FREQUÊNCIA ====================
 
 @router.get("/aluno/{aluno_id}/historico-frequencia")
-async def historico_frequencia_aluno(
+def historico_frequencia_aluno(
     aluno_id: int,
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
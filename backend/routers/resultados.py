@@ -28,7 +28,7 @@ class ResultadoCreate(BaseModel):
     registrar_presenca: Optional[bool] = False
 
 @router.get("/resultados")
-async def get_resultados(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_resultados(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     query = db.query(models.Resultado).options(
         joinedload(models.Resultado.aluno),
         joinedload(models.Resultado.gabarito).joinedload(models.Gabarito.turmas)
@@ -57,7 +57,7 @@ async def get_resultados(user: users_db.User = Depends(get_current_user), db: Se
     ]
 
 @router.get("/resultados/turma/{turma_id}/aluno/{aluno_id}")
-async def get_resultados_aluno_turma(turma_id: int, aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_resultados_aluno_turma(turma_id: int, aluno_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if user.role != "admin":
         turma = db.query(models.Turma).filter(models.Turma.id == turma_id, models.Turma.user_id == user.id).first()
         if not turma:
@@ -79,7 +79,7 @@ async def get_resultados_aluno_turma(turma_id: int, aluno_id: int, user: users_d
     return resp
 
 @router.get("/resultados/turma/{turma_id}")
-async def get_resultados_by_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_resultados_by_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if user.role != "admin":
         turma = db.query(models.Turma).filter(models.Turma.id == turma_id, models.Turma.user_id == user.id).first()
         if not turma:
@@ -109,7 +109,7 @@ async def get_resultados_by_turma(turma_id: int, user: users_db.User = Depends(g
     return resp
 
 @router.get("/resultados/gabarito/{gabarito_id}")
-async def get_resultados_by_gabarito(gabarito_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_resultados_by_gabarito(gabarito_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     gabarito = db.query(models.Gabarito).filter(models.Gabarito.id == gabarito_id).first()
     if not gabarito:
         raise HTTPException(status_code=404, detail="Gabarito não encontrado")
@@ -138,7 +138,7 @@ async def get_resultados_by_gabarito(gabarito_id: int, user: users_db.User = Dep
     return resp
 
 @router.post("/resultados")
-async def create_resultado_manual(data: ResultadoCreate, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_resultado_manual(data: ResultadoCreate, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     gabarito = db.query(models.Gabarito).filter(models.Gabarito.id == data.gabarito_id).first()
     if not gabarito:
         raise HTTPException(status_code=404, detail="Gabarito não encontrado")
@@ -227,7 +227,7 @@ async def create_resultado_manual(data: ResultadoCreate, user: users_db.User = D
         return {"message": "Resultado registrado com sucesso", "id": novo_resultado.id, "nota": nota}
 
 @router.patch("/resultados/{resultado_id}")
-async def update_resultado(resultado_id: int, data: ResultadoUpdate, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_resultado(resultado_id: int, data: ResultadoUpdate, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     resultado = db.query(models.Resultado).filter(models.Resultado.id == resultado_id).first()
     if not resultado:
         raise HTTPException(status_code=404, detail="Resultado não encontrado")
@@ -256,7 +256,7 @@ async def update_resultado(resultado_id: int, data: ResultadoUpdate, user: users
     return {"message": "Resultado atualizado com sucesso", "id": resultado.id}
 
 @router.delete("/resultados/{resultado_id}")
-async def delete_resultado(resultado_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_resultado(resultado_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     resultado = db.query(models.Resultado).filter(models.Resultado.id == resultado_id).first()
     if not resultado:
         raise HTTPException(status_code=404, detail="Resultado não encontrado")
@@ -12,7 +12,7 @@ router = APIRouter(prefix="/turmas", tags=["turmas"])
 logger = logging.getLogger("lerprova-api")
 
 @router.get("")
-async def get_turmas(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_turmas(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     query = db.query(models.Turma)
     if user.role != "admin":
         query = query.filter(models.Turma.user_id == user.id)
@@ -33,7 +33,7 @@ async def get_turmas(user: users_db.User = Depends(get_current_user), db: Sessio
 
 
 @router.get("/master")
-async def get_master_turmas(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_master_turmas(user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Lista as turmas da base central (criadas por admins)."""
     # Busca usuários que são admin
     admin_ids = [u.id for u in db.query(users_db.User.id).filter(users_db.User.role == "admin").all()]
@@ -50,7 +50,7 @@ async def get_master_turmas(user: users_db.User = Depends(get_current_user), db:
 
 
 @router.get("/{turma_id}")
-async def get_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     turma = db.query(models.Turma).filter(models.Turma.id == turma_id).first()
     if not turma:
         raise HTTPException(status_code=404, detail="Turma não encontrada")
@@ -70,7 +70,7 @@ async def get_turma(turma_id: int, user: users_db.User = Depends(get_current_use
 
 
 @router.post("")
-async def create_turma(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_turma(data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     nome = data.get("nome")
     disciplina = data.get("disciplina")
     dias_semana = data.get("dias_semana")
@@ -93,7 +93,7 @@ async def create_turma(data: dict, user: users_db.User = Depends(get_current_use
     return {"message": "Turma cadastrada com sucesso", "id": nova_turma.id}
 
 @router.put("/{turma_id}")
-async def update_turma(turma_id: int, data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_turma(turma_id: int, data: dict, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     turma = db.query(models.Turma).filter(models.Turma.id == turma_id).first()
     
     if not turma:
@@ -115,7 +115,7 @@ async def update_turma(turma_id: int, data: dict, user: users_db.User = Depends(
     return {"message": "Turma atualizada com sucesso"}
 
 @router.delete("/{turma_id}")
-async def delete_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     query = db.query(models.Turma).filter(models.Turma.id == turma_id)
     
     # Se não for admin, garante que só pode deletar suas próprias turmas
@@ -138,7 +138,7 @@ async def delete_turma(turma_id: int, user: users_db.User = Depends(get_current_
         raise HTTPException(status_code=500, detail=f"Erro ao excluir turma: {str(e)}")
 
 @router.delete("/{turma_id}/wipe")
-async def wipe_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def wipe_turma(turma_id: int, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Exclui uma turma e TODOS os seus alunos permanentemente."""
     # Apenas admin ou o dono da turma podem dar wipe
     query = db.query(models.Turma).filter(models.Turma.id == turma_id)
@@ -178,7 +178,7 @@ class IncorporateRequest(BaseModel):
     disciplina: str
 
 @router.post("/incorporate")
-async def incorporate_turma(req: IncorporateRequest, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def incorporate_turma(req: IncorporateRequest, user: users_db.User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Copia uma turma master para o professor logado."""
     master = db.query(models.Turma).options(joinedload(models.Turma.alunos)).filter(models.Turma.id == req.master_turma_id).first()
     
@@ -0,0 +1,54 @@
+"""
+Microbenchmark da leitura de bolhas: caminho antigo (máscaras por bolha)
+vs. caminho vetorizado (máscaras pré-calculadas + redução NumPy única).
+
+Uso: python scripts/bench_bubble_scoring.py [repetições]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+from omr_engine import OMREngine
+
+
+def per_bubble(engine, thresh, coords):
+    return [engine._masked_ratio(thresh[y1:y2, x1:x2]) for x1, y1, x2, y2 in coords]
+
+
+def main(reps: int = 500):
+    engine = OMREngine()
+    layout = engine.load_layout("v1.1-a4-calibrated")
+    W, H = layout.width, layout.height
+
+    # Folha binarizada sintética com ~30% de pixels marcados
+    rng = np.random.default_rng(0)
+    thresh = (rng.random((H, W)) > 0.7).astype(np.uint8) * 255
+
+    # Mesma geometria usada por read_bubbles_by_density (pré-compilada no layout)
+    coords = layout.roi_coords.tolist()
+
+    old = np.array(per_bubble(engine, thresh, coords), dtype=np.float32)
+    new = engine._score_bubbles(thresh, coords)
+    assert np.allclose(old, new, atol=1e-6), "Resultados divergentes entre os caminhos"
+
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        per_bubble(engine, thresh, coords)
+    t_old = (time.perf_counter() - t0) / reps
+
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        engine._score_bubbles(thresh, coords)
+    t_new = (time.perf_counter() - t0) / reps
+
+    print(f"Bolhas por folha: {len(coords)}")
+    print(f"Por bolha (antigo): {t_old * 1000:.3f} ms/folha")
+    print(f"Vetorizado (novo):  {t_new * 1000:.3f} ms/folha")
+    print(f"Speedup:            {t_old / t_new:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,370 @@
+"""
+Benchmark de throughput e precisão do OMREngine.process_image.
+
+Gera (ou reaproveita) um corpus de folhas sintéticas com respostas conhecidas
+(scripts/omr_synthetic.py), processa tudo em processos worker e grava um JSON com:
+  - latência total e por etapa (p50/p90/p99), folhas/s e folhas/s por núcleo
+  - pico de memória (RSS) dos workers
+  - precisão: questões certas, folhas perfeitas, brancos, marcas apagadas, QR Code
+
+Uso:
+  python scripts/bench_omr.py [--count 40] [--profile phone] [--layout v1.1-a4-calibrated]
+         [--workers 1] [--resolution 3000x4000] [--seed 0] [--corpus DIR]
+         [--output arquivo.json] [--compare base.json]
+
+Para comparar uma mudança no engine: rode na branch principal com --output base.json,
+depois na branch da mudança com --compare base.json (use o mesmo --corpus nas duas).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import cv2
+import numpy as np
+
+from scripts.omr_synthetic import PROFILES, SyntheticSheet, generate_corpus
+
+RESULTS_DIR = BACKEND_DIR / "bench_results"
+
+KEY_METRICS = [
+    ("throughput.sheets_per_s_per_core", "folhas/s/núcleo", True),
+    ("latency_ms.total.p50", "latência p50 (ms)", False),
+    ("latency_ms.total.p90", "latência p90 (ms)", False),
+    ("latency_ms.total.p99", "latência p99 (ms)", False),
+    ("memory.peak_rss_mb", "pico RSS (MB)", False),
+    ("accuracy.sheet_success_rate", "folhas processadas", True),
+    ("accuracy.question_accuracy", "questões certas", True),
+    ("accuracy.perfect_sheet_rate", "folhas perfeitas", True),
+    ("accuracy.qr_rate", "QR lido", True),
+]
+
+
+# ─── Memória ─────────────────────────────────────────────────────────────────
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memória residente do processo (None fora de sistemas Unix)."""
+    # No Linux o ru_maxrss herda o pico do processo pai no fork; VmHWM é só deste processo
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# ─── Worker ──────────────────────────────────────────────────────────────────
+
+_engine = None
+_baseline_rss: Optional[float] = None
+
+
+def _init_worker(warmup_image: bytes, layout_version: str, audit: bool):
+    """Cria o engine do worker, desliga a auditoria em disco e aquece com uma folha."""
+    global _engine, _baseline_rss
+    import omr_engine
+
+    omr_engine.audit_sink.enabled = audit
+    omr_engine.failure_sink.enabled = audit
+    _engine = omr_engine.OMREngine()
+    _baseline_rss = peak_rss_mb()
+    _engine.process_image(warmup_image, return_images=False, return_audit=False, layout_version=layout_version)
+
+
+def _ready(delay: float) -> int:
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _run_sheet(index: int, image: bytes, num_questions: int, layout_version: str, return_images: bool):
+    t0 = time.perf_counter()
+    result = _engine.process_image(
+        image, num_questions=num_questions, return_images=return_images,
+        return_audit=return_images, layout_version=layout_version,
+    )
+    total = (time.perf_counter() - t0) * 1000
+
+    # Tempos por etapa medidos pelo próprio engine (ver StageTimer em omr_engine.py)
+    telemetry = result.get("telemetry") or {}
+    return {
+        "index": index,
+        "total_ms": total,
+        "stages_ms": telemetry.get("timings_ms", {}),
+        "anchor_strategy": telemetry.get("anchor_strategy"),
+        "reject_reason": telemetry.get("reject_reason"),
+        "success": bool(result.get("success")),
+        "error": result.get("error"),
+        "answers": result.get("answers"),
+        "quality": result.get("quality"),
+        "qr_data": result.get("qr_data"),
+        "pid": os.getpid(),
+        "baseline_rss_mb": _baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ─── Corpus ──────────────────────────────────────────────────────────────────
+
+def load_or_generate_corpus(layout, args) -> List[SyntheticSheet]:
+    """Com --corpus, grava o corpus em disco na primeira vez e o reaproveita depois."""
+    params = {
+        "count": args.count, "seed": args.seed, "profile": args.profile,
+        "layout": args.layout, "resolution": args.resolution,
+    }
+    corpus_dir = Path(args.corpus) if args.corpus else None
+    manifest_path = corpus_dir / "corpus.json" if corpus_dir else None
+
+    if manifest_path and manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest["params"] == params:
+            return [
+                SyntheticSheet(
+                    image=(corpus_dir / item["file"]).read_bytes(),
+                    answers=item["answers"], erased=item["erased"],
+                    qr_payload=item["qr_payload"], params=item["params"],
+                )
+                for item in manifest["sheets"]
+            ]
+        print(f"Corpus em {corpus_dir} foi gerado com outros parâmetros, gerando de novo")
+
+    w, h = (int(v) for v in args.resolution.lower().split("x"))
+    t0 = time.perf_counter()
+    corpus = generate_corpus(layout, args.count, seed=args.seed, profile=args.profile, out_size=(w, h))
+    print(f"Corpus gerado: {len(corpus)} folhas em {time.perf_counter() - t0:.1f}s")
+
+    if corpus_dir:
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+        sheets = []
+        for i, sheet in enumerate(corpus):
+            name = f"sheet_{i:04d}.jpg"
+            (corpus_dir / name).write_bytes(sheet.image)
+            sheets.append({
+                "file": name, "answers": sheet.answers, "erased": sheet.erased,
+                "qr_payload": sheet.qr_payload, "params": sheet.params,
+            })
+        manifest_path.write_text(json.dumps({"params": params, "sheets": sheets}, indent=1))
+    return corpus
+
+
+# ─── Métricas ────────────────────────────────────────────────────────────────
+
+def percentiles(values) -> Dict[str, float]:
+    arr = np.asarray(values, dtype=np.float64)
+    if arr.size == 0:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {
+        "count": int(arr.size), "mean": round(float(arr.mean()), 2), "p50": round(float(p50), 2),
+        "p90": round(float(p90), 2), "p99": round(float(p99), 2), "max": round(float(arr.max()), 2),
+    }
+
+
+def summarize(records: List[Dict[str, Any]], corpus: List[SyntheticSheet], wall_s: float, workers: int) -> Dict[str, Any]:
+    """Agrega os resultados por folha em latência, throughput, memória e precisão."""
+    by_index = {r["index"]: r for r in records}
+    total_q = correct_q = processed_q = processed_correct = 0
+    blank_total = blank_ok = erased_total = erased_ok = 0
+    perfect = qr_ok = review = 0
+    failures: Dict[str, int] = {}
+
+    for i, sheet in enumerate(corpus):
+        rec = by_index[i]
+        answers = (rec["answers"] or []) if rec["success"] else []
+        hits = [j < len(answers) and answers[j] == truth for j, truth in enumerate(sheet.answers)]
+        total_q += len(hits)
+        correct_q += sum(hits)
+
+        if not rec["success"]:
+            key = rec.get("reject_reason") or (rec["error"] or "erro desconhecido")[:80]
+            failures[key] = failures.get(key, 0) + 1
+            continue
+
+        processed_q += len(hits)
+        processed_correct += sum(hits)
+        perfect += all(hits)
+        qr_ok += rec["qr_data"] == sheet.qr_payload
+        review += rec["quality"] != "ok"
+        for j, truth in enumerate(sheet.answers):
+            if truth is None:
+                blank_total += 1
+                blank_ok += hits[j]
+            if sheet.erased and sheet.erased[j] is not None:
+                erased_total += 1
+                erased_ok += hits[j]
+
+    n = len(corpus)
+    ok = sum(1 for r in records if r["success"])
+    stage_names = sorted({s for r in records for s in r["stages_ms"]})
+
+    def rate(num, den):
+        return round(num / den, 4) if den else None
+
+    return {
+        "throughput": {
+            "sheets": n, "workers": workers, "wall_s": round(wall_s, 3),
+            "sheets_per_s": round(n / wall_s, 3) if wall_s else None,
+            "sheets_per_s_per_core": round(n / wall_s / workers, 3) if wall_s else None,
+        },
+        "latency_ms": {
+            "total": percentiles([r["total_ms"] for r in records]),
+            "stages": {s: percentiles([r["stages_ms"][s] for r in records if s in r["stages_ms"]]) for s in stage_names},
+        },
+        "memory": {
+            "baseline_rss_mb": max((r["baseline_rss_mb"] or 0) for r in records) if records else None,
+            "peak_rss_mb": max((r["peak_rss_mb"] or 0) for r in records) if records else None,
+        },
+        "accuracy": {
+            "sheet_success_rate": rate(ok, n),
+            "question_accuracy": rate(correct_q, total_q),
+            "question_accuracy_processed": rate(processed_correct, processed_q),
+            "perfect_sheet_rate": rate(perfect, n),
+            "blank_accuracy": rate(blank_ok, blank_total),
+            "erased_accuracy": rate(erased_ok, erased_total),
+            "qr_rate": rate(qr_ok, n),
+            "review_rate": rate(review, ok),
+        },
+        "failures": failures,
+    }
+
+
+def _get(report: Dict[str, Any], dotted: str):
+    value: Any = report
+    for part in dotted.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def compare(current: Dict[str, Any], base: Dict[str, Any]):
+    """Imprime as métricas principais lado a lado com a execução de referência."""
+    print(f"\nComparação com {base.get('meta', {}).get('git_commit')} ({base.get('meta', {}).get('timestamp')})")
+    print(f"{'métrica':<28}{'base':>12}{'atual':>12}{'variação':>12}")
+    rows = list(KEY_METRICS) + [
+        (f"latency_ms.stages.{s}.p50", f"{s} p50 (ms)", False)
+        for s in sorted(_get(current, "latency_ms.stages") or {})
+    ]
+    for key, label, higher_is_better in rows:
+        old, new = _get(base, key), _get(current, key)
+        if old is None or new is None:
+            continue
+        delta = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+        worse = (new < old) if higher_is_better else (new > old)
+        flag = " !" if worse and old and abs(new - old) / old > 0.05 else ""
+        print(f"{label:<28}{old:>12}{new:>12}{delta:>12}{flag}")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD", "--", "."], cwd=BACKEND_DIR) != 0
+        return f"{commit}{'-dirty' if dirty else ''}"
+    except Exception:
+        return None
+
+
+def print_report(report: Dict[str, Any]):
+    t, lat, mem, acc = report["throughput"], report["latency_ms"], report["memory"], report["accuracy"]
+    print(f"\nFolhas: {t['sheets']}  workers: {t['workers']}  tempo: {t['wall_s']}s")
+    print(f"Throughput: {t['sheets_per_s']} folhas/s ({t['sheets_per_s_per_core']} por núcleo)")
+    print(f"Memória: base {mem['baseline_rss_mb']} MB, pico {mem['peak_rss_mb']} MB por worker")
+    print(f"\n{'etapa':<18}{'p50':>9}{'p90':>9}{'p99':>9}   (ms)")
+    for name, p in [("total", lat["total"])] + sorted(lat["stages"].items()):
+        if p.get("count"):
+            print(f"{name:<18}{p['p50']:>9}{p['p90']:>9}{p['p99']:>9}")
+    print("\nPrecisão:")
+    for key, value in acc.items():
+        print(f"  {key:<28}{value}")
+    if report["failures"]:
+        print("\nFalhas:")
+        for error, count in sorted(report["failures"].items(), key=lambda kv: -kv[1]):
+            print(f"  {count:>4}x {error}")
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=40)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="phone")
+    parser.add_argument("--layout", default="v1.1-a4-calibrated")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--resolution", default="3000x4000", help="Tamanho da foto simulada (LxA)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="Pasta para gravar/reaproveitar o corpus")
+    parser.add_argument("--images", action="store_true", help="Inclui retificada e mapa de auditoria na resposta")
+    parser.add_argument("--audit", action="store_true", help="Mantém a auditoria em disco ligada")
+    parser.add_argument("--output", help="Arquivo JSON (padrão bench_results/omr_<perfil>_<data>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    from omr_engine import OMREngine
+    layout = OMREngine().load_layout(args.layout)
+    corpus = load_or_generate_corpus(layout, args)
+    workers = max(1, args.workers)
+
+    # Processos "spawn": o RSS medido é só do engine, sem o corpus do processo pai
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("spawn"),
+        initializer=_init_worker, initargs=(corpus[0].image, args.layout, args.audit),
+    ) as pool:
+        # Garante que todos os workers subiram e aqueceram antes de cronometrar
+        list(pool.map(_ready, [0.5] * workers))
+
+        t0 = time.perf_counter()
+        futures = [
+            pool.submit(_run_sheet, i, sheet.image, layout.num_questions, args.layout, args.images)
+            for i, sheet in enumerate(corpus)
+        ]
+        records = [f.result() for f in futures]
+        wall_s = time.perf_counter() - t0
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        **summarize(records, corpus, wall_s, workers),
+        "sheets": [
+            {k: r[k] for k in ("index", "total_ms", "stages_ms", "anchor_strategy", "success", "error", "quality")}
+            for r in records
+        ],
+    }
+
+    print_report(report)
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"omr_{args.profile}_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+    print(f"\nResultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Planos de execução (EXPLAIN) das consultas mais quentes dos relatórios e do dashboard.
+
+Confere se cada consulta usa o índice composto esperado (declarados nos models e
+criados pelo run_migrations). Funciona no SQLite (EXPLAIN QUERY PLAN) e no Postgres
+(EXPLAIN). No Postgres a varredura sequencial é desligada só nesta sessão: com tabelas
+pequenas o planejador prefere ler tudo, e o objetivo aqui é saber se o índice serve.
+
+Uso:
+  python scripts/explain_queries.py            # banco do DATABASE_URL
+  python scripts/explain_queries.py --check    # sai com código 1 se algum índice não for usado
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import func, select, text
+
+import models
+
+# (nome, consulta, índice esperado no plano)
+QUERIES = [
+    (
+        "relatórios: frequências do período (carregar_frequencias_batch)",
+        select(models.Frequencia.aluno_id, models.Frequencia.data, models.Frequencia.presente).where(
+            models.Frequencia.data.in_(["2026-03-02", "2026-03-03", "2026-03-04"]),
+            models.Frequencia.aluno_id.in_([1, 2, 3]),
+        ),
+        "ix_frequencia_aluno_data",
+    ),
+    (
+        "relatórios: frequências por lista de datas, sem alunos",
+        select(models.Frequencia.aluno_id, models.Frequencia.presente).where(
+            models.Frequencia.data.in_(["2026-03-02", "2026-03-03"])
+        ),
+        "ix_frequencia_data",
+    ),
+    (
+        "relatórios: primeira frequência de cada aluno",
+        select(models.Frequencia.aluno_id, func.min(models.Frequencia.data)).where(
+            models.Frequencia.aluno_id.in_([1, 2, 3])
+        ).group_by(models.Frequencia.aluno_id),
+        "ix_frequencia_aluno_data",
+    ),
+    (
+        "dashboard/chamada: frequência da turma no dia",
+        select(models.Frequencia.id).where(
+            models.Frequencia.turma_id == 1, models.Frequencia.data == "2026-03-02"
+        ),
+        "ix_frequencia_turma_data",
+    ),
+    (
+        "correção: resultado existente do aluno no gabarito",
+        select(models.Resultado.id).where(
+            models.Resultado.gabarito_id == 1, models.Resultado.aluno_id == 1
+        ),
+        "ix_resultados_gabarito_aluno",
+    ),
+    (
+        "planejamento: próxima aula pendente do plano",
+        select(models.AulaPlanejada.id).where(
+            models.AulaPlanejada.plano_id == 1, models.AulaPlanejada.status == "pending"
+        ).order_by(models.AulaPlanejada.ordem),
+        "ix_aulas_planejadas_plano_status_ordem",
+    ),
+]
+
+
+def explain(conn, stmt) -> List[str]:
+    """Linhas do plano da consulta no dialeto da conexão."""
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    return [row[0] for row in conn.execute(text(f"EXPLAIN {sql}"))]
+
+
+def run(engine) -> List[Dict[str, Any]]:
+    report = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SET enable_seqscan = off"))
+        for name, stmt, index in QUERIES:
+            plan = explain(conn, stmt)
+            report.append({"query": name, "index": index, "uses_index": any(index in line for line in plan), "plan": plan})
+        conn.rollback()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="falha se alguma consulta não usar o índice esperado")
+    args = parser.parse_args()
+
+    from database import engine
+    report = run(engine)
+    print(f"Banco: {engine.dialect.name} ({engine.url.render_as_string(hide_password=True)})\n")
+    for item in report:
+        status = "OK " if item["uses_index"] else "SEM"
+        print(f"[{status}] {item['query']}  (esperado: {item['index']})")
+        for line in item["plan"]:
+            print(f"        {line}")
+    faltando = [item["index"] for item in report if not item["uses_index"]]
+    if faltando:
+        print(f"\nÍndices não usados: {', '.join(sorted(set(faltando)))} (rode o run_migrations)")
+    if args.check and faltando:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Teste de carga: latência das rotas leves enquanto o relatório gerencial roda.
+
+As rotas síncronas rodam no threadpool (API_THREADPOOL_SIZE), fora do event loop, então
+um /admin/reports/gerencial pesado não deve travar o resto do processo. O script mede a
+latência de GET /turmas com --clients clientes concorrentes em duas fases de --seconds:
+sozinho (base) e com --heavy relatórios gerenciais rodando em loop ao mesmo tempo.
+
+Sem --url, sobe o app no próprio processo (transporte ASGI do httpx) com um SQLite
+temporário populado com --turmas turmas × --alunos alunos e --dias dias de frequência.
+Com --url, usa um servidor já rodando (informe --email/--password de um admin).
+
+Uso:
+  python scripts/load_test_reports.py [--clients 8] [--heavy 1] [--seconds 5]
+         [--turmas 20] [--alunos 40] [--dias 60] [--output arquivo.json]
+  python scripts/load_test_reports.py --url http://localhost:8000 --email admin@x --password ...
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx
+import numpy as np
+
+ADMIN_EMAIL = "carga@lerprova.local"
+ADMIN_PASSWORD = "carga123"
+
+
+def seed(turmas: int, alunos: int, dias: int) -> Dict[str, str]:
+    """Popula o banco do app (já importado) e devolve o período do relatório."""
+    import models
+    from database import engine
+
+    inicio = date(2026, 3, 2)
+    datas = [inicio + timedelta(days=i) for i in range(dias * 7 // 5 + 7)]
+    datas = [d.strftime("%Y-%m-%d") for d in datas if d.weekday() < 5][:dias]
+    rng = np.random.default_rng(0)
+
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{
+            "nome": "Carga", "email": ADMIN_EMAIL, "role": "admin", "is_active": True,
+            "hashed_password": models.pwd_context.hash(ADMIN_PASSWORD),
+        }])
+        user_id = conn.exec_driver_sql("SELECT id FROM users WHERE email = ?", (ADMIN_EMAIL,)).scalar()
+        conn.execute(models.Turma.__table__.insert(), [
+            {"nome": f"Turma {t + 1}", "disciplina": "Carga", "user_id": user_id} for t in range(turmas)
+        ])
+        turma_ids = [r[0] for r in conn.exec_driver_sql("SELECT id FROM turmas WHERE disciplina = 'Carga'")]
+        conn.execute(models.Aluno.__table__.insert(), [
+            {"nome": f"Aluno {t}-{a}", "codigo": f"CARGA-{t}-{a}", "qr_token": f"carga-{t}-{a}"}
+            for t in range(turmas) for a in range(alunos)
+        ])
+        aluno_ids = [r[0] for r in conn.exec_driver_sql("SELECT id FROM alunos WHERE codigo LIKE 'CARGA-%' ORDER BY id")]
+        matriculas = [(turma_ids[i // alunos], aluno_id) for i, aluno_id in enumerate(aluno_ids)]
+        conn.execute(models.aluno_turma.insert(), [{"turma_id": t, "aluno_id": a} for t, a in matriculas])
+        presente = rng.random((len(matriculas), len(datas))) > 0.1
+        conn.execute(models.Frequencia.__table__.insert(), [
+            {"turma_id": t, "aluno_id": a, "data": d, "presente": bool(presente[i, j])}
+            for i, (t, a) in enumerate(matriculas) for j, d in enumerate(datas)
+        ])
+    return {"data_inicio": datas[0], "data_fim": datas[-1]}
+
+
+def summarize(latencias_ms: List[float], segundos: float) -> Dict[str, Any]:
+    if not latencias_ms:
+        return {"count": 0}
+    arr = np.array(latencias_ms)
+    return {
+        "count": len(arr),
+        "rps": round(len(arr) / segundos, 1),
+        "p50_ms": round(float(np.percentile(arr, 50)), 1),
+        "p95_ms": round(float(np.percentile(arr, 95)), 1),
+        "p99_ms": round(float(np.percentile(arr, 99)), 1),
+        "max_ms": round(float(arr.max()), 1),
+    }
+
+
+async def fase(client: httpx.AsyncClient, headers: dict, periodo: dict, clients: int, heavy: int,
+               seconds: float) -> Dict[str, Any]:
+    fim = time.perf_counter() + seconds
+    leves: List[float] = []
+    pesadas: List[float] = []
+    erros = 0
+
+    async def leve():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            t0 = time.perf_counter()
+            r = await client.get("/turmas", headers=headers)
+            leves.append((time.perf_counter() - t0) * 1000)
+            erros += r.status_code != 200
+
+    async def pesada():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            t0 = time.perf_counter()
+            r = await client.post("/admin/reports/gerencial", headers=headers, json=periodo)
+            pesadas.append((time.perf_counter() - t0) * 1000)
+            erros += r.status_code != 200
+
+    await asyncio.gather(*[leve() for _ in range(clients)], *[pesada() for _ in range(heavy)])
+    return {"turmas": summarize(leves, seconds), "gerencial": summarize(pesadas, seconds), "errors": erros}
+
+
+async def main_async(args) -> Dict[str, Any]:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=120)
+        email, password = args.email, args.password
+        periodo = {"data_inicio": args.data_inicio, "data_fim": args.data_fim}
+    else:
+        from main import app
+        periodo = seed(args.turmas, args.alunos, args.dias)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://carga", timeout=120)
+        email, password = ADMIN_EMAIL, ADMIN_PASSWORD
+
+    async with client:
+        r = await client.post("/auth/login", json={"email": email, "password": password})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        # Aquecimento: conexões do pool, caches de import
+        await client.get("/turmas", headers=headers)
+        await client.post("/admin/reports/gerencial", headers=headers, json=periodo)
+
+        base = await fase(client, headers, periodo, args.clients, 0, args.seconds)
+        carga = await fase(client, headers, periodo, args.clients, args.heavy, args.seconds)
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "password"},
+        "periodo": periodo,
+        "base": base,
+        "com_gerencial": carga,
+        "p95_ratio": round(carga["turmas"]["p95_ms"] / base["turmas"]["p95_ms"], 2) if base["turmas"].get("p95_ms") else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--heavy", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--turmas", type=int, default=20)
+    parser.add_argument("--alunos", type=int, default=40)
+    parser.add_argument("--dias", type=int, default=60)
+    parser.add_argument("--url")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--data-inicio", default="2026-02-01")
+    parser.add_argument("--data-fim", default="2026-06-30")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    tmp = None
+    if not args.url:
+        # Banco descartável: precisa estar no ambiente antes de importar database/main
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/carga.db"
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        if tmp:
+            tmp.cleanup()
+
+    for nome in ("base", "com_gerencial"):
+        fase_ = report[nome]
+        print(f"{nome:14s} /turmas {fase_['turmas']}  gerencial {fase_['gerencial']}  erros {fase_['errors']}")
+    print(f"p95 de /turmas com o gerencial rodando: {report['p95_ratio']}x a base")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Gerador de folhas de resposta sintéticas para testar e medir o OMR.
+
+Renderiza a folha A4 a partir de um layout compilado (layout_v1.json /
+layout_v1.1-a4-calibrated.json), com respostas conhecidas, e simula a foto do
+celular: perspectiva, desfoque, gradiente de luz, ruído, compressão JPEG e
+marcas apagadas pela metade.
+
+Usado pelo scripts/bench_omr.py e pelos testes (tests/test_omr.py).
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+PAGE_MM = (210.0, 297.0)
+
+# Perfis de degradação da "foto". Tuplas são intervalos sorteados por folha.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "clean": {
+        "margin": (0.04, 0.05), "tilt": 0.0, "blur": (0.0, 0.4), "light": (0.0, 0.05),
+        "noise": (1.0, 2.0), "jpeg": (90, 95), "blank_rate": 0.0, "erase_rate": 0.0,
+    },
+    "phone": {
+        "margin": (0.03, 0.07), "tilt": 0.03, "blur": (0.8, 1.8), "light": (0.1, 0.35),
+        "noise": (2.0, 5.0), "jpeg": (70, 90), "blank_rate": 0.05, "erase_rate": 0.05,
+    },
+    "hard": {
+        "margin": (0.02, 0.10), "tilt": 0.06, "blur": (1.5, 3.0), "light": (0.3, 0.5),
+        "noise": (4.0, 8.0), "jpeg": (50, 70), "blank_rate": 0.08, "erase_rate": 0.10,
+    },
+}
+
+
+@dataclass
+class SyntheticSheet:
+    """Uma folha sintética: JPEG pronto para o process_image e o gabarito verdadeiro."""
+    image: bytes
+    answers: List[Optional[str]]            # None = questão em branco
+    erased: List[Optional[str]] = field(default_factory=list)  # Opção apagada (resíduo) por questão
+    qr_payload: Optional[Dict[str, Any]] = None
+    corners: Optional[np.ndarray] = None    # Posição das 4 âncoras na foto (TL, TR, BR, BL)
+    params: Dict[str, float] = field(default_factory=dict)
+
+
+def random_answers(layout, rng, blank_rate: float = 0.0, erase_rate: float = 0.0):
+    """Sorteia respostas (com brancos) e, opcionalmente, uma opção apagada por questão."""
+    answers: List[Optional[str]] = []
+    erased: List[Optional[str]] = []
+    for _ in range(layout.num_questions):
+        if rng.random() < blank_rate:
+            answers.append(None)
+        else:
+            answers.append(layout.options[int(rng.integers(len(layout.options)))])
+        others = [o for o in layout.options if o != answers[-1]]
+        erased.append(others[int(rng.integers(len(others)))] if rng.random() < erase_rate else None)
+    return answers, erased
+
+
+def render_sheet(layout, answers, px_per_mm: float = 8.0, qr_payload=None, erased=None, rng=None):
+    """
+    Renderiza a folha A4 em tons de cinza na resolução `px_per_mm`.
+    As posições vêm do layout compilado (âncoras em warp_dst, bolhas em centers),
+    que cobre a página inteira.
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    W = int(PAGE_MM[0] * px_per_mm)
+    H = int(PAGE_MM[1] * px_per_mm)
+    sx, sy = W / layout.width, H / layout.height
+    page = np.full((H, W), 255, np.uint8)
+
+    # Âncoras (.fiducial): quadrados de 6mm centrados nos destinos da homografia
+    half = int(3 * px_per_mm)
+    for x, y in layout.warp_dst:
+        cx, cy = int(x * sx), int(y * sy)
+        cv2.rectangle(page, (cx - half, cy - half), (cx + half, cy + half), 0, -1)
+    # Marcador central (6mm) no meio do retângulo das âncoras
+    cx, cy = (int(v) for v in layout.warp_dst.mean(axis=0) * (sx, sy))
+    cv2.rectangle(page, (cx - half, cy - half), (cx + half, cy + half), 0, -1)
+
+    # Barra de calibração: degradê preto -> branco com borda, x 15-17mm, y 33-163mm
+    x1, x2 = int(15 * px_per_mm), int(17 * px_per_mm)
+    y1, y2 = int(33 * px_per_mm), int(163 * px_per_mm)
+    page[y1:y2, x1:x2] = np.linspace(0, 255, y2 - y1, dtype=np.float32)[:, None].astype(np.uint8)
+    cv2.rectangle(page, (x1, y1), (x2, y2), 0, 1)
+
+    # Linha inferior do cabeçalho (border-bottom 1.5mm)
+    cv2.rectangle(page, (int(15 * px_per_mm), int(35 * px_per_mm)), (int(195 * px_per_mm), int(36.5 * px_per_mm)), 0, -1)
+
+    # Bolhas (.option-circle): 4.5mm com borda de 0.4mm + preenchimento irregular de caneta.
+    # Número da questão (9pt, negrito) à esquerda da linha.
+    border = max(1, int(round(0.4 * px_per_mm)))
+    r = int(round(2.25 * px_per_mm - border / 2))
+    font_scale = 2.3 * px_per_mm / 22
+    for q, row in enumerate(layout.centers):
+        x0, y0 = int(row[0][0] * sx), int(row[0][1] * sy)
+        cv2.putText(page, f"{q + 1:02d}", (x0 - int(8.5 * px_per_mm), y0 + int(1.2 * px_per_mm)),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, 0, max(1, int(0.35 * px_per_mm)), cv2.LINE_AA)
+        for j, (x, y) in enumerate(row):
+            c = (int(x * sx), int(y * sy))
+            option = layout.options[j]
+            cv2.circle(page, c, r, 0, border, cv2.LINE_AA)
+            if q < len(answers) and answers[q] == option:
+                jitter = rng.normal(0, 0.25 * px_per_mm, 2).astype(int)
+                fill = int(rng.integers(10, 70))
+                cv2.circle(page, (c[0] + int(jitter[0]), c[1] + int(jitter[1])), int(r * rng.uniform(0.8, 0.95)), fill, -1)
+            elif erased and q < len(erased) and erased[q] == option:
+                # Marca apagada: resíduo claro cobrindo parte da bolha
+                tone = int(rng.integers(150, 200))
+                cv2.ellipse(page, c, (int(r * 0.8), int(r * 0.5)), float(rng.uniform(0, 180)), 0, 360, tone, -1)
+
+    if qr_payload is not None:
+        # Sem zona de silêncio, como o QRCodeSVG da folha impressa
+        qr = cv2.QRCodeEncoder.create().encode(json.dumps(qr_payload, separators=(",", ":")))[2:-2, 2:-2]
+        size = int(29.1 * px_per_mm)
+        qr = cv2.resize(qr, (size, size), interpolation=cv2.INTER_NEAREST)
+        x0, y0 = int(16.3 * px_per_mm), int(8.7 * px_per_mm)
+        page[y0:y0 + size, x0:x0 + size] = qr
+    return page
+
+
+def anchor_points(page_shape, layout) -> np.ndarray:
+    """Centros das âncoras na página renderizada (TL, TR, BR, BL)."""
+    H, W = page_shape[:2]
+    return np.array([[x * W / layout.width, y * H / layout.height] for x, y in layout.warp_dst], np.float32)
+
+
+def _pick(value, rng):
+    return float(rng.uniform(*value)) if isinstance(value, tuple) else float(value)
+
+
+def photograph(page, layout, rng, profile: str = "phone", out_size: Tuple[int, int] = (3000, 4000)):
+    """
+    Simula a foto enquadrada pelo radar: as 4 âncoras perto dos cantos do frame,
+    com os efeitos do perfil. Retorna (jpeg_bytes, cantos, parâmetros sorteados).
+    """
+    p = PROFILES[profile]
+    ow, oh = out_size
+    params = {k: _pick(p[k], rng) for k in ("blur", "light", "noise", "jpeg")}
+
+    m = rng.uniform(*p["margin"], size=(4, 2)) * np.float32([ow, oh])
+    dst = np.array([[0, 0], [ow, 0], [ow, oh], [0, oh]], np.float32)
+    dst += np.float32([[1, 1], [-1, 1], [-1, -1], [1, -1]]) * m
+    dst += rng.uniform(-p["tilt"], p["tilt"], dst.shape).astype(np.float32) * np.float32([ow, oh])
+    M = cv2.getPerspectiveTransform(anchor_points(page.shape, layout), dst.astype(np.float32))
+    photo = cv2.warpPerspective(page, M, (ow, oh), flags=cv2.INTER_AREA, borderValue=int(rng.integers(60, 140)))
+
+    if params["blur"] > 0:
+        photo = cv2.GaussianBlur(photo, (0, 0), params["blur"])
+
+    # Gradiente de luz numa direção sorteada + ruído do sensor
+    angle = rng.uniform(0, 2 * np.pi)
+    ramp_x = np.linspace(-0.5, 0.5, ow, dtype=np.float32) * np.cos(angle)
+    ramp_y = np.linspace(-0.5, 0.5, oh, dtype=np.float32)[:, None] * np.sin(angle)
+    gain = 1.0 - params["light"] * (ramp_x + ramp_y + 0.5)
+    out = photo.astype(np.float32) * gain
+    out += rng.normal(0, params["noise"], out.shape).astype(np.float32)
+    out = np.clip(out, 0, 255).astype(np.uint8)
+
+    color = cv2.cvtColor(out, cv2.COLOR_GRAY2BGR)
+    ok, buf = cv2.imencode(".jpg", color, [cv2.IMWRITE_JPEG_QUALITY, int(params["jpeg"])])
+    return buf.tobytes(), dst, params
+
+
+def generate_sheet(layout, rng, profile: str = "phone", out_size: Tuple[int, int] = (3000, 4000),
+                   px_per_mm: float = 10.0, qr_payload=None) -> SyntheticSheet:
+    """Sorteia respostas, renderiza e fotografa uma folha."""
+    p = PROFILES[profile]
+    answers, erased = random_answers(layout, rng, p["blank_rate"], p["erase_rate"])
+    page = render_sheet(layout, answers, px_per_mm, qr_payload=qr_payload, erased=erased, rng=rng)
+    image, corners, params = photograph(page, layout, rng, profile, out_size)
+    return SyntheticSheet(image, answers, erased, qr_payload, corners, params)
+
+
+def generate_corpus(layout, count: int, seed: int = 0, profile: str = "phone",
+                    out_size: Tuple[int, int] = (3000, 4000), px_per_mm: float = 10.0) -> List[SyntheticSheet]:
+    """Corpus determinístico: a mesma semente gera as mesmas folhas."""
+    rng = np.random.default_rng(seed)
+    return [
+        generate_sheet(layout, rng, profile, out_size, px_per_mm, qr_payload={"aid": i + 1, "gid": 1})
+        for i in range(count)
+    ]
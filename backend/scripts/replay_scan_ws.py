@@ -0,0 +1,133 @@
+"""
+Cliente de teste do radar via WebSocket (/ws/scan-anchors).
+
+Reproduz uma sequência gravada de frames (pasta de JPEG/PNG em ordem alfabética,
+ou um vídeo) no ritmo da câmera e mede a latência de ida e volta de cada resposta.
+Os frames são reduzidos e enviados em tons de cinza crus, como o scanner faria.
+
+Uso:
+  python scripts/replay_scan_ws.py <pasta_ou_video> --token <JWT>
+         [--url ws://localhost:8000/ws/scan-anchors] [--fps 10] [--width 480] [--jpeg]
+
+O token também pode vir da variável LERPROVA_TOKEN.
+"""
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import websockets
+
+FRAME_HEADER = struct.Struct(">IHH")  # Mesmo cabeçalho de routers/provas.py
+
+
+def load_frames(source: str, width: int):
+    """Lê os frames (pasta ou vídeo) já reduzidos para `width` e em tons de cinza."""
+    path = Path(source)
+    if path.is_dir():
+        images = (cv2.imread(str(f), cv2.IMREAD_GRAYSCALE) for f in sorted(path.iterdir())
+                  if f.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    else:
+        cap = cv2.VideoCapture(str(path))
+
+        def read_video():
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            cap.release()
+        images = read_video()
+
+    frames = []
+    for img in images:
+        if img is None:
+            continue
+        h, w = img.shape[:2]
+        if w > width:
+            img = cv2.resize(img, (width, round(h * width / w)), interpolation=cv2.INTER_AREA)
+        frames.append(np.ascontiguousarray(img))
+    return frames
+
+
+def encode(seq: int, frame: np.ndarray, jpeg: bool) -> bytes:
+    if jpeg:
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
+        return FRAME_HEADER.pack(seq, 0, 0) + buf.tobytes()
+    h, w = frame.shape[:2]
+    return FRAME_HEADER.pack(seq, w, h) + frame.tobytes()
+
+
+async def replay(url: str, frames, fps: float, jpeg: bool):
+    sent_at = {}
+    replies = []
+
+    # Sem permessage-deflate: comprimir ~300 KB de pixels por frame custa mais do que a rede local economiza
+    async with websockets.connect(url, max_size=None, compression=None) as ws:
+        async def send_all():
+            for seq, frame in enumerate(frames, start=1):
+                sent_at[seq] = time.perf_counter()
+                await ws.send(encode(seq, frame, jpeg))
+                await asyncio.sleep(1.0 / fps)
+
+        sender = asyncio.create_task(send_all())
+        # O servidor nunca descarta o último frame: a resposta dele encerra a reprodução
+        last_seq = len(frames)
+        while True:
+            reply = json.loads(await ws.recv())
+            reply["rtt_ms"] = (time.perf_counter() - sent_at.get(reply.get("seq"), time.perf_counter())) * 1000
+            replies.append(reply)
+            if reply.get("seq") == last_seq:
+                break
+        await sender
+    return replies
+
+
+def summarize(replies, total: int):
+    rtt = np.array([r["rtt_ms"] for r in replies if r.get("seq")])
+    modes = {}
+    for r in replies:
+        mode = r.get("tracking", "erro")
+        modes[mode] = modes.get(mode, 0) + 1
+
+    print(f"Frames enviados:     {total}")
+    print(f"Respostas:           {len(replies)}")
+    print(f"Descartados (stale): {replies[-1].get('dropped', 0) if replies else 0}")
+    print(f"Âncoras encontradas: {sum(1 for r in replies if r.get('success'))}")
+    print(f"Rastreamento:        {modes}")
+    if rtt.size:
+        p50, p90, p99 = np.percentile(rtt, [50, 90, 99])
+        print(f"Latência ida/volta:  p50={p50:.1f}ms p90={p90:.1f}ms p99={p99:.1f}ms")
+    qr = next((r["qr_data"] for r in replies if r.get("qr_data")), None)
+    print(f"QR Code:             {qr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Pasta com frames ou arquivo de vídeo")
+    parser.add_argument("--url", default="ws://localhost:8000/ws/scan-anchors")
+    parser.add_argument("--token", default=os.getenv("LERPROVA_TOKEN"))
+    parser.add_argument("--fps", type=float, default=10.0)
+    parser.add_argument("--width", type=int, default=480)
+    parser.add_argument("--jpeg", action="store_true", help="Envia JPEG em vez de pixels crus")
+    args = parser.parse_args()
+
+    if not args.token:
+        sys.exit("Informe --token ou LERPROVA_TOKEN")
+    frames = load_frames(args.source, args.width)
+    if not frames:
+        sys.exit(f"Nenhum frame em {args.source}")
+
+    url = f"{args.url}?token={args.token}"
+    replies = asyncio.run(replay(url, frames, args.fps, args.jpeg))
+    summarize(replies, len(frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -58,7 +58,7 @@ async def test_fallback_logic():
         
         start_time = time.time()
         try:
-            response = await chat_with_agent(request, current_user=user)
+            response = chat_with_agent(request, current_user=user, db=MagicMock())
             end_time = time.time()
             
             duration = end_time - start_time
@@ -2,11 +2,14 @@
 Testes Automatizados LERPROVA API
 Cobre: auth, calendar, stats, turmas, saúde do sistema
 """
+import json
 import sys
 import os
 
 # Ajustar path para importar módulos do backend
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# A API exige a chave dos artefatos do OMR (definida antes de importar o app)
+os.environ.setdefault("OMR_ARTIFACT_SECRET", "teste")
 
 import pytest
 from fastapi.testclient import TestClient
@@ -148,6 +151,179 @@ class TestTurmas:
         assert len(data) >= 1
 
 
+# ============ TESTES DE GABARITOS ============
+
+class TestGabaritos:
+    def test_update_gabarito_recalcula_notas(self):
+        from models import Aluno, Resultado
+
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        r = client.post("/gabaritos", headers=headers, json={
+            "titulo": "Recalculo", "num_questoes": 4, "respostas": ["A", "B", "C", "D"]
+        })
+        gabarito_id = r.json()["id"]
+
+        db = TestSessionLocal()
+        aluno = Aluno(nome="Aluno Recalculo")
+        db.add(aluno)
+        db.flush()
+        respostas = [["A", "B", "C", "D"], json.dumps(["A", "B", None, "A"]), ["B"], None]
+        resultados = [Resultado(aluno_id=aluno.id, gabarito_id=gabarito_id, respostas_aluno=resp,
+                                acertos=acertos, nota=acertos * 2.5)
+                      for resp, acertos in zip(respostas, [4, 2, 0, 0])]
+        db.add_all(resultados)
+        db.commit()
+        ids = [res.id for res in resultados]
+        db.close()
+
+        # Questão 3 anulada e 4 trocada para A
+        r = client.put(f"/gabaritos/{gabarito_id}", headers=headers, json={"respostas": ["A", "B", None, "A"]})
+        assert r.status_code == 200
+        recalculo = r.json()["recalculo"]
+        assert recalculo["resultados"] == 4 and recalculo["notas_alteradas"] == 2
+
+        db = TestSessionLocal()
+        notas = {res.id: (res.acertos, res.nota) for res in db.query(Resultado).filter(Resultado.id.in_(ids))}
+        db.close()
+        assert [notas[i] for i in ids] == [(2, 5.0), (3, 7.5), (0, 0.0), (0, 0.0)]
+
+        # Só o título: nada é recalculado
+        r = client.put(f"/gabaritos/{gabarito_id}", headers=headers, json={"titulo": "Outro"})
+        assert r.json()["recalculo"] is None
+
+    def test_analise_itens(self):
+        from item_analysis import item_analysis_cache
+        from models import Aluno, Resultado
+
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        r = client.post("/gabaritos", headers=headers, json={
+            "titulo": "Analise", "num_questoes": 3, "respostas": ["A", "B", "C"]
+        })
+        gabarito_id = r.json()["id"]
+
+        def gravar(respostas, status):
+            db = TestSessionLocal()
+            aluno = Aluno(nome="Aluno Analise")
+            db.add(aluno)
+            db.flush()
+            db.add(Resultado(aluno_id=aluno.id, gabarito_id=gabarito_id, respostas_aluno=respostas,
+                             status_list=status and json.dumps(status), acertos=0, nota=0.0))
+            db.commit()
+            db.close()
+
+        gravar(["A", "B", "C"], ["valid"] * 3)
+        gravar(["A", "B", "D"], ["valid", "valid", "ambiguous"])
+        gravar(["A", "C", None], ["valid", "valid", "blank"])
+        gravar(["B", None, None], None)  # Lançado à mão, sem status do OMR
+
+        r = client.get(f"/gabaritos/{gabarito_id}/analise-itens", headers=headers)
+        assert r.status_code == 200
+        analise = r.json()
+        assert analise["total_resultados"] == 4 and analise["resultados_omr"] == 3
+        q1, q2, q3 = analise["questoes"]
+        assert [q["dificuldade"] for q in (q1, q2, q3)] == [0.75, 0.5, 0.25]
+        assert q1["discriminacao"] > 0
+        assert q1["distratores"] == {"A": 0.75, "B": 0.25, "C": 0.0, "D": 0.0, "E": 0.0, "branco": 0.0}
+        assert q3["distratores"]["D"] == 0.25 and q3["distratores"]["branco"] == 0.5
+        assert q3["em_branco"] == q3["ambigua"] == 0.333
+
+        hits = item_analysis_cache.stats["hits"]
+        client.get(f"/gabaritos/{gabarito_id}/analise-itens", headers=headers)
+        assert item_analysis_cache.stats["hits"] == hits + 1
+
+        # Novo resultado do gabarito invalida o cache
+        gravar(["A", "B", "C"], ["valid"] * 3)
+        r = client.get(f"/gabaritos/{gabarito_id}/analise-itens", headers=headers)
+        assert r.json()["total_resultados"] == 5
+        assert r.json()["questoes"][0]["dificuldade"] == 0.8
+
+
+# ============ POOL DO BANCO ============
+
+class TestDbPool:
+    def test_pool_config_from_env(self, monkeypatch):
+        from db_pool import TimedQueuePool, pool_config
+
+        monkeypatch.setenv("DB_MAX_CONNECTIONS", "40")
+        monkeypatch.setenv("WEB_CONCURRENCY", "4")
+        config = pool_config()
+        assert config["poolclass"] is TimedQueuePool and config["pool_pre_ping"] is True
+        assert (config["pool_size"], config["max_overflow"]) == (5, 5)
+
+        monkeypatch.setenv("DB_POOL_SIZE", "3")
+        monkeypatch.setenv("DB_POOL_PRE_PING", "0")
+        config = pool_config()
+        assert (config["pool_size"], config["max_overflow"], config["pool_pre_ping"]) == (3, 7, False)
+
+    def test_checkout_wait_metrics(self, tmp_path, monkeypatch, caplog):
+        import threading
+        from sqlalchemy.exc import TimeoutError as PoolTimeout
+        from db_pool import instrument, pool_config, pool_metrics
+
+        monkeypatch.setenv("DB_POOL_SIZE", "1")
+        monkeypatch.setenv("DB_MAX_OVERFLOW", "0")
+        monkeypatch.setattr(pool_metrics, "slow_checkout_ms", 20)
+        url = f"sqlite:///{tmp_path / 'pool.db'}"
+        antes = dict(pool_metrics.stats)
+
+        # Uma conexão só, presa por outra thread por ~60 ms: o checkout espera e gera warning.
+        # Timeout folgado para a espera nunca virar PoolTimeout numa máquina lenta
+        monkeypatch.setenv("DB_POOL_TIMEOUT_S", "2")
+        engine = instrument(create_engine(url, **pool_config()))
+        ocupada = engine.connect()
+        threading.Timer(0.06, ocupada.close).start()
+        with caplog.at_level("WARNING", logger="lerprova-api"):
+            with engine.connect():
+                pass
+        assert any("Espera de" in r.message for r in caplog.records)
+        engine.dispose()
+
+        # Pool esgotado: timeout curto só para esta fase
+        monkeypatch.setenv("DB_POOL_TIMEOUT_S", "0.1")
+        engine = instrument(create_engine(url, **pool_config()))
+        ocupada = engine.connect()
+        with pytest.raises(PoolTimeout):
+            engine.connect()
+        ocupada.close()
+        engine.dispose()
+
+        stats = pool_metrics.stats
+        assert stats["slow_checkouts"] - antes["slow_checkouts"] == 1
+        assert stats["timeouts"] - antes["timeouts"] == 1
+        assert stats["checkouts"] - antes["checkouts"] == 3
+        assert stats["connects"] > antes["connects"]
+
+        token = get_auth_token()
+        r = client.get("/admin/db-pool", headers={"Authorization": f"Bearer {token}"})
+        assert r.status_code == 200
+        assert r.json()["wait_ms"]["count"] >= 3 and "checked_out" in r.json()
+
+
+# ============ ÍNDICES ============
+
+class TestIndices:
+    def test_ensure_indexes_idempotent_and_used(self, tmp_path):
+        from sqlalchemy import text
+        from migrations import ensure_indexes
+        from scripts.explain_queries import run
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'indices.db'}")
+        Base.metadata.create_all(bind=engine)
+        compostos = ["ix_frequencia_aluno_data", "ix_frequencia_turma_data", "ix_frequencia_data",
+                     "ix_resultados_gabarito_aluno", "ix_aulas_planejadas_plano_status_ordem"]
+        # Banco antigo: tabelas criadas antes dos índices existirem nos models
+        with engine.begin() as conn:
+            for nome in compostos:
+                conn.execute(text(f"DROP INDEX {nome}"))
+        assert not any(item["uses_index"] for item in run(engine))
+
+        assert sorted(ensure_indexes(engine)) == sorted(compostos)
+        assert ensure_indexes(engine) == []
+        assert all(item["uses_index"] for item in run(engine))
+
+
 # ============ TESTES DE CALENDÁRIO ============
 
 class TestCalendar:
@@ -214,3 +390,490 @@ class TestStats:
         token = get_auth_token()
         r = client.get("/billing/status", headers={"Authorization": f"Bearer {token}"})
         assert r.status_code == 200
+
+
+# ============ TESTES DE PROVAS (OMR) ============
+
+def _turma_com_aluno(nome: str):
+    """Turma do admin de teste e um aluno (ainda não matriculado). Retorna (turma_id, aluno_id)."""
+    from models import Aluno, Turma, User
+
+    db = TestSessionLocal()
+    admin = db.query(User).filter(User.email == "test@lerprova.com").first()
+    turma = Turma(nome=nome, user_id=admin.id)
+    aluno = Aluno(nome=f"Aluno {nome}")
+    db.add_all([turma, aluno])
+    db.commit()
+    ids = (turma.id, aluno.id)
+    db.close()
+    return ids
+
+
+def _matricular(aluno_id: int, turma_id: int):
+    from models import aluno_turma
+
+    db = TestSessionLocal()
+    db.execute(aluno_turma.insert().values(aluno_id=aluno_id, turma_id=turma_id))
+    db.commit()
+    db.close()
+
+
+def _folha_sintetica(aluno_id: int, gabarito_id: int, seed: int = 0, profile: str = "clean"):
+    """Foto sintética legível (scripts/omr_synthetic) com o QR do aluno e do gabarito: (jpeg, respostas)."""
+    import numpy as np
+    from omr_engine import OMREngine
+    from scripts.omr_synthetic import generate_sheet
+
+    layout = OMREngine().load_layout("v1.1-a4-calibrated")
+    sheet = generate_sheet(layout, np.random.default_rng(seed), profile, (1200, 1600),
+                           qr_payload={"aid": aluno_id, "gid": gabarito_id})
+    return sheet.image, sheet.answers
+
+
+class TestProvas:
+    def test_processar_lote_vazio(self):
+        token = get_auth_token()
+        r = client.post("/provas/processar-lote", headers={"Authorization": f"Bearer {token}"}, json={
+            "images": []
+        })
+        assert r.status_code == 422
+
+    def test_processar_lote_imagens_invalidas(self):
+        token = get_auth_token()
+        r = client.post("/provas/processar-lote", headers={"Authorization": f"Bearer {token}"}, json={
+            "images": ["aW52YWxpZG8=", "aW52YWxpZG8="],
+            "gabarito_id": 1
+        })
+        assert r.status_code == 200
+        data = r.json()
+        assert data["total"] == 2
+        assert data["processadas"] == 0
+        assert [item["index"] for item in data["resultados"]] == [0, 1]
+        assert all(item["success"] is False and item["error"] for item in data["resultados"])
+
+    def test_processar_lote_grava_resultados(self):
+        import base64
+        import cv2
+        import numpy as np
+        from models import Resultado, User
+        from omr_engine import OMREngine
+        from scripts.omr_synthetic import random_answers, render_sheet
+
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        turma_id, matriculado = _turma_com_aluno("Lote")
+        _matricular(matriculado, turma_id)
+        _, fora_da_turma = _turma_com_aluno("Lote Outra")
+        r = client.post("/gabaritos", headers=headers, json={
+            "titulo": "Lote", "num_questoes": 26, "respostas": ["A"] * 26, "turma_ids": [turma_id]
+        })
+        gabarito_id = r.json()["id"]
+
+        db = TestSessionLocal()
+        anterior = Resultado(aluno_id=matriculado, gabarito_id=gabarito_id, acertos=0, nota=0.0)
+        db.add(anterior)
+        db.commit()
+        anterior_id = anterior.id
+        db.close()
+
+        layout = OMREngine().load_layout("v1.1-a4-calibrated")
+        rng = np.random.default_rng(21)
+
+        def folha(aluno_id, gid):
+            respostas, _ = random_answers(layout, rng, 0.05, 0.0)
+            page = render_sheet(layout, respostas, 6, qr_payload={"aid": aluno_id, "gid": gid}, rng=rng)
+            return base64.b64encode(cv2.imencode(".jpg", page)[1].tobytes()).decode(), respostas.count("A")
+
+        primeira, _ = folha(matriculado, gabarito_id)
+        fora, _ = folha(fora_da_turma, gabarito_id)
+        inexistente, _ = folha(matriculado, 999999)
+        ultima, acertos_ultima = folha(matriculado, gabarito_id)
+        images = [primeira, fora, inexistente, "aW52YWxpZG8=", ultima]
+
+        r = client.post("/provas/processar-lote", headers=headers, json={"images": images, "num_questions": 26})
+        assert r.status_code == 200
+        data = r.json()
+        assert data["total"] == 5 and data["processadas"] == 2
+        por_indice = {item["index"]: item for item in data["resultados"]}
+        assert "não pertence" in por_indice[1]["error"]
+        assert "999999" in por_indice[2]["error"]
+        assert por_indice[3]["success"] is False
+        # Folhas repetidas do mesmo aluno: a última prevalece, no Resultado que já existia
+        assert por_indice[0]["resultado_id"] == por_indice[4]["resultado_id"] == anterior_id
+        assert por_indice[4]["acertos"] == acertos_ultima
+        assert por_indice[4]["nota"] == round(acertos_ultima / 26 * 10, 1)
+        assert por_indice[4]["aluno_nome"] == "Aluno Lote"
+        assert "second_pass" in por_indice[4]
+
+        db = TestSessionLocal()
+        gravados = db.query(Resultado).filter(Resultado.gabarito_id == gabarito_id).all()
+        assert [(res.id, res.aluno_id, res.acertos) for res in gravados] == [(anterior_id, matriculado, acertos_ultima)]
+        assert gravados[0].status_list is not None
+
+        # Professor sem turma no gabarito: nada é gravado
+        if not db.query(User).filter(User.email == "prof-lote@lerprova.com").first():
+            db.add(User(nome="Prof Lote", email="prof-lote@lerprova.com", role="professor",
+                        hashed_password=pwd_context.hash("prof123")))
+            db.commit()
+        db.close()
+        r = client.post("/auth/login", json={"email": "prof-lote@lerprova.com", "password": "prof123"})
+        prof = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        r = client.post("/provas/processar-lote", headers=prof, json={"images": [ultima], "num_questions": 26})
+        item = r.json()["resultados"][0]
+        assert item["success"] is False and "acesso negado" in item["error"]
+
+    def test_processar_scanner_stream(self):
+        import cv2
+        import numpy as np
+
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        r = client.post("/provas/processar-scanner", headers=headers, files={"file": ("vazio.tif", b"")})
+        assert r.status_code == 422
+
+        # TIFF de 2 páginas sem folhas: uma linha de erro por página e o resumo no fim
+        _, tif = cv2.imencodemulti(".tiff", [np.full((400, 300), 255, np.uint8)] * 2)
+        r = client.post("/provas/processar-scanner", headers=headers,
+                        files={"file": ("lote.tif", tif.tobytes(), "image/tiff")}, data={"gabarito_id": "1"})
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("application/x-ndjson")
+        linhas = [json.loads(linha) for linha in r.text.splitlines()]
+        assert sorted(linha["page"] for linha in linhas[:-1]) == [0, 1]
+        assert all(linha["success"] is False and linha["error"] for linha in linhas[:-1])
+        assert linhas[-1] == {"done": True, "paginas": 2, "total": 2, "processadas": 0}
+
+    def test_processar_scanner_grava_cada_folha(self):
+        import cv2
+        import numpy as np
+        from models import Resultado
+        from omr_engine import OMREngine
+        from scripts.omr_synthetic import random_answers, render_sheet
+
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        turma_id, aluno_a = _turma_com_aluno("Scanner A")
+        aluno_b = _turma_com_aluno("Scanner B")[1]
+        for aluno_id in (aluno_a, aluno_b):
+            _matricular(aluno_id, turma_id)
+        r = client.post("/gabaritos", headers=headers, json={
+            "titulo": "Scanner", "num_questoes": 26, "respostas": ["A"] * 26, "turma_ids": [turma_id]
+        })
+        gabarito_id = r.json()["id"]
+
+        # Duas folhas lado a lado na mesma página: corrigidas em paralelo, cada uma com a sua sessão
+        layout = OMREngine().load_layout("v1.1-a4-calibrated")
+        rng = np.random.default_rng(11)
+        paginas, esperado = [], {}
+        for aluno_id in (aluno_a, aluno_b):
+            respostas, _ = random_answers(layout, rng, 0.05, 0.0)
+            paginas.append(render_sheet(layout, respostas, 8, qr_payload={"aid": aluno_id, "gid": gabarito_id}, rng=rng))
+            esperado[aluno_id] = respostas.count("A")
+        gap = np.full((paginas[0].shape[0], 80), 255, np.uint8)
+        _, png = cv2.imencode(".png", np.hstack([paginas[0], gap, paginas[1]]))
+
+        r = client.post("/provas/processar-scanner", headers=headers,
+                        files={"file": ("duas.png", png.tobytes(), "image/png")}, data={"num_questions": "26"})
+        linhas = [json.loads(linha) for linha in r.text.splitlines()]
+        assert linhas[-1] == {"done": True, "paginas": 1, "total": 2, "processadas": 2}
+        assert {linha["aluno_id"]: linha["acertos"] for linha in linhas[:-1]} == esperado
+
+        db = TestSessionLocal()
+        gravados = {res.aluno_id: res.acertos for res in db.query(Resultado).filter(Resultado.gabarito_id == gabarito_id)}
+        db.close()
+        assert gravados == esperado
+
+    def test_omr_telemetry_and_metrics(self):
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        r = client.post("/provas/processar-lote", headers=headers, json={
+            "images": ["aW52YWxpZG8="], "gabarito_id": 1, "debug": True
+        })
+        telemetry = r.json()["resultados"][0]["telemetry"]
+        assert telemetry["reject_reason"] == "image_unreadable"
+        assert "decode" not in telemetry["timings_ms"]
+
+        r = client.post("/provas/processar-lote", headers=headers, json={"images": ["aW52YWxpZG8="], "gabarito_id": 1})
+        assert "telemetry" not in r.json()["resultados"][0]
+
+        r = client.get("/omr/metrics", headers=headers)
+        assert r.status_code == 200
+        metrics = r.json()
+        assert metrics["counters"]["rejects"]["image_unreadable"] >= 2
+        assert metrics["total_ms"]["provas_processar_lote"]["count"] >= 2
+        assert metrics["executor"]["pending"] == 0
+
+    def test_processar_idempotente(self):
+        from routers.provas import omr_metrics
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        body = {"image": "aW52YWxpZG8tcmVlbnZpbw==", "gabarito_id": 1}
+
+        antes = omr_metrics.snapshot()["counters"]["requests"].get("provas_processar", 0)
+        r1 = client.post("/provas/processar", headers=headers, json=body)
+        r2 = client.post("/provas/processar", headers=headers, json=body)
+        assert r1.status_code == r2.status_code == 422
+        assert r1.json() == r2.json()
+        assert "idempotent-replayed" not in r1.headers
+        assert r2.headers["idempotent-replayed"] == "true"
+        # O reenvio não passou pelo OMR
+        assert omr_metrics.snapshot()["counters"]["requests"]["provas_processar"] == antes + 1
+
+        chave = {**headers, "Idempotency-Key": "scan-123"}
+        r = client.post("/provas/processar", headers=chave, json=body)
+        assert r.headers["idempotent-replayed"] == "true"
+        r = client.post("/provas/processar", headers=chave, json={**body, "image": "b3V0cmEtaW1hZ2Vt"})
+        assert r.status_code == 422
+        assert "Idempotency-Key" in r.json()["detail"]
+
+    def test_processar_reenvio_apos_matricula(self):
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        turma_id, aluno_id = _turma_com_aluno("Reenvio")
+        r = client.post("/gabaritos", headers=headers, json={
+            "titulo": "Reenvio", "num_questoes": 26, "respostas": ["E"] * 26, "turma_ids": [turma_id]
+        })
+        gabarito_id = r.json()["id"]
+        image, respostas = _folha_sintetica(aluno_id, gabarito_id, seed=5)
+
+        def enviar():
+            return client.post("/provas/processar/upload", headers=headers,
+                               files={"file": ("folha.jpg", image, "image/jpeg")}, data={"num_questions": "26"})
+
+        # A rejeição depende do banco (matrícula), não da foto: não fica no cache
+        r = enviar()
+        assert r.status_code == 422
+        assert "não pertence" in r.json()["detail"]
+
+        _matricular(aluno_id, turma_id)
+        r = enviar()
+        assert r.status_code == 200
+        assert "idempotent-replayed" not in r.headers
+        data = r.json()
+        assert data["aluno_id"] == aluno_id and data["resultado_id"]
+        assert data["acertos"] == respostas.count("E")
+
+        assert enviar().headers["idempotent-replayed"] == "true"
+
+    def test_processar_registra_segunda_leitura(self):
+        from models import Resultado
+
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        turma_id, aluno_id = _turma_com_aluno("Releitura")
+        _matricular(aluno_id, turma_id)
+        r = client.post("/gabaritos", headers=headers, json={
+            "titulo": "Releitura", "num_questoes": 26, "respostas": ["A"] * 26, "turma_ids": [turma_id]
+        })
+        gabarito_id = r.json()["id"]
+        # Foto de celular com marcas duvidosas: o engine relê algumas questões
+        image, _ = _folha_sintetica(aluno_id, gabarito_id, seed=0, profile="phone")
+
+        r = client.post("/provas/processar/upload", headers=headers,
+                        files={"file": ("folha.jpg", image, "image/jpeg")}, data={"num_questions": "26"})
+        data = r.json()
+        assert data["success"] is True and data["second_pass"]
+        assert {"question", "first", "second", "applied"} <= set(data["second_pass"][0])
+
+        db = TestSessionLocal()
+        resultado = db.get(Resultado, data["resultado_id"])
+        db.close()
+        assert json.loads(resultado.second_pass) == data["second_pass"]
+
+    def test_processar_em_cinza_sem_imagens_de_revisao(self):
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        r = client.post("/gabaritos", headers=headers, json={"titulo": "Cinza", "num_questoes": 26, "respostas": ["A"] * 26})
+        gabarito_id = r.json()["id"]
+        image, _ = _folha_sintetica(0, gabarito_id, seed=7)
+
+        def enviar(**campos):
+            return client.post("/provas/processar/upload", headers=headers,
+                               files={"file": ("folha.jpg", image, "image/jpeg")},
+                               data={"num_questions": "26", "debug": "true", **campos}).json()
+
+        # Padrão: nenhuma imagem de revisão, a foto é decodificada direto em cinza (sem a etapa "gray")
+        padrao = enviar()
+        assert padrao["success"] is True
+        assert "gray" not in padrao["telemetry"]["timings_ms"]
+        assert "processed_image_url" not in padrao
+
+        revisao = enviar(images="true")
+        assert "gray" in revisao["telemetry"]["timings_ms"]
+        assert revisao["processed_image_url"] and revisao["audit_map_url"]
+
+    def test_omr_process_conta_correcao(self):
+        import base64
+        from models import User
+
+        def usadas():
+            db = TestSessionLocal()
+            total = db.query(User.total_corrections_used).filter(User.email == "test@lerprova.com").scalar()
+            db.close()
+            return total or 0
+
+        token = get_auth_token()
+        antes = usadas()
+        image, _ = _folha_sintetica(0, 0, seed=9)
+        r = client.post("/omr/process", headers={"Authorization": f"Bearer {token}"}, json={
+            "image": base64.b64encode(image).decode(), "num_questions": 26, "layout_version": "v1.1-a4-calibrated"
+        })
+        assert r.json()["success"] is True
+        assert usadas() == antes + 1
+
+    def test_omr_preview_sem_estado_do_rastreador(self, monkeypatch):
+        import base64
+        from routers import provas
+
+        monkeypatch.setattr(provas, "API_KEY_SECRET", "segredo-teste")
+        image, _ = _folha_sintetica(1, 1, seed=2)
+        r = client.post("/omr/preview", headers={"X-API-Key": "segredo-teste"},
+                        json={"image": base64.b64encode(image).decode()})
+        assert r.status_code == 200
+        assert r.json()["success"] is True
+        assert "track" not in r.json()
+
+    def test_omr_admission_rejects_when_budget_exhausted(self, monkeypatch):
+        from routers import provas
+        from omr_admission import PixelBudget
+        budget = PixelBudget(capacity_mp=1, max_queue=0, retry_after_s=7)
+        budget.in_flight, budget.in_flight_mp = 1, 1.0  # Outra leitura ocupando o orçamento
+        monkeypatch.setattr(provas, "pixel_budget", budget)
+
+        token = get_auth_token()
+        r = client.post("/omr/process", headers={"Authorization": f"Bearer {token}"}, json={"image": "aW52YWxpZG8="})
+        assert r.status_code == 503
+        assert r.headers["retry-after"] == "7"
+        assert provas.omr_metrics.snapshot()["counters"]["rejects"]["pixel_budget"] >= 1
+
+    def test_scanner_admission_and_page_limit(self, monkeypatch):
+        import cv2
+        import numpy as np
+        from routers import provas
+        from omr_admission import PixelBudget
+
+        token = get_auth_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        _, tif = cv2.imencodemulti(".tiff", [np.full((400, 300), 255, np.uint8)] * 3)
+        paginas_lidas = []
+        split_scan = provas.omr.split_scan
+        monkeypatch.setattr(provas.omr, "split_scan", lambda data, page, *a: paginas_lidas.append(page) or split_scan(data, page, *a))
+
+        # Limite de páginas conferido pelo cabeçalho: a página 2 nem é decodificada
+        monkeypatch.setattr(provas, "SCANNER_MAX_PAGINAS", 2)
+        r = client.post("/provas/processar-scanner", headers=headers,
+                        files={"file": ("lote.tif", tif.tobytes(), "image/tiff")}, data={"gabarito_id": "1"})
+        linhas = [json.loads(linha) for linha in r.text.splitlines()]
+        assert paginas_lidas == [0, 1]
+        assert any("Máximo de 2 páginas" in (linha.get("error") or "") for linha in linhas)
+        assert linhas[-1]["paginas"] == 2
+
+        # Orçamento de pixels esgotado: a página é recusada antes do split_scan
+        budget = PixelBudget(capacity_mp=1, max_queue=0, retry_after_s=7)
+        budget.in_flight, budget.in_flight_mp = 1, 1.0
+        monkeypatch.setattr(provas, "pixel_budget", budget)
+        paginas_lidas.clear()
+        r = client.post("/provas/processar-scanner", headers=headers,
+                        files={"file": ("lote.tif", tif.tobytes(), "image/tiff")}, data={"gabarito_id": "1"})
+        linhas = [json.loads(linha) for linha in r.text.splitlines()]
+        assert paginas_lidas == []
+        assert linhas[0]["success"] is False and "ocupado" in linhas[0]["error"]
+        assert budget.stats["rejected_queue_full"] == 1
+
+    def test_scan_anchors_upload_multipart(self):
+        token = get_auth_token()
+        r = client.post(
+            "/provas/scan-anchors/upload",
+            headers={"Authorization": f"Bearer {token}"},
+            files={"file": ("frame.jpg", b"nao-e-um-jpeg", "image/jpeg")}
+        )
+        assert r.status_code == 200
+        data = r.json()
+        assert data["success"] is False
+
+    def test_scan_anchors_session_tracking(self):
+        import cv2
+        import numpy as np
+        token = get_auth_token()
+        img = np.full((640, 480), 220, np.uint8)
+        for cx, cy in [(40, 50), (442, 45), (445, 600), (42, 592)]:
+            cv2.rectangle(img, (cx - 8, cy - 8), (cx + 8, cy + 8), 0, -1)
+        frame = cv2.imencode(".jpg", img)[1].tobytes()
+
+        modes = []
+        for _ in range(2):
+            r = client.post(
+                "/provas/scan-anchors/upload",
+                headers={"Authorization": f"Bearer {token}"},
+                files={"file": ("frame.jpg", frame, "image/jpeg")},
+                data={"session_id": "sessao-teste"},
+            )
+            assert r.status_code == 200
+            data = r.json()
+            assert data["success"] is True and "track" not in data
+            modes.append(data["tracking"])
+        assert modes == ["detected", "locked"]
+
+    def _radar_frame(self, seq):
+        import struct
+        import cv2
+        import numpy as np
+        img = np.full((640, 480), 220, np.uint8)
+        for cx, cy in [(40, 50), (442, 45), (445, 600), (42, 592)]:
+            cv2.rectangle(img, (cx - 8, cy - 8), (cx + 8, cy + 8), 0, -1)
+        return struct.pack(">IHH", seq, 480, 640) + img.tobytes()
+
+    def test_scan_anchors_websocket(self):
+        token = get_auth_token()
+        with client.websocket_connect(f"/ws/scan-anchors?token={token}") as ws:
+            ws.send_bytes(self._radar_frame(1))
+            first = ws.receive_json()
+            ws.send_bytes(self._radar_frame(2))
+            second = ws.receive_json()
+            ws.send_bytes(b"\x00\x00\x00\x03\x00\x10\x00\x10abc")
+            invalid = ws.receive_json()
+
+        assert first["seq"] == 1 and first["success"] and first["tracking"] == "detected"
+        assert len(first["anchors"]) == 4 and "track" not in first
+        assert second["seq"] == 2 and second["tracking"] == "locked"
+        assert invalid["seq"] is None and invalid["success"] is False
+
+    def test_scan_anchors_websocket_drops_stale_frames(self):
+        token = get_auth_token()
+        with client.websocket_connect(f"/ws/scan-anchors?token={token}") as ws:
+            for seq in range(1, 9):
+                ws.send_bytes(self._radar_frame(seq))
+            replies = [ws.receive_json()]
+            while replies[-1]["seq"] != 8:
+                replies.append(ws.receive_json())
+
+        # O último frame sempre é processado; os demais são respondidos ou contados como descartados
+        assert len(replies) + replies[-1]["dropped"] == 8
+        assert [r["seq"] for r in replies] == sorted(r["seq"] for r in replies)
+
+    def test_scan_anchors_websocket_requires_token(self):
+        from starlette.websockets import WebSocketDisconnect
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect("/ws/scan-anchors?token=invalido") as ws:
+                ws.receive_json()
+
+    def test_omr_artifact_cache_headers(self, tmp_path, monkeypatch):
+        from omr_engine import artifact_store
+        monkeypatch.setattr(artifact_store, "directory", tmp_path)
+        name = artifact_store.put(b"\xff\xd8jpeg-fake")
+
+        r = client.get(f"/omr/artifacts/{name}")
+        assert r.status_code == 200
+        assert r.content == b"\xff\xd8jpeg-fake"
+        assert r.headers["content-type"] == "image/jpeg"
+        assert "immutable" in r.headers["cache-control"]
+
+        r = client.get(f"/omr/artifacts/{name}", headers={"If-None-Match": r.headers["etag"]})
+        assert r.status_code == 304
+
+    def test_omr_artifact_not_found(self, tmp_path, monkeypatch):
+        from omr_engine import artifact_store
+        monkeypatch.setattr(artifact_store, "directory", tmp_path)
+        manifest = artifact_store.put_json({"warped": "x"})
+        assert client.get("/omr/artifacts/..%2F..%2Fmain.py").status_code == 404
+        assert client.get(f"/omr/artifacts/{manifest}").status_code == 404  # manifestos não são servidos
+        assert client.get(f"/omr/artifacts/{'0' * 32}.jpg/audit.jpg").status_code == 404
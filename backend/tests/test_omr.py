@@ -0,0 +1,853 @@
+"""
+Testes do pipeline OMR (engine + executor)
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# Chave dos artefatos (o artifact_store global do omr_engine é criado no import)
+os.environ.setdefault("OMR_ARTIFACT_SECRET", "teste")
+
+import asyncio
+import json
+import subprocess
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+from omr_engine import OMREngine, PreprocessCache, StageTimer
+from omr_executor import OMRExecutor, OMRQueueFull
+from omr_audit import AuditSink
+from artifact_store import ArtifactStore
+from anchor_tracker import AnchorTracker
+from omr_metrics import Histogram, OMRMetrics
+from idempotency import REPLAY_HEADER, IdempotencyCache, IdempotencyConflict, ReadRejected
+from omr_admission import AdmissionRejected, PixelBudget, image_megapixels, image_size, scan_page_megapixels
+
+
+@pytest.fixture(scope="module")
+def phone_photo():
+    """
+    Foto de celular sintética (JPEG, semente fixa) da folha v1.1, por tamanho do frame.
+    Cada tamanho é gerado uma vez por módulo e compartilhado pelas classes de teste.
+    """
+    from scripts.omr_synthetic import generate_corpus
+
+    layout = OMREngine().load_layout("v1.1-a4-calibrated")
+    photos = {}
+
+    def photo(out_size):
+        if out_size not in photos:
+            photos[out_size] = generate_corpus(layout, 1, seed=3, profile="phone", out_size=out_size)[0].image
+        return photos[out_size]
+    return photo
+
+
+@pytest.fixture(scope="module")
+def phone_sheet(phone_photo):
+    """A foto de celular 1200×1600 decodificada em cinza."""
+    return cv2.imdecode(np.frombuffer(phone_photo((1200, 1600)), np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+# ============ EXECUTOR ============
+
+class TestExecutor:
+    def test_thread_mode_runs_engine(self):
+        executor = OMRExecutor(OMREngine(), mode="thread", max_workers=1)
+        try:
+            result = asyncio.run(executor.run("detect_anchors_only", "aW52YWxpZG8="))
+            assert result["success"] is False
+            assert executor.pending == 0
+        finally:
+            executor.shutdown(wait=True)
+
+    def test_queue_full_rejects(self):
+        gate = threading.Event()
+
+        class SlowEngine:
+            def detect_anchors_only(self, image):
+                gate.wait(5)
+                return {"success": True}
+
+        executor = OMRExecutor(SlowEngine(), mode="thread", max_workers=1, max_queue=1)  # type: ignore[arg-type]
+
+        async def scenario():
+            first = asyncio.ensure_future(executor.run("detect_anchors_only", "x"))
+            await asyncio.sleep(0.05)
+            with pytest.raises(OMRQueueFull):
+                await executor.run("detect_anchors_only", "y")
+            gate.set()
+            return await first
+
+        try:
+            assert asyncio.run(scenario())["success"] is True
+        finally:
+            gate.set()
+            executor.shutdown(wait=True)
+
+
+# ============ LEITURA DE BOLHAS ============
+
+class TestBubbleScoring:
+    def test_vectorized_matches_per_bubble(self):
+        engine = OMREngine()
+        rng = np.random.default_rng(42)
+        thresh = (rng.random((400, 300)) > 0.6).astype(np.uint8) * 255
+
+        coords = [[x, y, x + 33, y + 33] for y in range(0, 330, 40) for x in range(0, 260, 45)]
+        coords.append([280, 380, 300, 400])  # ROI cortado pela borda
+        ratios = engine._score_bubbles(thresh, coords)
+
+        for (x1, y1, x2, y2), (fill, bg) in zip(coords, ratios):
+            exp_fill, exp_bg = engine._masked_ratio(thresh[y1:y2, x1:x2])
+            assert fill == pytest.approx(exp_fill, abs=1e-6)
+            assert bg == pytest.approx(exp_bg, abs=1e-6)
+
+
+class TestSecondPass:
+    LAYOUT = "v1.1-a4-calibrated"
+
+    def _warped(self, engine, marks, shadow_row=None):
+        """
+        Retificada com a barra de calibração e marcações {(questão, opção): (cinza, dx, dy)}
+        desenhadas nos ROIs; `shadow_row` escurece a faixa de uma questão (sombra local).
+        """
+        layout = engine.load_layout(self.LAYOUT)
+        size = layout["warped_size"]
+        H, W = size["h"], size["w"]
+        warped = np.full((H, W), 235, np.uint8)
+        warped[int(H * 0.2):int(H * 0.8), int(W * 2 / 180):int(W * 4 / 180)] = 30
+        if shadow_row is not None:
+            n = len(layout.options)
+            x1, y1 = layout.roi_coords[shadow_row * n][:2]
+            x2, y2 = layout.roi_coords[shadow_row * n + n - 1][2:]
+            warped[y1 - 10:y2 + 10, x1 - 10:x2 + 10] = 110
+        for (q, j), (value, dx, dy) in marks.items():
+            x1, y1, x2, y2 = layout.roi_coords[q * len(layout.options) + j]
+            center = ((x1 + x2) // 2 + dx, (y1 + y2) // 2 + dy)
+            cv2.circle(warped, center, int((x2 - x1) * 0.4), int(value), -1)
+        return warped
+
+    def _read(self, engine, warped):
+        bubbles = engine.read_bubbles_by_density(warped, None, self.LAYOUT)
+        return bubbles, engine.validate_questions(bubbles, self.LAYOUT)
+
+    def test_flagged_row_upgraded_and_both_decisions_recorded(self):
+        engine = OMREngine()
+        # Q1 na sombra (o threshold global vê a linha toda pintada), com a marcação em B deslocada
+        warped = self._warped(engine, {(0, 1): (30, 4, 3), (1, 3): (30, 0, 0)}, shadow_row=0)
+        bubbles, validated = self._read(engine, warped)
+        assert validated["status_list"][:3] == ["invalid", "valid", "blank"]
+
+        rereads = engine.reread_flagged_rows(warped, bubbles, validated, self.LAYOUT)
+        assert [r["question"] for r in rereads] == [1]
+        reread = rereads[0]
+        assert reread["first"]["status"] == "invalid" and reread["first"]["answer"] is None
+        assert reread["second"]["status"] == "valid" and reread["second"]["answer"] == "B"
+        # Threshold da linha entre a marcação (30) e a sombra (110)
+        assert 30 <= reread["second"]["threshold"] < 110 and len(reread["second"]["offset"]) == 2
+        assert reread["applied"] is True
+        assert validated["answers"][:2] == ["B", "D"]
+        assert validated["status_counts"]["invalid"] == 0
+        assert bubbles[0]["final_status"] == "valid"
+
+    def test_double_mark_stays_invalid(self):
+        engine = OMREngine()
+        warped = self._warped(engine, {(0, 0): (30, 0, 0), (0, 3): (30, 0, 0)})
+        bubbles, validated = self._read(engine, warped)
+        rereads = engine.reread_flagged_rows(warped, bubbles, validated, self.LAYOUT)
+        assert rereads[0]["second"]["status"] == "invalid" and rereads[0]["applied"] is False
+        assert validated["status_list"][0] == "invalid"
+
+
+# ============ LAYOUTS ============
+
+class TestCompiledLayout:
+    def test_layouts_precompiled_and_cached(self):
+        engine = OMREngine()
+        assert "v1" in engine.layout_cache
+        assert "v1.1-a4-calibrated" in engine.layout_cache
+        assert engine.load_layout("v1.1-a4-calibrated") is engine.load_layout("v1.1-a4-calibrated")
+
+    def test_roi_geometry(self):
+        layout = OMREngine().load_layout("v1.1-a4-calibrated")
+        n_opts = len(layout.options)
+        assert layout.roi_coords.shape == (layout.num_questions * n_opts, 4)
+        assert layout.centers.shape == (layout.num_questions, n_opts, 2)
+        # Retângulos dentro do warp e do tamanho nominal
+        x1, y1, x2, y2 = layout.roi_coords.T
+        assert (x1 >= 0).all() and (y1 >= 0).all()
+        assert (x2 <= layout.width).all() and (y2 <= layout.height).all()
+        assert ((x2 - x1) == layout.roi_size).all()
+        # Acesso legado por chave continua funcionando
+        assert layout.get("num_questions") == layout.num_questions
+
+    def test_unknown_version_falls_back_to_v1(self):
+        engine = OMREngine()
+        assert engine.load_layout("v99") is engine.load_layout("v1")
+
+
+# ============ ÂNCORAS ============
+
+class TestAnchorPyramid:
+    def _sheet(self, w=2400, h=3200):
+        img = np.full((h, w), 230, np.uint8)
+        centers = [(180, 200), (w - 170, 190), (w - 210, h - 180), (200, h - 220)]
+        for cx, cy in centers:
+            cv2.rectangle(img, (cx - 40, cy - 40), (cx + 40, cy + 40), 0, -1)
+        ok, buf = cv2.imencode(".png", img)
+        return buf.tobytes(), centers
+
+    def test_pyramid_factor(self):
+        engine = OMREngine()
+        assert engine._pyramid_factor(4000, 3000) == 4
+        assert engine._pyramid_factor(1600, 1200) == 2
+        assert engine._pyramid_factor(640, 480) == 1
+
+    def test_small_image_skips_pyramid(self):
+        engine = OMREngine()
+        img = np.full((480, 640), 230, np.uint8)
+        _, buf = cv2.imencode(".png", img)
+        assert engine.detect_anchors_coarse_to_fine(buf, PreprocessCache(gray=img)) == []
+
+    def test_coarse_to_fine_matches_full_resolution(self):
+        engine = OMREngine()
+        data, centers = self._sheet()
+        buf = engine._image_buffer(data)
+        gray = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+
+        anchors = engine.detect_anchors_coarse_to_fine(buf, PreprocessCache(gray=gray))
+        full = engine.detect_anchors_robust(PreprocessCache(gray=gray))
+        assert len(anchors) == 4 and len(full) == 4
+        for (x, y), (fx, fy), (cx, cy) in zip(anchors, full, centers):
+            assert abs(x - fx) <= 1 and abs(y - fy) <= 1
+            assert abs(x - cx) <= 1 and abs(y - cy) <= 1
+
+
+class TestAnchorTracking:
+    def _frame(self, dx=0, dy=0, inset=0, w=480, h=640):
+        img = np.full((h, w), 220, np.uint8)
+        centers = [(40 + dx, 50 + dy), (w - 38 + dx, 45 + dy), (w - 35 + dx, h - 40 + dy), (42 + dx, h - 48 + dy)]
+        centers = [(cx + inset * (1 if cx < w / 2 else -1), cy + inset * (1 if cy < h / 2 else -1)) for cx, cy in centers]
+        for cx, cy in centers:
+            cv2.rectangle(img, (cx - 8, cy - 8), (cx + 8, cy + 8), 0, -1)
+        ok, buf = cv2.imencode(".jpg", img)
+        return buf.tobytes(), centers
+
+    def test_locked_frames_track_and_skip_qr(self, monkeypatch):
+        engine = OMREngine()
+        calls = []
+        monkeypatch.setattr(engine, "decode_qr", lambda *a, **k: calls.append(1) or {"aid": 7, "gid": 3})
+
+        data, _ = self._frame()
+        first = engine.detect_anchors_only(data)
+        assert first["tracking"] == "detected" and first["qr_data"] == {"aid": 7, "gid": 3}
+
+        data, centers = self._frame(dx=6, dy=-4)
+        second = engine.detect_anchors_only(data, track=first["track"])
+        assert second["tracking"] == "locked"
+        assert second["qr_data"] == {"aid": 7, "gid": 3}
+        assert len(calls) == 1  # QR lido só no primeiro frame
+        for (x, y), (cx, cy) in zip(second["track"]["anchors"], centers):
+            assert abs(x - cx) <= 1 and abs(y - cy) <= 1
+        assert all(second["track"]["areas"])
+
+    def test_falls_back_to_full_detection(self):
+        engine = OMREngine()
+        data, _ = self._frame()
+        track = engine.detect_anchors_only(data)["track"]
+
+        # Aproximação maior que a janela de rastreamento: detecção completa
+        data, centers = self._frame(inset=60)
+        result = engine.detect_anchors_only(data, track=track)
+        assert result["success"] and result["tracking"] == "detected"
+        assert result["track"]["anchors"][0] == [centers[0][0], centers[0][1]]
+
+        # Folha fora do quadro: sessão perde o rastreamento
+        _, empty = cv2.imencode(".jpg", np.full((640, 480), 220, np.uint8))
+        result = engine.detect_anchors_only(empty.tobytes(), track=result["track"])
+        assert result["success"] is False and result["tracking"] == "lost" and result["track"] is None
+
+    def test_tracker_sessions_expire_and_evict(self):
+        tracker = AnchorTracker(ttl_s=30, max_sessions=2)
+        for key in ("a", "b", "c"):
+            tracker.update(key, {"tracking": "detected", "track": {"anchors": key}})
+        assert tracker.get("a") is None and tracker.get("c") == {"anchors": "c"}
+
+        tracker.update("c", {"tracking": "lost", "track": None})
+        assert tracker.get("c") is None
+        assert tracker.stats == {"locked": 0, "detected": 3, "lost": 1}
+
+        tracker.ttl_s = 0
+        time.sleep(0.01)
+        assert tracker.get("b") is None
+
+
+class TestPreprocessCache:
+    def _image(self, seed=0):
+        rng = np.random.default_rng(seed)
+        return rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+    def test_buffers_memoized_and_match_opencv(self):
+        image = self._image()
+        prep = PreprocessCache(image)
+        assert prep.otsu is prep.otsu
+        assert prep.clahe is prep.clahe
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8)).apply(gray)
+        _, otsu = cv2.threshold(clahe, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        blurred = cv2.GaussianBlur(clahe, (3, 3), 0)
+        adaptive = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 31, 10)
+        assert np.array_equal(prep.gray, gray)
+        assert np.array_equal(prep.otsu, otsu)
+        assert np.array_equal(prep.adaptive, adaptive)
+
+    def test_output_buffers_reused_between_images(self):
+        first = PreprocessCache(self._image(1)).strict
+        second = PreprocessCache(self._image(2)).strict
+        # Mesmo tamanho, mesma thread: o dst= reaproveita o buffer
+        assert np.shares_memory(first, second)
+        # Escopos diferentes não se sobrescrevem
+        coarse = PreprocessCache(self._image(3), scope="coarse").strict
+        assert not np.shares_memory(second, coarse)
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError):
+            PreprocessCache(self._image()).binary("canny")
+
+
+# ============ QR CODE ============
+
+class TestQRDecode:
+    def _warped_sheet(self, layout, payload):
+        """Folha já no espaço do warp com o QR impresso na região declarada (sem zona de silêncio)."""
+        sheet = np.full((layout.height, layout.width), 255, np.uint8)
+        x, y, w, h = layout.qr_region
+        qr = cv2.QRCodeEncoder.create().encode(json.dumps(payload))[2:-2, 2:-2]
+        size = min(w, h) - 8
+        sheet[y + 4:y + 4 + size, x + 4:x + 4 + size] = cv2.resize(qr, (size, size), interpolation=cv2.INTER_NEAREST)
+        return sheet
+
+    def test_region_decoded_without_full_scan(self):
+        engine = OMREngine()
+        layout = engine.load_layout("v1.1-a4-calibrated")
+        assert layout.qr_region is not None
+        sheet = self._warped_sheet(layout, {"aid": 12, "gid": 34})
+
+        timings = {}
+        data = engine.decode_qr(sheet, layout.warp_dst, layout, timings=timings)
+        assert data == {"aid": 12, "gid": 34}
+        assert any(k.startswith("region_") and k != "region_warp" for k in timings)
+        assert not any(k.startswith("full_") for k in timings)
+
+    def test_full_image_is_last_resort(self):
+        engine = OMREngine()
+        layout = engine.load_layout("v1.1-a4-calibrated")
+        blank = np.full((layout.height, layout.width), 255, np.uint8)
+
+        timings = {}
+        assert engine.decode_qr(blank, layout.warp_dst, layout, timings=timings) is None
+        assert "full_opencv" in timings
+
+    def test_detector_reused(self):
+        engine = OMREngine()
+        blank = np.full((100, 100), 255, np.uint8)
+        engine._decode_qr_opencv(blank)
+        detector = engine._local.qr_detector
+        engine._decode_qr_opencv(blank)
+        assert engine._local.qr_detector is detector
+
+
+# ============ AUDITORIA ============
+
+class TestAuditSink:
+    def test_writes_in_background_with_retention(self, tmp_path):
+        (tmp_path / "antigo.jpg").write_bytes(b"x")
+        sink = AuditSink(tmp_path, max_files=4, enabled=True)
+        try:
+            for i in range(3):
+                assert sink.submit("CHECK", {"a.jpg": b"jpg", "meta.json": {"i": i}})
+            assert sink.flush(5)
+        finally:
+            sink.close()
+
+        files = sorted(f.name for f in tmp_path.iterdir())
+        assert len(files) == 4
+        assert "antigo.jpg" not in files  # o mais antigo sai primeiro, inclusive os que já existiam
+        assert sink.stats["written"] == 6 and sink.stats["deleted"] == 3
+        meta = [f for f in files if f.endswith("meta.json")][-1]
+        assert json.loads((tmp_path / meta).read_text()) == {"i": 2}
+
+    def test_sampling(self, tmp_path):
+        sink = AuditSink(tmp_path, max_files=10, sample_rates={"OK": 0.0, "CHECK": 1.0}, enabled=True)
+        assert sink.should_sample("CHECK")
+        assert not any(sink.should_sample("OK") for _ in range(50))
+        assert not AuditSink(tmp_path, max_files=10, enabled=False).should_sample("CHECK")
+
+    def test_full_queue_drops(self, tmp_path):
+        sink = AuditSink(tmp_path, max_files=10, max_queue=1, enabled=True)
+        gate = threading.Event()
+        original_write = sink._write
+        sink._write = lambda *args: (gate.wait(5), original_write(*args))  # type: ignore[method-assign]
+        try:
+            sink.submit("OK", {"a.jpg": b"1"})  # ocupa a thread
+            time.sleep(0.05)
+            sink.submit("OK", {"a.jpg": b"2"})  # ocupa a fila
+            assert sink.submit("OK", {"a.jpg": b"3"}) is None
+            assert sink.stats["dropped"] == 1
+        finally:
+            gate.set()
+            sink.flush(5)
+            sink.close()
+
+
+# ============ ARTEFATOS ============
+
+class TestArtifactStore:
+    def test_content_addressed_and_deduplicated(self, tmp_path):
+        store = ArtifactStore(tmp_path, max_files=10, secret="teste")
+        name = store.put(b"abc")
+        assert store.put(b"abc") == name
+        assert store.put(b"abd") != name
+        assert store.path(name).read_bytes() == b"abc"
+        # Chave secreta diferente => nomes diferentes para o mesmo conteúdo
+        assert ArtifactStore(tmp_path, secret="outra").key_for(b"abc") != store.key_for(b"abc")
+
+    def test_key_shared_between_processes(self, tmp_path, monkeypatch):
+        # Mesma chave => mesmos nomes em qualquer processo (worker web ou pool OMR)
+        a = ArtifactStore(tmp_path, secret="teste")
+        b = ArtifactStore(tmp_path, secret="teste")
+        assert a.key_for(b"abc") == b.key_for(b"abc")
+        assert a.derived_name("x.json") == b.derived_name("x.json")
+        # Sem chave nenhuma não há fallback aleatório: recusa gravar
+        monkeypatch.delenv("OMR_ARTIFACT_SECRET", raising=False)
+        monkeypatch.delenv("JWT_SECRET_KEY", raising=False)
+        store = ArtifactStore(tmp_path)
+        assert not store.configured
+        with pytest.raises(RuntimeError):
+            store.put(b"abc")
+
+    def test_invalid_names_rejected(self, tmp_path):
+        store = ArtifactStore(tmp_path, max_files=10, secret="teste")
+        store.put(b"abc")
+        for name in ("../main.py", "abc.jpg", "0" * 32 + ".exe", ""):
+            assert store.path(name) is None
+
+    def test_retention(self, tmp_path):
+        store = ArtifactStore(tmp_path, max_files=3, secret="teste")
+        names = [store.put(bytes([i])) for i in range(5)]
+        assert [store.path(n) is not None for n in names] == [False, False, True, True, True]
+
+    def test_audit_map_rendered_lazily(self, tmp_path, monkeypatch):
+        import omr_engine
+        store = ArtifactStore(tmp_path, max_files=10, secret="teste")
+        monkeypatch.setattr(omr_engine, "artifact_store", store)
+
+        _, warped = cv2.imencode(".jpg", np.full((200, 150, 3), 255, np.uint8))
+        questions = [{
+            "final_status": "valid", "final_index": 1,
+            "bubbles": [{"coords": [10, 10, 30, 30], "score": 0.0}, {"coords": [40, 10, 60, 30], "score": 0.9}],
+        }]
+        manifest = store.put_json({"warped": store.put(warped.tobytes()), "num_questions": 1, "questions": questions})
+
+        engine = OMREngine()
+        rendered = engine.render_audit_map(manifest)
+        assert rendered and store.path(rendered) is not None
+        audit = cv2.imread(str(store.path(rendered)))
+        assert audit[10, 50, 1] > 200 and audit[10, 50, 2] < 80  # retângulo verde na opção marcada
+        assert engine.render_audit_map(manifest) == rendered
+        assert engine.render_audit_map("0" * 32 + ".json") is None
+
+
+# ============ FOLHAS SINTÉTICAS (scripts/omr_synthetic.py) ============
+
+class TestSyntheticSheets:
+    def test_clean_sheets_read_exactly(self):
+        from scripts.omr_synthetic import generate_corpus
+
+        engine = OMREngine()
+        layout = engine.load_layout("v1.1-a4-calibrated")
+        for sheet in generate_corpus(layout, 2, seed=0, profile="clean", out_size=(1200, 1600)):
+            result = engine.process_image(sheet.image, return_images=False, return_audit=False,
+                                          layout_version="v1.1-a4-calibrated")
+            assert result["success"] is True
+            assert result["answers"] == sheet.answers
+            assert result["qr_data"] == sheet.qr_payload
+
+            telemetry = result["telemetry"]
+            assert telemetry["anchor_strategy"] == "coarse" and telemetry["reject_reason"] is None
+            assert {"decode", "anchors", "warp", "qr", "bubbles", "validate"} <= set(telemetry["timings_ms"])
+            assert sum(telemetry["timings_ms"].values()) == pytest.approx(telemetry["total_ms"], abs=1.0)
+
+    def test_benchmark_summary(self):
+        from scripts.bench_omr import summarize
+        from scripts.omr_synthetic import SyntheticSheet
+
+        corpus = [
+            SyntheticSheet(b"", ["A", None, "C"], [None, None, "B"], {"aid": 1}),
+            SyntheticSheet(b"", ["B", "D", None], [], {"aid": 2}),
+        ]
+        records = [
+            {"index": 0, "total_ms": 100.0, "stages_ms": {"anchors": 40.0, "other": 60.0}, "success": True,
+             "error": None, "answers": ["A", None, "B"], "quality": "ok", "qr_data": {"aid": 1},
+             "baseline_rss_mb": 50.0, "peak_rss_mb": 120.0},
+            {"index": 1, "total_ms": 30.0, "stages_ms": {"anchors": 30.0}, "success": False,
+             "error": "Âncoras não encontradas", "answers": None, "quality": None, "qr_data": None,
+             "baseline_rss_mb": 50.0, "peak_rss_mb": 90.0},
+        ]
+        report = summarize(records, corpus, wall_s=2.0, workers=2)
+        assert report["throughput"]["sheets_per_s_per_core"] == 0.5
+        assert report["latency_ms"]["stages"]["anchors"]["count"] == 2
+        assert report["memory"]["peak_rss_mb"] == 120.0
+        acc = report["accuracy"]
+        assert acc["question_accuracy"] == round(2 / 6, 4)
+        assert acc["question_accuracy_processed"] == round(2 / 3, 4)
+        assert acc["blank_accuracy"] == 1.0 and acc["erased_accuracy"] == 0.0
+        assert acc["qr_rate"] == 0.5 and acc["perfect_sheet_rate"] == 0.0
+        assert report["failures"] == {"Âncoras não encontradas": 1}
+
+
+# ============ SCANNER (TIFF multipágina / várias folhas por imagem) ============
+
+@pytest.fixture(scope="module")
+def scanner_file():
+    """(engine, TIFF de scanner sintético, página 0 decodificada, respostas de cada aid)."""
+    from scripts.omr_synthetic import random_answers, render_sheet
+
+    engine = OMREngine()
+    layout = engine.load_layout("v1.1-a4-calibrated")
+    rng = np.random.default_rng(3)
+    sheets = []
+    for aid in (1, 2, 3):
+        answers, _ = random_answers(layout, rng, 0.05, 0.0)
+        sheets.append((render_sheet(layout, answers, 8, qr_payload={"aid": aid, "gid": 1}, rng=rng), answers))
+
+    def rotate(page, deg):
+        h, w = page.shape
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), deg, 1)
+        return cv2.warpAffine(page, M, (w, h), borderValue=255)
+
+    # Página 0: duas folhas lado a lado (a da direita um pouco torta); página 1: uma folha
+    gap = np.full((sheets[0][0].shape[0], 80), 255, np.uint8)
+    duo = np.hstack([sheets[0][0], gap, rotate(sheets[1][0], 2)])
+    duo = cv2.copyMakeBorder(duo, 60, 60, 60, 60, cv2.BORDER_CONSTANT, value=235)
+    _, tif = cv2.imencodemulti(".tiff", [duo, rotate(sheets[2][0], -1.5)])
+    return engine, tif.tobytes(), duo, {aid: answers for aid, (_, answers) in enumerate(sheets, 1)}
+
+
+class TestScannerSplit:
+    def test_tiff_pages_split_into_readable_sheets(self, scanner_file):
+        engine, tif, _, truth = scanner_file
+        pages = []
+        page = 0
+        while (sheets := engine.split_scan(tif, page)) is not None:
+            pages.append(sheets)
+            page += 1
+        assert [len(sheets) for sheets in pages] == [2, 1]
+
+        read = []
+        for sheet in (s for sheets in pages for s in sheets):
+            result = engine.process_image(sheet, return_images=False, return_audit=False)
+            assert result["success"] is True
+            read.append(result["qr_data"]["aid"])
+            assert result["answers"] == truth[result["qr_data"]["aid"]]
+        # Ordem de leitura: esquerda para direita, página a página
+        assert read == [1, 2, 3]
+
+    def test_single_sheet_image_passes_through(self, scanner_file):
+        engine, _, duo, _ = scanner_file
+        jpg = cv2.imencode(".jpg", duo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        assert len(engine.split_scan(jpg)) == 2
+        assert engine.split_scan(jpg, page=1) is None
+
+        single = cv2.imencode(".jpg", duo[:, :duo.shape[1] // 2])[1].tobytes()
+        assert engine.split_scan(single) == [single]
+        assert engine.split_scan(b"invalido") == [b"invalido"]
+
+
+# ============ TELEMETRIA (StageTimer / omr_metrics) ============
+
+class TestTelemetry:
+    def test_stage_timer_excludes_nested_work(self):
+        timer = StageTimer()
+        time.sleep(0.01)
+        with timer.measure("clahe"):
+            time.sleep(0.02)
+        timer.lap("anchors")
+        timings = timer.report()
+        assert timings["clahe"] >= 20
+        assert 10 <= timings["anchors"] < 20
+        assert sum(timings.values()) == pytest.approx(timer.total_ms, abs=1.0)
+
+    def test_preprocess_cache_reports_stages(self):
+        timer = StageTimer()
+        prep = PreprocessCache(np.full((200, 150, 3), 200, np.uint8), scope="teste", timer=timer)
+        prep.adaptive
+        prep.otsu
+        assert {"gray", "clahe", "threshold"} == set(timer.report())
+
+    def test_histogram_percentiles(self):
+        hist = Histogram((10, 100, 1000))
+        for value in [5] * 90 + [50] * 9 + [5000]:
+            hist.observe(value)
+        snap = hist.snapshot()
+        assert snap["count"] == 100 and snap["max_ms"] == 5000
+        assert (snap["p50_ms"], snap["p90_ms"], snap["p99_ms"]) == (10, 10, 100)
+        assert snap["buckets"] == {"le_10": 90, "le_100": 9, "le_1000": 0, "le_inf": 1}
+
+    def test_metrics_counters(self):
+        metrics = OMRMetrics()
+        metrics.observe("lote", {"success": False, "quality": "reject", "telemetry": {
+            "total_ms": 40.0, "timings_ms": {"decode": 10.0, "anchors": 30.0},
+            "anchor_strategy": None, "reject_reason": "anchors_not_found"}}, wall_ms=45.0)
+        metrics.observe("lote", {"success": True, "quality": "review", "review_reasons": ["invalid_marks"],
+                                 "telemetry": {"total_ms": 90.0, "timings_ms": {"anchors": 20.0},
+                                               "anchor_strategy": "otsu", "reject_reason": None}}, wall_ms=100.0)
+        metrics.reject("lote", "server_busy")
+        snap = metrics.snapshot()
+        assert snap["counters"]["requests"] == {"lote": 3}
+        assert snap["counters"]["rejects"] == {"anchors_not_found": 1, "server_busy": 1}
+        assert snap["counters"]["anchor_strategy"] == {"none": 1, "otsu": 1}
+        assert snap["counters"]["review_reasons"] == {"invalid_marks": 1}
+        assert snap["stages_ms"]["anchors"]["count"] == 2
+        assert snap["queue_ms"]["count"] == 2
+        metrics.reset()
+        assert metrics.snapshot()["counters"]["requests"] == {}
+
+
+# ============ PRÉ-TRIAGEM DE QUALIDADE ============
+
+class TestImagePrecheck:
+    def test_good_sheet_passes(self, phone_sheet):
+        quality = OMREngine().assess_image_quality(phone_sheet)
+        assert quality["reason"] is None
+        # Escurecida pela metade ainda é legível: a nitidez é normalizada pelo brilho do papel
+        assert OMREngine().assess_image_quality((phone_sheet * 0.5).astype(np.uint8))["reason"] is None
+
+    def test_hopeless_photos_rejected(self, phone_sheet):
+        engine = OMREngine()
+        h, w = phone_sheet.shape
+        far = np.full_like(phone_sheet, 90)
+        small = cv2.resize(phone_sheet, (w // 3, h // 3), interpolation=cv2.INTER_AREA)
+        far[h // 3:h // 3 + small.shape[0], w // 3:w // 3 + small.shape[1]] = small
+        cases = {
+            "too_dark": (phone_sheet * 0.12).astype(np.uint8),
+            "overexposed": np.clip(phone_sheet.astype(np.float32) * 4, 0, 255).astype(np.uint8),
+            "sheet_not_found": far,
+            "too_blurry": cv2.GaussianBlur(phone_sheet, (0, 0), 20),
+        }
+        for reason, image in cases.items():
+            assert engine.assess_image_quality(image)["reason"] == reason
+
+    def test_reject_skips_pipeline(self, phone_sheet):
+        dark = cv2.imencode(".jpg", (phone_sheet * 0.12).astype(np.uint8))[1].tobytes()
+        result = OMREngine().process_image(dark, return_images=False, return_audit=False)
+        assert result["success"] is False and result["quality"] == "reject"
+        assert "escura" in result["error"]
+        telemetry = result["telemetry"]
+        assert telemetry["reject_reason"] == "too_dark"
+        assert set(telemetry["timings_ms"]) <= {"decode", "gray", "precheck"}
+
+    def test_metrics_estimate_savings(self):
+        metrics = OMRMetrics()
+        metrics.observe("lote", {"success": False, "telemetry": {
+            "total_ms": 600.0, "timings_ms": {"precheck": 4.0, "anchors": 596.0},
+            "reject_reason": "anchors_not_found", "image_quality": {"reason": None}}}, wall_ms=610.0)
+        for _ in range(3):
+            metrics.observe("lote", {"success": False, "telemetry": {
+                "total_ms": 30.0, "timings_ms": {"decode": 26.0, "precheck": 4.0},
+                "reject_reason": "too_blurry", "image_quality": {"reason": "too_blurry"}}}, wall_ms=32.0)
+        precheck = metrics.snapshot()["precheck"]
+        assert (precheck["checked"], precheck["rejected"]) == (4, 3)
+        assert precheck["mean_cost_ms"] == 4.0
+        assert precheck["saved_ms_estimate"] == 1800.0
+
+
+# ============ IDEMPOTÊNCIA (reenvios de /provas/processar) ============
+
+class TestIdempotencyCache:
+    def test_concurrent_duplicates_run_once(self):
+        cache = IdempotencyCache(ttl_s=60, max_entries=10)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"nota": 7.5}
+
+        async def main():
+            return await asyncio.gather(*(cache.run([("u", "fp")], "fp", compute) for _ in range(3)))
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert [r[0] for r in results] == [{"nota": 7.5}] * 3
+        assert sorted(r[1] for r in results) == [False, True, True]
+        assert asyncio.run(cache.run([("u", "fp")], "fp", compute)) == ({"nota": 7.5}, True)
+        assert cache.stats == {"hits": 1, "misses": 1, "waits": 2, "conflicts": 0}
+
+    def test_conflict_and_uncacheable_errors(self):
+        from fastapi import HTTPException
+        cache = IdempotencyCache(ttl_s=60, max_entries=10)
+
+        async def ok():
+            return "ok"
+
+        async def busy():
+            raise HTTPException(status_code=503, detail="ocupado")
+
+        asyncio.run(cache.run([("u", "chave")], "a", ok))
+        with pytest.raises(IdempotencyConflict):
+            asyncio.run(cache.run([("u", "chave")], "b", ok))
+
+        # 503 não fica guardado: o próximo envio roda de novo
+        with pytest.raises(HTTPException):
+            asyncio.run(cache.run([("u", "x")], "x", busy))
+        assert asyncio.run(cache.run([("u", "x")], "x", ok)) == ("ok", False)
+
+        # Só a rejeição da leitura fica guardada; outros 422 (que dependem do banco) não
+        async def sem_acesso():
+            raise HTTPException(status_code=422, detail="acesso negado")
+
+        async def ilegivel():
+            raise ReadRejected("ilegível")
+
+        with pytest.raises(HTTPException):
+            asyncio.run(cache.run([("u", "y")], "y", sem_acesso))
+        assert asyncio.run(cache.run([("u", "y")], "y", ok)) == ("ok", False)
+        with pytest.raises(HTTPException):
+            asyncio.run(cache.run([("u", "z")], "z", ilegivel))
+        with pytest.raises(HTTPException) as replay:
+            asyncio.run(cache.run([("u", "z")], "z", ok))
+        assert replay.value.headers == {REPLAY_HEADER: "true"}
+
+    def test_ttl_and_eviction(self):
+        async def compute():
+            return 1
+
+        cache = IdempotencyCache(ttl_s=60, max_entries=2)
+        for key in ("a", "b", "c"):
+            asyncio.run(cache.run([key], key, compute))
+        assert len(cache) == 2
+        assert asyncio.run(cache.run(["a"], "a", compute)) == (1, False)
+
+        cache = IdempotencyCache(ttl_s=0.01, max_entries=10)
+        asyncio.run(cache.run(["a"], "a", compute))
+        time.sleep(0.02)
+        assert asyncio.run(cache.run(["a"], "a", compute)) == (1, False)
+
+
+# ============ MEMÓRIA POR REQUISIÇÃO ============
+
+# Mede o pico de RSS (VmHWM) de um process_image num processo novo, sem o resto da suíte
+_RSS_PROBE = """
+import sys
+sys.path.insert(0, sys.argv[1])
+
+def hwm_mb():
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) / 1024 for l in f if l.startswith("VmHWM:"))
+
+import omr_engine
+omr_engine.audit_sink.enabled = False
+engine = omr_engine.OMREngine()
+image = open(sys.argv[2], "rb").read()
+images = sys.argv[3] == "1"
+base = hwm_mb()
+result = engine.process_image(image, return_images=images, return_audit=images, inline_images=True)
+print(result["success"], hwm_mb() - base)
+"""
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="VmHWM só existe no Linux")
+class TestMemoryBudget:
+    # Bytes por pixel da foto que uma leitura pode somar ao pico de RSS
+    BUDGET_GRAY = 3.5   # cinza decodificado + buffers de pré-processamento
+    BUDGET_COLOR = 7.0  # + foto BGR e retificada colorida
+
+    def _peak_mb(self, photo: bytes, tmp_path, images: bool):
+        path = tmp_path / "folha.jpg"
+        path.write_bytes(photo)
+        backend = os.path.join(os.path.dirname(__file__), "..")
+        out = subprocess.run(
+            [sys.executable, "-c", _RSS_PROBE, backend, str(path), "1" if images else "0"],
+            capture_output=True, text=True, timeout=120, check=True,
+        ).stdout.split()
+        assert out[0] == "True"
+        return float(out[1])
+
+    def test_gray_mode_peak_rss(self, phone_photo, tmp_path):
+        megapixels = 3000 * 4000 / 1e6
+        assert self._peak_mb(phone_photo((3000, 4000)), tmp_path, images=False) < self.BUDGET_GRAY * megapixels
+
+    def test_color_mode_peak_rss(self, phone_photo, tmp_path):
+        megapixels = 3000 * 4000 / 1e6
+        assert self._peak_mb(phone_photo((3000, 4000)), tmp_path, images=True) < self.BUDGET_COLOR * megapixels
+
+
+# ============ ADMISSÃO POR ORÇAMENTO DE PIXELS ============
+
+class TestPixelBudget:
+    def test_image_size_from_headers(self):
+        import base64
+        img = np.zeros((30, 40), np.uint8)
+        jpeg = cv2.imencode(".jpg", img)[1].tobytes()
+        png = cv2.imencode(".png", img)[1].tobytes()
+        assert image_size(jpeg) == (40, 30)
+        assert image_size(png) == (40, 30)
+        assert image_megapixels("data:image/jpeg;base64," + base64.b64encode(jpeg).decode()) == 40 * 30 / 1e6
+        assert image_size(b"nao-e-imagem") is None
+        assert image_megapixels(b"x" * 1000) > 0
+
+    def test_scan_page_megapixels_from_tiff_ifds(self):
+        _, tif = cv2.imencodemulti(".tiff", [np.zeros((400, 300), np.uint8), np.zeros((1000, 2000), np.uint8)])
+        tif = tif.tobytes()
+        assert [scan_page_megapixels(tif, page) for page in range(3)] == [0.12, 2.0, None]
+        png = cv2.imencode(".png", np.zeros((100, 50), np.uint8))[1].tobytes()
+        assert (scan_page_megapixels(png, 0), scan_page_megapixels(png, 1)) == (0.005, None)
+        # Cabeçalho TIFF quebrado: só a página 0, estimada pelo tamanho do arquivo
+        assert scan_page_megapixels(b"II*\x00quebrado", 0) > 0
+        assert scan_page_megapixels(b"II*\x00quebrado", 1) is None
+
+    def test_waits_for_budget_then_rejects(self):
+        budget = PixelBudget(capacity_mp=10, max_queue=1, max_wait_s=1, retry_after_s=3)
+        order = []
+
+        async def read(name, mp, hold):
+            async with budget.acquire(mp):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        async def main():
+            first = asyncio.create_task(read("a", 6, 0.05))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(read("b", 6, 0))
+            await asyncio.sleep(0)
+            assert budget.snapshot()["waiting"] == 1
+            with pytest.raises(AdmissionRejected):
+                await read("c", 1, 0)  # fila cheia: 503 na hora
+            await asyncio.gather(first, second)
+
+        asyncio.run(main())
+        assert order == ["a", "b"]
+        snap = budget.snapshot()
+        assert snap["in_flight"] == 0 and snap["in_flight_mp"] == 0
+        assert snap["admitted"] == 2 and snap["rejected_queue_full"] == 1
+        assert snap["wait_ms"]["count"] == 2
+
+    def test_wait_timeout_and_oversized_photo(self):
+        budget = PixelBudget(capacity_mp=10, max_queue=4, max_wait_s=0.05)
+
+        async def main():
+            async with budget.acquire(50):  # maior que o orçamento: passa sozinha
+                assert budget.in_flight_mp == 10
+                with pytest.raises(AdmissionRejected):
+                    async with budget.acquire(1):
+                        pass
+            async with budget.acquire(1):
+                pass
+
+        asyncio.run(main())
+        assert budget.stats["rejected_timeout"] == 1
+        assert budget.snapshot()["waiting"] == 0
@@ -1,6 +1,6 @@
 import React, { useRef, useState, useEffect, useCallback } from 'react';
 import { X, RefreshCw, CheckCircle, AlertCircle, Info, Camera, ZoomIn, Zap, ZapOff } from 'lucide-react';
-import { api } from '../../../services/api';
+import { api, artifactUrl } from '../../../services/api';
 import './ScannerModal.css';
 
 // ─── Tipos ───────────────────────────────────────────────────────────────────
@@ -30,6 +30,7 @@ export const ScannerModal: React.FC<ScannerModalProps> = ({
     const pollingRef     = useRef<number | null>(null);
     const isMountedRef   = useRef(true);
     const trackScoreRef  = useRef(0);
+    const captureKeyRef  = useRef<string | undefined>(undefined);
 
     // Estado da fase
     const [phase, setPhase]             = useState<Phase>('camera');
@@ -202,6 +203,7 @@ export const ScannerModal: React.FC<ScannerModalProps> = ({
         const ts = new Date().toISOString().replace(/[:.]/g, '-').slice(0, 19);
         api.salvarFotoScanner({ image: img, timestamp: ts }).catch(() => {});
 
+        captureKeyRef.current = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
         setCapturedImage(img);
         setPhase('preview');
     }, [captureFrame, stopCamera, flashMode, applyTorch]);
@@ -217,7 +219,8 @@ export const ScannerModal: React.FC<ScannerModalProps> = ({
                 image: capturedImage,
                 num_questions: numQuestions,
                 gabarito_id: gabaritoId,
-            });
+                images: true, // Tela de revisão mostra a retificada, a original e o mapa de auditoria
+            }, captureKeyRef.current);
 
             if (resp && resp.success !== false) {
                 setResult(resp);
@@ -255,6 +258,9 @@ export const ScannerModal: React.FC<ScannerModalProps> = ({
             return;
         }
 
+        // Uma sessão por ciclo de câmera: o backend rastreia as âncoras entre frames
+        const sessionId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
         const pollRadar = async () => {
             const video  = videoRef.current;
             const canvas = pollCanRef.current;
@@ -272,7 +278,7 @@ export const ScannerModal: React.FC<ScannerModalProps> = ({
             const imgData = canvas.toDataURL('image/jpeg', 0.6);
 
             try {
-                const radar = await api.scanAnchors({ image: imgData });
+                const radar = await api.scanAnchors({ image: imgData, session_id: sessionId });
 
                 if (radar?.success && radar?.anchors_found === 4 && Array.isArray(radar.anchors)) {
                     setAnchors(radar.anchors as Anchor[]);
@@ -508,16 +514,16 @@ export const ScannerModal: React.FC<ScannerModalProps> = ({
                         )}
 
                         {/* Galeria de imagens com abas */}
-                        {(result.audit_map || result.processed_image || result.original_image || capturedImage) && (
+                        {(result.audit_map_url || result.processed_image_url || result.audit_map || result.processed_image || result.original_image || capturedImage) && (
                             <div className="sm-gallery">
                                 <div className="sm-tabs">
-                                    {result.audit_map && (
+                                    {(result.audit_map_url || result.audit_map) && (
                                         <button
                                             className={`sm-tab ${activeTab === 'audit' ? 'active' : ''}`}
                                             onClick={() => setActiveTab('audit')}
                                         >Auditoria</button>
                                     )}
-                                    {result.processed_image && (
+                                    {(result.processed_image_url || result.processed_image) && (
                                         <button
                                             className={`sm-tab ${activeTab === 'processed' ? 'active' : ''}`}
                                             onClick={() => setActiveTab('processed')}
@@ -531,9 +537,9 @@ export const ScannerModal: React.FC<ScannerModalProps> = ({
                                 <div className="sm-gallery-img-wrap">
                                     <img
                                         src={
-                                            activeTab === 'audit'     ? result.audit_map :
-                                            activeTab === 'processed' ? result.processed_image :
-                                                                        (result.original_image || capturedImage!)
+                                            activeTab === 'audit'     ? (artifactUrl(result.audit_map_url) || result.audit_map) :
+                                            activeTab === 'processed' ? (artifactUrl(result.processed_image_url) || result.processed_image) :
+                                                                        (artifactUrl(result.original_image_url) || result.original_image || capturedImage!)
                                         }
                                         alt={
                                             activeTab === 'audit'     ? 'Mapa de auditoria com respostas marcadas' :
@@ -1,5 +1,8 @@
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
+// URLs relativas devolvidas pela API (ex: /omr/artifacts/...) prontas para <img src>
+export const artifactUrl = (path?: string | null) => (path ? `${API_URL}${path}` : undefined);
+
 const getAuthHeaders = () => {
     const token = localStorage.getItem('token');
     return {
@@ -8,6 +11,16 @@ const getAuthHeaders = () => {
     };
 };
 
+// Servidor sem orçamento para mais leituras OMR (503): o header Retry-After diz quando tentar de novo
+export class ServerBusyError extends Error {
+    retryAfterS: number;
+
+    constructor(message: string, retryAfterS: number) {
+        super(message);
+        this.retryAfterS = retryAfterS;
+    }
+}
+
 const request = async (url: string, options: RequestInit = {}) => {
     const response = await fetch(url, options);
 
@@ -31,12 +44,27 @@ const request = async (url: string, options: RequestInit = {}) => {
 
     if (!response.ok) {
         const errorMsg = data.detail || data.error || 'Erro na requisição';
+        if (response.status === 503) {
+            throw new ServerBusyError(errorMsg, Number(response.headers.get('Retry-After')) || 5);
+        }
         throw new Error(errorMsg);
     }
 
     return data;
 };
 
+// Tenta de novo quando o servidor responde 503, esperando o Retry-After (máx. `attempts` tentativas)
+const withBackoff = async <T>(send: () => Promise<T>, attempts = 3): Promise<T> => {
+    for (let i = 1; ; i++) {
+        try {
+            return await send();
+        } catch (err) {
+            if (!(err instanceof ServerBusyError) || i >= attempts) throw err;
+            await new Promise(resolve => setTimeout(resolve, err.retryAfterS * 1000));
+        }
+    }
+};
+
 export const api = {
     // Método genérico para requisições customizadas
     async request(endpoint: string, options: RequestInit = {}) {
@@ -349,15 +377,18 @@ export const api = {
     },
 
     // OMR Engine
-    async processarProva(data: { image: string, num_questions?: number, gabarito_id?: number, aluno_id?: number }) {
-        return request(`${API_URL}/provas/processar`, {
+    // idempotencyKey: uma por foto capturada; reenvios da mesma foto devolvem o resultado já gravado
+    // Com a chave, o reenvio após um 503 é seguro: a mesma foto nunca é corrigida duas vezes
+    async processarProva(data: { image: string, num_questions?: number, gabarito_id?: number, aluno_id?: number, images?: boolean }, idempotencyKey?: string) {
+        const send = () => request(`${API_URL}/provas/processar`, {
             method: 'POST',
-            headers: getAuthHeaders(),
+            headers: idempotencyKey ? { ...getAuthHeaders(), 'Idempotency-Key': idempotencyKey } : getAuthHeaders(),
             body: JSON.stringify(data),
         });
+        return idempotencyKey ? withBackoff(send) : send();
     },
 
-    async scanAnchors(data: { image: string }) {
+    async scanAnchors(data: { image: string, session_id?: string }) {
         return request(`${API_URL}/provas/scan-anchors`, {
             method: 'POST',
             headers: getAuthHeaders(),